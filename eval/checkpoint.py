@@ -0,0 +1,40 @@
+import json
+import os
+from typing import Any, Dict, Tuple
+
+class CaseCheckpoint:
+    """Append-only JSONL log of finished eval cases, so an interrupted run can resume.
+    
+    Each line is one (variant, case) result, written and flushed as soon as the
+    case finishes. A truncated last line from a crash is ignored on load.
+    """
+    def __init__(self, path: str):
+        self.path = path
+    
+    def load(self) -> Dict[Tuple[str, int], Dict[str, Any]]:
+        """Finished records keyed by (variant, case index)"""
+        records = {}
+        if not os.path.exists(self.path):
+            return records
+        with open(self.path) as f:
+            content = f.read()
+        for line in content.splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            records[(record["variant"], record["index"])] = record
+        if content and not content.endswith("\n"):
+            # Terminate the partial line so the next record starts on its own
+            with open(self.path, "a") as f:
+                f.write("\n")
+        return records
+    
+    def append(self, record: Dict[str, Any]):
+        with open(self.path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+            f.flush()
+    
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
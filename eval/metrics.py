@@ -1,6 +1,6 @@
-import time
-import statistics
+from collections import Counter
 from typing import List, Dict, Any
+from src.histogram import LatencyHistogram
 
 class AccuracyMetrics:
     def __init__(self):
@@ -46,32 +46,36 @@ class AccuracyMetrics:
 
 class MetricsCalculator:
     def __init__(self):
-        self.latencies = []
+        # Constant memory regardless of run length; merge() combines workers' results
+        self.latencies = LatencyHistogram()
         self.successes = 0
         self.total_requests = 0
-        self.errors = []
+        self.errors: Counter = Counter()
     
     def record_request(self, latency: float, success: bool, error: str = None):
         """Record a request result"""
-        self.latencies.append(latency)
+        self.latencies.record(latency)
         self.total_requests += 1
         if success:
             self.successes += 1
         else:
-            self.errors.append(error or "Unknown error")
+            self.errors[error or "Unknown error"] += 1
+    
+    def merge(self, other: "MetricsCalculator"):
+        """Fold another calculator's results into this one"""
+        self.latencies.merge(other.latencies)
+        self.successes += other.successes
+        self.total_requests += other.total_requests
+        self.errors.update(other.errors)
     
     def get_latency_percentiles(self) -> Dict[str, float]:
-        """Calculate latency percentiles"""
-        if not self.latencies:
-            return {"p50": 0, "p90": 0, "p95": 0}
-        
-        sorted_latencies = sorted(self.latencies)
-        n = len(sorted_latencies)
-        
+        """Calculate interpolated latency percentiles"""
         return {
-            "p50": sorted_latencies[int(n * 0.5)],
-            "p90": sorted_latencies[int(n * 0.9)],
-            "p95": sorted_latencies[int(n * 0.95)]
+            "p50": self.latencies.percentile(0.5),
+            "p90": self.latencies.percentile(0.9),
+            "p95": self.latencies.percentile(0.95),
+            "p99": self.latencies.percentile(0.99),
+            "p999": self.latencies.percentile(0.999)
         }
     
     def get_success_rate(self) -> float:
@@ -89,7 +93,9 @@ class MetricsCalculator:
             "latency_p50": percentiles["p50"],
             "latency_p90": percentiles["p90"],
             "latency_p95": percentiles["p95"],
-            "avg_latency": statistics.mean(self.latencies) if self.latencies else 0,
-            "error_count": len(self.errors),
-            "unique_errors": len(set(self.errors))
+            "latency_p99": percentiles["p99"],
+            "latency_p999": percentiles["p999"],
+            "avg_latency": self.latencies.mean,
+            "error_count": sum(self.errors.values()),
+            "unique_errors": len(self.errors)
         }
\ No newline at end of file
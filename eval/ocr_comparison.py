@@ -0,0 +1,102 @@
+import asyncio
+import json
+import time
+from typing import Dict, Any, List
+from src.ocr import OCRProcessor
+from eval.dataset import TestDataset
+from eval.metrics import MetricsCalculator
+from src.accounting import UsageLedger, track
+
+class OCRModeComparison:
+    """Compare the two-call OCR path (text + diagram) against the fused single-call path"""
+    def __init__(self):
+        self.dataset = TestDataset()
+        # No OCR cache, so every run measures real upstream calls rather than earlier runs' results
+        self.separate_ocr = OCRProcessor(mode="separate", cache=False)
+        self.fused_ocr = OCRProcessor(mode="fused", cache=False)
+        self.separate_metrics = MetricsCalculator()
+        self.fused_metrics = MetricsCalculator()
+        self.separate_usage = UsageLedger()
+        self.fused_usage = UsageLedger()
+    
+    def _image_urls(self) -> List[str]:
+        """Unique question and solution images in the dataset"""
+        urls = []
+        for case in self.dataset.get_test_cases():
+            for url in (case["question_url"], case["solution_url"]):
+                if url not in urls:
+                    urls.append(url)
+        return urls
+    
+    async def run_comparison(self) -> Dict[str, Any]:
+        """Run both OCR modes over every image and report latency and token usage"""
+        print("Comparing OCR modes: separate (2 calls) vs fused (1 call)")
+        print("=" * 50)
+        
+        urls = self._image_urls()
+        for i, url in enumerate(urls):
+            print(f"Processing image {i+1}/{len(urls)}: {url}")
+            
+            # Two-call path, issued concurrently as ErrorDetector does
+            start_time = time.time()
+            with track(self.separate_usage):
+                lines, _ = await asyncio.gather(
+                    self.separate_ocr.extract_text_from_url(url),
+                    self.separate_ocr.has_diagram(url)
+                )
+            self.separate_metrics.record_request(time.time() - start_time, bool(lines), None if lines else "No text extracted")
+            
+            start_time = time.time()
+            with track(self.fused_usage):
+                lines, _ = await self.fused_ocr.analyze_image(url)
+            self.fused_metrics.record_request(time.time() - start_time, bool(lines), None if lines else "No text extracted")
+        
+        summary = {
+            "images": len(urls),
+            "separate": self._mode_summary(self.separate_ocr, self.separate_metrics, self.separate_usage),
+            "fused": self._mode_summary(self.fused_ocr, self.fused_metrics, self.fused_usage),
+            "timestamp": time.time()
+        }
+        self._print_comparison(summary)
+        
+        with open("eval_ocr_comparison.json", 'w') as f:
+            json.dump(summary, f, indent=2)
+        print(f"\nResults exported to:")
+        print(f"  - eval_ocr_comparison.json")
+        
+        return summary
+    
+    def _mode_summary(self, ocr: OCRProcessor, metrics: MetricsCalculator, ledger: UsageLedger) -> Dict[str, Any]:
+        usage = ocr.client.usage
+        return {
+            "performance": metrics.get_summary(),
+            "upstream_calls": usage["calls"],
+            "prompt_tokens": usage["prompt_tokens"],
+            "completion_tokens": usage["completion_tokens"],
+            "total_tokens": usage["prompt_tokens"] + usage["completion_tokens"],
+            "image_tokens": ledger.totals()["image_tokens"],
+            "cost_usd": ledger.totals()["cost_usd"]
+        }
+    
+    def _print_comparison(self, summary: Dict[str, Any]):
+        separate = summary["separate"]
+        fused = summary["fused"]
+        
+        print("\n" + "=" * 70)
+        print("OCR MODE COMPARISON - TOTALS OVER ALL IMAGES")
+        print("=" * 70)
+        print(f"{'Metric':<25} {'Separate':<20} {'Fused':<20} {'Savings':<15}")
+        print("-" * 70)
+        
+        rows = [
+            ("Upstream Calls", separate["upstream_calls"], fused["upstream_calls"]),
+            ("Prompt Tokens", separate["prompt_tokens"], fused["prompt_tokens"]),
+            ("Completion Tokens", separate["completion_tokens"], fused["completion_tokens"]),
+            ("Total Tokens", separate["total_tokens"], fused["total_tokens"]),
+            ("Cost ($)", separate["cost_usd"], fused["cost_usd"]),
+            ("P50 Latency (s)", separate["performance"]["latency_p50"], fused["performance"]["latency_p50"]),
+            ("P95 Latency (s)", separate["performance"]["latency_p95"], fused["performance"]["latency_p95"]),
+        ]
+        for name, before, after in rows:
+            savings = (before - after) / before if before else 0.0
+            print(f"{name:<25} {before:<20.3f} {after:<20.3f} {savings:+.1%}")
@@ -1,23 +1,47 @@
+import argparse
 import asyncio
 import json
 import time
 import csv
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple
 from src.detector import ErrorDetector
 from src.detector_variants import BaselineDetector, ImprovedDetector
 from src.models import DetectErrorRequest, BoundingBox
+from src.ocr import OCRProcessor
+from src.cache import OCRCache
+from src.config import EVAL_CONCURRENCY, EVAL_CHECKPOINT_PATH
 from eval.dataset import TestDataset
 from eval.metrics import MetricsCalculator, AccuracyMetrics
+from eval.ocr_comparison import OCRModeComparison
+from eval.checkpoint import CaseCheckpoint
+from src.accounting import UsageLedger, track
+
+VARIANTS = ("baseline", "improved")
 
 class EvaluationHarness:
-    def __init__(self):
+    def __init__(self, concurrency: int = EVAL_CONCURRENCY, checkpoint_path: str = EVAL_CHECKPOINT_PATH,
+                 share_ocr: bool = True):
         self.baseline_detector = BaselineDetector()
         self.improved_detector = ImprovedDetector()
+        self.share_ocr = share_ocr
+        # Memory-only caches keep results for this run without reusing earlier runs' (or, unshared, each other's)
+        if share_ocr:
+            # Both variants OCR the same images: one processor coalesces their concurrent calls
+            shared_ocr = OCRProcessor(cache=OCRCache(db_path=None))
+            self.baseline_detector.ocr = shared_ocr
+            self.improved_detector.ocr = shared_ocr
+        else:
+            self.baseline_detector.ocr = OCRProcessor(cache=OCRCache(db_path=None))
+            self.improved_detector.ocr = OCRProcessor(cache=OCRCache(db_path=None))
+        self.concurrency = concurrency
+        self.checkpoint = CaseCheckpoint(checkpoint_path)
         self.dataset = TestDataset()
         self.baseline_metrics = MetricsCalculator()
         self.improved_metrics = MetricsCalculator()
         self.baseline_accuracy = AccuracyMetrics()
         self.improved_accuracy = AccuracyMetrics()
+        self.baseline_usage = UsageLedger()
+        self.improved_usage = UsageLedger()
         self.results = []
     
     async def run_evaluation(self):
@@ -29,19 +53,36 @@ class EvaluationHarness:
         print(f"Loaded {len(test_cases)} test cases")
         print(f"Noisy cases: {len(self.dataset.get_noisy_cases())}")
         
-        # Run baseline evaluation
-        print(f"\nRunning BASELINE evaluation...")
-        baseline_results = await self._evaluate_variant("baseline", test_cases, self.baseline_detector, self.baseline_metrics, self.baseline_accuracy)
+        # Results of an interrupted run are replayed instead of re-run
+        results: Dict[str, List[Optional[Dict]]] = {variant: [None] * len(test_cases) for variant in VARIANTS}
+        resumed = 0
+        for (variant, i), record in self.checkpoint.load().items():
+            if not record["result"]["success"]:
+                continue  # Failures are retried rather than replayed
+            if variant in results and i < len(test_cases) and record["case_id"] == test_cases[i]["question_id"]:
+                self._record(results, variant, i, record["result"], record["usage"])
+                resumed += 1
+        if resumed:
+            print(f"Resuming: {resumed} case results loaded from {self.checkpoint.path}")
         
-        # Run improved evaluation
-        print(f"\nRunning IMPROVED evaluation...")
-        improved_results = await self._evaluate_variant("improved", test_cases, self.improved_detector, self.improved_metrics, self.improved_accuracy)
+        # Both variants of a case run together, so a shared OCR call is made once and waited on by both
+        pending = [i for i in range(len(test_cases)) if any(results[variant][i] is None for variant in VARIANTS)]
+        print(f"\nRunning {len(pending)} cases, {self.concurrency} at a time "
+              f"({'shared' if self.share_ocr else 'separate'} OCR)...")
+        semaphore = asyncio.Semaphore(self.concurrency)
         
-        # Store results for export
-        self.results = {
-            "baseline": baseline_results,
-            "improved": improved_results
-        }
+        async def run_case(i: int):
+            async with semaphore:
+                print(f"Processing case {i+1}/{len(test_cases)}: {test_cases[i]['question_id']}")
+                await asyncio.gather(*(
+                    self._evaluate_case(results, variant, i, test_cases[i])
+                    for variant in VARIANTS if results[variant][i] is None
+                ))
+        
+        await asyncio.gather(*(run_case(i) for i in pending))
+        
+        # Store results for export, in dataset order
+        self.results = {variant: [result for result in results[variant] if result is not None] for variant in VARIANTS}
         
         # Print results
         self._print_results()
@@ -51,56 +92,81 @@ class EvaluationHarness:
         
         # Robustness analysis
         self._analyze_robustness()
+        
+        # Everything is exported; the next run starts fresh
+        self.checkpoint.clear()
+    
+    def _variant(self, variant: str) -> Tuple[Any, MetricsCalculator, AccuracyMetrics, UsageLedger]:
+        """Detector, metrics, accuracy and usage ledger of a variant"""
+        if variant == "baseline":
+            return self.baseline_detector, self.baseline_metrics, self.baseline_accuracy, self.baseline_usage
+        return self.improved_detector, self.improved_metrics, self.improved_accuracy, self.improved_usage
     
-    async def _evaluate_variant(self, variant: str, test_cases: list, detector, metrics: MetricsCalculator, accuracy: AccuracyMetrics) -> List[Dict]:
-        """Evaluate a specific variant"""
-        variant_results = []
+    def _record(self, results: Dict[str, List[Optional[Dict]]], variant: str, i: int, result: Dict, usage_entries: List):
+        """Fold one case result into the variant's metrics, whether just run or loaded from the checkpoint"""
+        _, metrics, accuracy, usage = self._variant(variant)
+        metrics.record_request(result["latency"], result["success"], result["error"])
+        if result["success"]:
+            accuracy.record_prediction(result["predicted_has_error"], result["actual_has_error"])
+        for stage_name, model, entry in usage_entries:
+            usage.add(stage_name, model, **entry)
+        results[variant][i] = result
+    
+    async def _evaluate_case(self, results: Dict[str, List[Optional[Dict]]], variant: str, i: int, case: Dict):
+        """Run one variant on one case, then record the result and checkpoint it if it succeeded"""
+        detector, _, _, _ = self._variant(variant)
+        start_time = time.time()
+        success = True
+        error = None
+        response = None
+        case_usage = UsageLedger()
         
-        for i, case in enumerate(test_cases):
-            print(f"Processing {variant} case {i+1}/{len(test_cases)}: {case['question_id']}")
-            
-            start_time = time.time()
-            success = True
-            error = None
-            response = None
+        try:
+            request = DetectErrorRequest(
+                question_url=case["question_url"],
+                solution_url=case["solution_url"],
+                bounding_box=BoundingBox(**case["bounding_box"]),
+                question_id=case.get("question_id", f"test_{i}")
+            )
             
-            try:
-                request = DetectErrorRequest(
-                    question_url=case["question_url"],
-                    solution_url=case["solution_url"],
-                    bounding_box=BoundingBox(**case["bounding_box"]),
-                    question_id=case.get("question_id", f"test_{i}")
-                )
-                
+            with track(case_usage):
                 response = await detector.detect_error(request)
-                
-                # Evaluate accuracy
-                predicted_has_error = "no error" not in response.error.lower()
-                actual_has_error = case["has_error"]
-                accuracy.record_prediction(predicted_has_error, actual_has_error)
-                
-            except Exception as e:
+            if not response.llm_used:
+                # The detector answered with its fallback: the upstream failed, so retry the case on resume
                 success = False
-                error = str(e)
+                error = f"Fallback response: {response.error}"
             
-            latency = time.time() - start_time
-            metrics.record_request(latency, success, error)
-            
-            # Store detailed results
-            result = {
-                "case_id": case["question_id"],
-                "variant": variant,
-                "latency": latency,
-                "success": success,
-                "error": error,
-                "predicted_error": response.error if response else None,
-                "actual_has_error": case["has_error"],
-                "predicted_has_error": "no error" not in response.error.lower() if response else False,
-                "is_noisy": case.get("is_noisy", False)
-            }
-            variant_results.append(result)
-        
-        return variant_results
+        except Exception as e:
+            success = False
+            error = str(e)
+        
+        latency = time.time() - start_time
+        
+        # Store detailed results
+        case_totals = case_usage.totals()
+        analysis_models = [model for (stage_name, model) in case_usage.entries if stage_name == "analysis"]
+        result = {
+            "case_id": case["question_id"],
+            "variant": variant,
+            "latency": latency,
+            "success": success,
+            "error": error,
+            "predicted_error": response.error if response else None,
+            "actual_has_error": case["has_error"],
+            "predicted_has_error": "no error" not in response.error.lower() if response else False,
+            "is_noisy": case.get("is_noisy", False),
+            "prompt_tokens": case_totals["prompt_tokens"],
+            "completion_tokens": case_totals["completion_tokens"],
+            "image_tokens": case_totals["image_tokens"],
+            "cost_usd": case_totals["cost_usd"],
+            "analysis_models": "+".join(analysis_models)
+        }
+        usage_entries = [[stage_name, model, entry] for (stage_name, model), entry in case_usage.entries.items()]
+        self._record(results, variant, i, result, usage_entries)
+        if not success:
+            return  # Not checkpointed, so a resumed run tries the case again
+        self.checkpoint.append({"variant": variant, "index": i, "case_id": case["question_id"],
+                                "result": result, "usage": usage_entries})
     
     def _print_results(self):
         """Print evaluation results"""
@@ -121,6 +187,7 @@ class EvaluationHarness:
         print(f"{'P50 Latency (s)':<25} {baseline_summary['latency_p50']:<20.3f} {improved_summary['latency_p50']:<20.3f} {improved_summary['latency_p50']-baseline_summary['latency_p50']:+.3f}")
         print(f"{'P90 Latency (s)':<25} {baseline_summary['latency_p90']:<20.3f} {improved_summary['latency_p90']:<20.3f} {improved_summary['latency_p90']-baseline_summary['latency_p90']:+.3f}")
         print(f"{'P95 Latency (s)':<25} {baseline_summary['latency_p95']:<20.3f} {improved_summary['latency_p95']:<20.3f} {improved_summary['latency_p95']-baseline_summary['latency_p95']:+.3f}")
+        print(f"{'P99 Latency (s)':<25} {baseline_summary['latency_p99']:<20.3f} {improved_summary['latency_p99']:<20.3f} {improved_summary['latency_p99']-baseline_summary['latency_p99']:+.3f}")
         
         # ML Quality Metrics
         print(f"{'Accuracy':<25} {baseline_acc['accuracy']:<20.3f} {improved_acc['accuracy']:<20.3f} {improved_acc['accuracy']-baseline_acc['accuracy']:+.3f}")
@@ -128,29 +195,58 @@ class EvaluationHarness:
         print(f"{'Recall':<25} {baseline_acc['recall']:<20.3f} {improved_acc['recall']:<20.3f} {improved_acc['recall']-baseline_acc['recall']:+.3f}")
         print(f"{'F1 Score':<25} {baseline_acc['f1_score']:<20.3f} {improved_acc['f1_score']:<20.3f} {improved_acc['f1_score']-baseline_acc['f1_score']:+.3f}")
         
-        # Cost Analysis
-        cost_per_100 = self._estimate_cost(baseline_summary['total_requests'])
-        print(f"\nCost per 100 requests: ${cost_per_100:.2f}")
+        # Cost Analysis (from upstream-reported token usage)
+        baseline_usage = self.baseline_usage.totals()
+        improved_usage = self.improved_usage.totals()
+        baseline_cost = self._per_request(baseline_usage['cost_usd'], baseline_summary) * 100
+        improved_cost = self._per_request(improved_usage['cost_usd'], improved_summary) * 100
+        print(f"{'Tokens / Request':<25} {self._per_request(baseline_usage['total_tokens'], baseline_summary):<20.1f} {self._per_request(improved_usage['total_tokens'], improved_summary):<20.1f}")
+        print(f"{'Cost / 100 Requests ($)':<25} {baseline_cost:<20.4f} {improved_cost:<20.4f} {improved_cost-baseline_cost:+.4f}")
+        if self.share_ocr:
+            print("Note: OCR calls are shared between variants; each is counted (cost and latency) against the variant\n"
+                  "      that started it. Run with --no-share-ocr for exact per-variant OCR cost.")
+        
+        self._print_cascade("improved", self.improved_detector)
+        
+        print(f"\nUsage by stage (improved):")
+        for stage_name, stage_usage in self.improved_usage.to_dict()["by_stage"].items():
+            print(f"  {stage_name:<23} {stage_usage['prompt_tokens']:>8} prompt ({stage_usage['image_tokens']} image) {stage_usage['completion_tokens']:>6} completion  ${stage_usage['cost_usd']:.4f}")
         print(f"Total test cases: {baseline_summary['total_requests']}")
         print(f"Noisy cases: {len(self.dataset.get_noisy_cases())}")
     
-    def _estimate_cost(self, request_count: int) -> float:
-        """Rough cost estimation"""
-        # GPT-4o: ~$0.005 per image, GPT-4: ~$0.03 per 1K tokens
-        cost_per_request = 0.01 + 0.02  # Vision + text analysis
-        return (cost_per_request * 100)
+    @staticmethod
+    def _print_cascade(variant: str, detector):
+        """Escalation rate and per-tier analysis latency for a variant that uses a model cascade"""
+        cascade = getattr(detector, "cascade", None)
+        if cascade is None:
+            return
+        stats = cascade.get_stats()
+        print(f"\nAnalysis cascade ({variant}): {' -> '.join(cascade.models)}")
+        print(f"  {'Escalation rate':<23} {stats['escalation_rate']:.3f} "
+              f"(invalid {stats['invalid']}, low confidence {stats['low_confidence']}, failed {stats['failed']})")
+        for model, tier in stats["tiers"].items():
+            print(f"  {model:<23} {tier['calls']:>4} calls  P50 {tier['latency_p50']:.3f}s  P95 {tier['latency_p95']:.3f}s")
+    
+    @staticmethod
+    def _per_request(value: float, summary: Dict[str, Any]) -> float:
+        """Average of a usage total over the variant's requests"""
+        return value / summary['total_requests'] if summary['total_requests'] else 0.0
     
     def _export_results(self):
         """Export results to JSON and CSV"""
         summary_results = {
             "baseline": {
                 "performance": self.baseline_metrics.get_summary(),
-                "accuracy": self.baseline_accuracy.get_summary()
+                "accuracy": self.baseline_accuracy.get_summary(),
+                "usage": self.baseline_usage.to_dict()
             },
             "improved": {
                 "performance": self.improved_metrics.get_summary(),
-                "accuracy": self.improved_accuracy.get_summary()
+                "accuracy": self.improved_accuracy.get_summary(),
+                "usage": self.improved_usage.to_dict(),
+                "cascade": self.improved_detector.cascade.get_stats()
             },
+            "shared_ocr": self.share_ocr,
             "timestamp": time.time(),
             "test_cases_count": len(self.dataset.get_test_cases()),
             "noisy_cases_count": len(self.dataset.get_noisy_cases())
@@ -193,7 +289,27 @@ class EvaluationHarness:
             print("No noisy cases found for robustness analysis")
 
 async def main():
-    harness = EvaluationHarness()
+    parser = argparse.ArgumentParser(description="Error detection evaluation harness")
+    parser.add_argument("--compare-ocr-modes", action="store_true",
+                        help="Compare separate vs fused OCR calls instead of running the detector eval")
+    parser.add_argument("--concurrency", type=int, default=EVAL_CONCURRENCY,
+                        help="Test cases evaluated at the same time (both variants of a case run together)")
+    parser.add_argument("--checkpoint", default=EVAL_CHECKPOINT_PATH,
+                        help="Per-case results log; an interrupted run resumes from it")
+    parser.add_argument("--restart", action="store_true",
+                        help="Discard the checkpoint of an interrupted run and start over")
+    parser.add_argument("--no-share-ocr", action="store_true",
+                        help="Give each variant its own OCR calls, so per-variant OCR cost is exact")
+    args = parser.parse_args()
+    
+    if args.compare_ocr_modes:
+        await OCRModeComparison().run_comparison()
+        return
+    
+    harness = EvaluationHarness(concurrency=args.concurrency, checkpoint_path=args.checkpoint,
+                                share_ocr=not args.no_share_ocr)
+    if args.restart:
+        harness.checkpoint.clear()
     await harness.run_evaluation()
 
 if __name__ == "__main__":
@@ -0,0 +1,156 @@
+import math
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional, Tuple
+from src.telemetry import telemetry
+
+# USD per 1M (prompt, completion) tokens; models missing here are counted but not priced
+MODEL_PRICES = {
+    "gpt-4": (30.00, 60.00),
+    "gpt-4.1-mini": (0.40, 1.60),
+}
+
+# Models that bill images per 32px patch (with a token multiplier) rather than per 512px tile
+PATCH_MODELS = {
+    "gpt-4.1-mini": 1.62,
+}
+
+FIELDS = ("calls", "prompt_tokens", "completion_tokens", "image_tokens", "cost_usd")
+
+# Per-user totals kept in memory; the least recently active users are dropped beyond this
+MAX_TRACKED_USERS = 10000
+
+_ledgers: ContextVar[Tuple["UsageLedger", ...]] = ContextVar("usage_ledgers", default=())
+_stage: ContextVar[str] = ContextVar("usage_stage", default="unattributed")
+
+def estimate_image_tokens(model: str, width: int, height: int) -> int:
+    """Prompt tokens an image of this size costs, following OpenAI's published sizing rules"""
+    if width <= 0 or height <= 0:
+        return 0
+    if model in PATCH_MODELS:
+        patches = math.ceil(width / 32) * math.ceil(height / 32)
+        if patches > 1536:
+            # Shrink to the patch budget, then until one side is a whole number of patches
+            scale = math.sqrt(32 * 32 * 1536 / (width * height))
+            cols, rows = width * scale / 32, height * scale / 32
+            scale *= min(math.floor(cols) / cols, math.floor(rows) / rows)
+            cols, rows = round(width * scale / 32, 6), round(height * scale / 32, 6)
+            patches = min(math.ceil(cols) * math.ceil(rows), 1536)
+        return math.ceil(patches * PATCH_MODELS[model])
+    
+    # High-detail tiling: fit in 2048x2048, shortest side down to 768, then 170 tokens per 512px tile
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    return 85 + 170 * math.ceil(width / 512) * math.ceil(height / 512)
+
+def cost_usd(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    prompt_price, completion_price = MODEL_PRICES.get(model, (0.0, 0.0))
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+
+class UsageLedger:
+    """Token and cost totals broken down by pipeline stage and model"""
+    def __init__(self):
+        self.entries: Dict[Tuple[str, str], Dict[str, float]] = {}
+    
+    def add(self, stage: str, model: str, **amounts: float):
+        entry = self.entries.setdefault((stage, model), dict.fromkeys(FIELDS, 0))
+        for field, amount in amounts.items():
+            entry[field] += amount
+    
+    def merge(self, other: "UsageLedger"):
+        for (stage, model), entry in other.entries.items():
+            self.add(stage, model, **entry)
+    
+    def totals(self) -> Dict[str, float]:
+        totals = dict.fromkeys(FIELDS, 0)
+        for entry in self.entries.values():
+            for field in FIELDS:
+                totals[field] += entry[field]
+        totals["total_tokens"] = totals["prompt_tokens"] + totals["completion_tokens"]
+        return totals
+    
+    def to_dict(self) -> Dict[str, Any]:
+        by_stage: Dict[str, Dict[str, float]] = {}
+        by_model: Dict[str, Dict[str, float]] = {}
+        for (stage, model), entry in self.entries.items():
+            for breakdown, key in ((by_stage, stage), (by_model, model)):
+                target = breakdown.setdefault(key, dict.fromkeys(FIELDS, 0))
+                for field in FIELDS:
+                    target[field] += entry[field]
+        return {"total": self.totals(), "by_stage": by_stage, "by_model": by_model}
+
+class UserUsage:
+    """Usage totals per user_id, bounded to the most recently active users"""
+    def __init__(self, max_users: int = MAX_TRACKED_USERS):
+        self.max_users = max_users
+        self.users: "OrderedDict[str, UsageLedger]" = OrderedDict()
+    
+    def add(self, user_id: str, ledger: UsageLedger):
+        if user_id not in self.users:
+            self.users[user_id] = UsageLedger()
+        self.users.move_to_end(user_id)
+        self.users[user_id].merge(ledger)
+        while len(self.users) > self.max_users:
+            self.users.popitem(last=False)
+    
+    def to_dict(self) -> Dict[str, Dict[str, float]]:
+        return {user_id: ledger.totals() for user_id, ledger in self.users.items()}
+
+# Process-wide totals since startup
+totals = UsageLedger()
+
+@contextmanager
+def track(*ledgers: UsageLedger) -> Iterator[None]:
+    """Also record usage from this context (and tasks it spawns) into ``ledgers``"""
+    token = _ledgers.set(_ledgers.get() + ledgers)
+    try:
+        yield
+    finally:
+        _ledgers.reset(token)
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Attribute upstream usage in this context to a pipeline stage"""
+    token = _stage.set(name)
+    try:
+        yield
+    finally:
+        _stage.reset(token)
+
+def attributed(name: str, func: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+    """Wrap an async function so its upstream usage is attributed to stage ``name``"""
+    async def wrapper(*args, **kwargs):
+        with stage(name):
+            return await func(*args, **kwargs)
+    return wrapper
+
+def _record(model: str, **amounts: float):
+    current_stage = _stage.get()
+    for ledger in (totals,) + _ledgers.get():
+        ledger.add(current_stage, model, **amounts)
+    for field, amount in amounts.items():
+        if field == "calls":
+            telemetry.inc("upstream_calls_total", amount, stage=current_stage, model=model)
+        elif field == "cost_usd":
+            telemetry.inc("upstream_cost_usd_total", amount, stage=current_stage, model=model)
+        else:
+            telemetry.inc("upstream_tokens_total", amount, stage=current_stage, model=model, type=field[:-len("_tokens")])
+
+def record_call(model: str, usage: Optional[Any] = None):
+    """Record one upstream call and the token usage it reported"""
+    prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+    completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+    _record(
+        model,
+        calls=1,
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        cost_usd=cost_usd(model, prompt_tokens, completion_tokens)
+    )
+
+def record_image(model: str, width: int, height: int):
+    """Record the estimated share of prompt tokens spent on an image of known size"""
+    _record(model, image_tokens=estimate_image_tokens(model, width, height))
@@ -0,0 +1,144 @@
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, Optional
+from src.config import (
+    parse_key_values, MAX_CONCURRENT_REQUESTS, ADMISSION_MIN_LIMIT, ADMISSION_MAX_LIMIT, ADMISSION_TARGET_LATENCY,
+    ADMISSION_MAX_QUEUE, ADMISSION_TENANT_WEIGHTS
+)
+
+class AdmissionRejected(Exception):
+    pass
+
+class SlotOutcome:
+    """How an admitted request went, as its caller reports it.
+    
+    ``success`` starts True and becomes False if the slot's body raises; a
+    caller sets it from the result (e.g. a fallback answer is a failure) or to
+    None when the outcome says nothing about upstream health, such as a client
+    disconnecting, so the limit is left alone.
+    """
+    def __init__(self):
+        self.success: Optional[bool] = True
+
+class AdmissionController:
+    """Adaptive concurrency limit shared fairly between tenants.
+    
+    The limit follows AIMD: every request that finishes within
+    ``target_latency`` adds roughly one slot per limit's worth of completions,
+    while a slow or failed request (see SlotOutcome) cuts it by ``decrease_factor``
+    (at most once per ``target_latency``, so one burst of slow requests counts once).
+    
+    Requests over the limit wait in per-tenant queues that are drained by
+    start-time weighted fair queueing, so a tenant with weight 2 gets twice the
+    slots of a tenant with weight 1 while both are backlogged, and a single
+    noisy tenant cannot starve the others.
+    """
+    def __init__(self, initial_limit: int = MAX_CONCURRENT_REQUESTS, min_limit: int = ADMISSION_MIN_LIMIT,
+                 max_limit: int = ADMISSION_MAX_LIMIT, target_latency: float = ADMISSION_TARGET_LATENCY,
+                 max_queue: int = ADMISSION_MAX_QUEUE, weights: Optional[Dict[str, float]] = None,
+                 decrease_factor: float = 0.7):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(min(max(initial_limit, min_limit), max_limit))
+        self.target_latency = target_latency
+        self.max_queue = max_queue
+        self.weights = weights if weights is not None else parse_key_values(ADMISSION_TENANT_WEIGHTS)
+        self.decrease_factor = decrease_factor
+        self.in_flight = 0
+        self.queues: Dict[str, Deque[asyncio.Future]] = {}
+        self.finish_tags: Dict[str, float] = {}
+        self.virtual_time = 0.0
+        self.last_decrease = 0.0
+        self.stats = {"admitted": 0, "queued": 0, "rejected": 0, "increases": 0, "decreases": 0}
+    
+    @asynccontextmanager
+    async def slot(self, tenant: str) -> AsyncIterator[SlotOutcome]:
+        """Hold one concurrency slot for ``tenant``; latency and the reported outcome feed the limit"""
+        await self.acquire(tenant)
+        start = time.monotonic()
+        outcome = SlotOutcome()
+        try:
+            yield outcome
+        except BaseException:
+            if outcome.success is not None:
+                outcome.success = False
+            raise
+        finally:
+            self.release(time.monotonic() - start, outcome.success)
+    
+    async def acquire(self, tenant: str):
+        if self.in_flight < int(self.limit) and not any(self.queues.values()):
+            self._admit(tenant)
+            return
+        
+        queue = self.queues.setdefault(tenant, deque())
+        if len(queue) >= self.max_queue:
+            self.stats["rejected"] += 1
+            raise AdmissionRejected(f"Too many queued requests for {tenant}")
+        waiter = asyncio.get_running_loop().create_future()
+        queue.append(waiter)
+        self.stats["queued"] += 1
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Slot was granted as we were cancelled; hand it on
+                self.in_flight -= 1
+                self._dispatch()
+            elif waiter in queue:
+                queue.remove(waiter)
+                if not queue and self.queues.get(tenant) is queue:
+                    del self.queues[tenant]
+            raise
+    
+    def release(self, latency: float, success: Optional[bool]):
+        """Free a slot; an outcome of None frees it without moving the limit"""
+        self.in_flight -= 1
+        now = time.monotonic()
+        if success is None:
+            pass
+        elif not success or latency > self.target_latency:
+            if now - self.last_decrease >= self.target_latency:
+                self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+                self.last_decrease = now
+                self.stats["decreases"] += 1
+        elif self.limit < self.max_limit:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self.stats["increases"] += 1
+        self._dispatch()
+    
+    def _admit(self, tenant: str):
+        """Take a slot and advance the tenant's virtual finish tag"""
+        start = max(self.finish_tags.get(tenant, 0.0), self.virtual_time)
+        self.virtual_time = start
+        self.finish_tags[tenant] = start + 1 / self.weights.get(tenant, 1.0)
+        self.in_flight += 1
+        self.stats["admitted"] += 1
+        if len(self.finish_tags) > 10000:
+            # Tags behind the virtual clock behave exactly like missing ones
+            self.finish_tags = {t: tag for t, tag in self.finish_tags.items() if tag > self.virtual_time}
+    
+    def _dispatch(self):
+        """Grant free slots to waiters, lowest virtual start time first"""
+        while self.in_flight < int(self.limit):
+            backlogged = [tenant for tenant, queue in self.queues.items() if queue]
+            if not backlogged:
+                break
+            tenant = min(backlogged, key=lambda t: max(self.finish_tags.get(t, 0.0), self.virtual_time))
+            waiter = self.queues[tenant].popleft()
+            if not self.queues[tenant]:
+                del self.queues[tenant]
+            if waiter.done():
+                continue  # Cancelled (e.g. its deadline ran out) before its task could leave the queue
+            self._admit(tenant)
+            waiter.set_result(None)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "limit": int(self.limit),
+            "in_flight": self.in_flight,
+            "queue_depths": {tenant: len(queue) for tenant, queue in self.queues.items() if queue}
+        }
@@ -1,10 +1,26 @@
-from fastapi import FastAPI, HTTPException, Header, Depends
+from fastapi import FastAPI, HTTPException, Header, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, PlainTextResponse
 import asyncio
+import json
+import time
 from typing import Optional
-from src.models import DetectErrorRequest, DetectErrorResponse
+from src.models import (
+    DetectErrorRequest, DetectErrorResponse, PrepareQuestionRequest,
+    BulkPrepareRequest, BulkPrepareResponse, PreparedQuestion,
+    BatchDetectErrorRequest, BatchItemResult, JobSubmission, JobStatus
+)
 from src.detector import ErrorDetector
-from src.config import API_KEY, MAX_CONCURRENT_REQUESTS
+from src.jobs import JobQueue, JobQueueFull
+from src.telemetry import telemetry, start_request, server_timing, TrackedSemaphore
+from src.admission import AdmissionController, AdmissionRejected
+from src.governor import default_governor
+from src.hedging import default_hedger
+from src.deadline import Deadline
+from src.config import (
+    API_KEY, REQUEST_TIMEOUT, PREPARE_CONCURRENCY,
+    BATCH_CONCURRENCY, BATCH_MAX_ITEMS, HEDGING_ENABLED
+)
 
 app = FastAPI(title="Error Detection API", version="1.0.0")
 
@@ -17,13 +33,57 @@ app.add_middleware(
 )
 
 detector = ErrorDetector()
-semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+admission = AdmissionController()
+# Batch items and background jobs hold admission slots too, so every pipeline counts against one limit
+jobs = JobQueue(detector, admission=admission)
+prepare_semaphore = TrackedSemaphore("prepare", PREPARE_CONCURRENCY)
+telemetry.register_gauge("job_queue_depth", lambda: jobs.queue.qsize() if jobs.queue else 0)
+telemetry.register_gauge("admission_limit", lambda: int(admission.limit))
+telemetry.register_gauge("admission_in_flight", lambda: admission.in_flight)
+telemetry.register_gauge("admission_queued", lambda: sum(len(queue) for queue in admission.queues.values()))
+
+@app.middleware("http")
+async def record_timings(request: Request, call_next):
+    """Request latency and in-flight metrics, plus stage spans as a Server-Timing header"""
+    timings = start_request()
+    telemetry.add("http_requests_in_flight", 1)
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        if timings:
+            response.headers["Server-Timing"] = server_timing(timings)
+        return response
+    finally:
+        telemetry.add("http_requests_in_flight", -1)
+        route = request.scope.get("route")
+        telemetry.observe(
+            "http_request_duration_seconds",
+            time.perf_counter() - start,
+            method=request.method,
+            path=route.path if route is not None else "unmatched",
+            status=str(status)
+        )
+
+@app.on_event("startup")
+async def start_job_workers():
+    await jobs.start()
+
+@app.on_event("shutdown")
+async def stop_job_workers():
+    await jobs.stop()
+    detector.storage.close()
 
 def verify_api_key(x_api_key: Optional[str] = Header(None)):
     if x_api_key != API_KEY:
         raise HTTPException(status_code=401, detail="Invalid API key")
     return x_api_key
 
+def _tenant(request: DetectErrorRequest, api_key: str) -> str:
+    """Fair-queueing key: the end user when known, otherwise the calling API key"""
+    return f"user:{request.user_id}" if request.user_id else f"key:{api_key}"
+
 @app.post("/detect-error", response_model=DetectErrorResponse)
 async def detect_error(
     request: DetectErrorRequest,
@@ -31,19 +91,142 @@ async def detect_error(
 ):
     """Detect errors in student mathematical solutions"""
     
-    async with semaphore:  # Limit concurrent requests
-        try:
-            # Timeout handling
-            response = await asyncio.wait_for(
-                detector.detect_error(request),
-                timeout=30.0
-            )
+    # The budget starts on arrival, so time queued for admission is spent from it too
+    deadline = Deadline(REQUEST_TIMEOUT)
+    
+    async def admitted() -> DetectErrorResponse:
+        async with admission.slot(_tenant(request, api_key)) as outcome:  # Adaptive, per-tenant fair concurrency limit
+            response = await detector.detect_error(request, deadline=deadline)
+            # A fallback answer means the upstream failed, even though nothing was raised
+            outcome.success = response.llm_used
             return response
-            
-        except asyncio.TimeoutError:
-            raise HTTPException(status_code=408, detail="Request timeout")
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Processing error: {str(e)}")
+    
+    try:
+        return await deadline.run(admitted())
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=408, detail="Request timeout")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Processing error: {str(e)}")
+
+@app.post("/detect-error/stream")
+async def detect_error_stream(
+    request: DetectErrorRequest,
+    api_key: str = Depends(verify_api_key)
+):
+    """Detect errors, streaming OCR results and the analysis as Server-Sent Events"""
+    
+    async def stream_events():
+        try:
+            async with admission.slot(_tenant(request, api_key)) as outcome:  # Adaptive, per-tenant fair concurrency limit
+                try:
+                    async for event, data in detector.detect_error_events(request, REQUEST_TIMEOUT):
+                        if event == "result":
+                            outcome.success = data["llm_used"]
+                        elif event == "error":
+                            outcome.success = False
+                        yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+                except (asyncio.CancelledError, GeneratorExit):
+                    # The client went away: says nothing about upstream health
+                    outcome.success = None
+                    raise
+        except AdmissionRejected as e:
+            yield f"event: error\ndata: {json.dumps({'detail': str(e)})}\n\n"
+    
+    return StreamingResponse(
+        stream_events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/detect-error/batch")
+async def detect_error_batch(
+    request: BatchDetectErrorRequest,
+    api_key: str = Depends(verify_api_key)
+):
+    """Detect errors for many solutions, streaming one NDJSON line per item as it finishes"""
+    if len(request.requests) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {BATCH_MAX_ITEMS} items")
+    
+    async def stream_results():
+        async for index, response, error in detector.detect_errors(
+            request.requests, BATCH_CONCURRENCY, REQUEST_TIMEOUT, admission=admission,
+            tenant=lambda item: _tenant(item, api_key)
+        ):
+            yield BatchItemResult(index=index, response=response, error=error).json() + "\n"
+    
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+@app.post("/jobs", response_model=JobSubmission, status_code=202)
+async def submit_job(
+    request: DetectErrorRequest,
+    api_key: str = Depends(verify_api_key)
+):
+    """Queue a detection request and return its job_id immediately"""
+    try:
+        job_id = jobs.submit(request, tenant=_tenant(request, api_key))
+    except JobQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return JobSubmission(job_id=job_id, status="queued")
+
+@app.get("/jobs/{job_id}", response_model=JobStatus)
+async def get_job(
+    job_id: str,
+    api_key: str = Depends(verify_api_key)
+):
+    """Poll a queued job for its status and, once completed, its response"""
+    status = jobs.get_status(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return status
+
+async def _prepare(question_id: str, question_url: str) -> PreparedQuestion:
+    async with prepare_semaphore:  # Keep bulk pre-warming from flooding the vision API
+        return await detector.prepare_question(question_id, question_url)
+
+@app.post("/questions/prepare", response_model=BulkPrepareResponse)
+async def prepare_questions(
+    request: BulkPrepareRequest,
+    api_key: str = Depends(verify_api_key)
+):
+    """Pre-warm OCR and diagram detection for every question in an assignment"""
+    try:
+        results = await asyncio.gather(*(
+            _prepare(item.question_id, item.question_url) for item in request.questions
+        ))
+        return BulkPrepareResponse(results=results)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Processing error: {str(e)}")
+
+@app.post("/questions/{question_id}/prepare", response_model=PreparedQuestion)
+async def prepare_question(
+    question_id: str,
+    request: PrepareQuestionRequest,
+    api_key: str = Depends(verify_api_key)
+):
+    """Pre-warm OCR and diagram detection for a single question"""
+    try:
+        return await _prepare(question_id, request.question_url)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Processing error: {str(e)}")
+
+@app.get("/stats")
+async def stats(api_key: str = Depends(verify_api_key)):
+    """OCR cache, request-coalescing, job queue, admission and upstream counters, plus per-stage latency percentiles"""
+    return {
+        **detector.get_stats(),
+        "jobs": jobs.get_stats(),
+        "admission": admission.get_stats(),
+        "upstream": default_governor().get_stats(),
+        "hedging": default_hedger().get_stats() if HEDGING_ENABLED else None,
+        "stage_latency": telemetry.percentiles("error_detection_stage_duration_seconds")
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Latency histograms and concurrency gauges in Prometheus text format"""
+    return PlainTextResponse(telemetry.render(), media_type="text/plain; version=0.0.4")
 
 @app.get("/health")
 async def health_check():
@@ -0,0 +1,157 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+from src.config import OCR_CACHE_PATH, OCR_CACHE_MAX_ENTRIES, OCR_CACHE_TTL_SECONDS
+
+class OCRCache:
+    """Two-tier cache for vision results: a bounded in-memory LRU in front of SQLite.
+    
+    Entries expire after ``ttl_seconds`` in both tiers. Values must be JSON
+    serializable. Pass ``db_path=None`` for a memory-only cache. Code on the
+    event loop uses ``lookup``/``store``, which keep SQLite off the loop.
+    """
+    def __init__(self, db_path: Optional[str] = OCR_CACHE_PATH, max_entries: int = OCR_CACHE_MAX_ENTRIES,
+                 ttl_seconds: float = OCR_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+        # The memory tier lock is only held briefly, never across SQLite calls
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self.db = None
+        if db_path:
+            directory = os.path.dirname(db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.db = sqlite3.connect(db_path, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS ocr_cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self.db.commit()
+    
+    def get(self, key: str) -> Optional[Any]:
+        """Look up a key in memory, then on disk; returns None on a miss"""
+        value = self._get_memory(key)
+        if value is None:
+            value = self._get_disk(key)
+        if value is None:
+            self._miss()
+        return value
+    
+    def set(self, key: str, value: Any):
+        """Store a value in both tiers"""
+        expires_at = time.time() + self.ttl_seconds
+        self._set_memory(key, value, expires_at)
+        self._set_disk(key, value, expires_at)
+    
+    async def lookup(self, key: str) -> Optional[Any]:
+        """``get`` for the event loop: only the memory tier is checked inline, SQLite on a worker thread"""
+        value = self._get_memory(key)
+        if value is None and self.db is not None:
+            value = await asyncio.to_thread(self._get_disk, key)
+        if value is None:
+            self._miss()
+        return value
+    
+    async def store(self, key: str, value: Any):
+        """``set`` for the event loop: the SQLite write and commit run on a worker thread"""
+        expires_at = time.time() + self.ttl_seconds
+        self._set_memory(key, value, expires_at)
+        if self.db is not None:
+            await asyncio.to_thread(self._set_disk, key, value, expires_at)
+    
+    def _get_memory(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            entry = self.memory.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at > now:
+                self.memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return value
+            del self.memory[key]
+            self.stats["expirations"] += 1
+            return None
+    
+    def _get_disk(self, key: str) -> Optional[Any]:
+        if self.db is None:
+            return None
+        now = time.time()
+        with self._db_lock:
+            row = self.db.execute("SELECT value, expires_at FROM ocr_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                self.db.execute("DELETE FROM ocr_cache WHERE key = ?", (key,))
+                self.db.commit()
+                with self._lock:
+                    self.stats["expirations"] += 1
+                return None
+        value = json.loads(row[0])
+        self._set_memory(key, value, row[1])
+        with self._lock:
+            self.stats["disk_hits"] += 1
+        return value
+    
+    def _set_memory(self, key: str, value: Any, expires_at: float):
+        with self._lock:
+            self._remember(key, value, expires_at)
+    
+    def _set_disk(self, key: str, value: Any, expires_at: float):
+        if self.db is None:
+            return
+        with self._db_lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO ocr_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), expires_at)
+            )
+            self.db.commit()
+    
+    def _miss(self):
+        with self._lock:
+            self.stats["misses"] += 1
+    
+    def _remember(self, key: str, value: Any, expires_at: float):
+        """Insert into the LRU tier, evicting the least recently used entry when full"""
+        self.memory[key] = (expires_at, value)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+            self.stats["evictions"] += 1
+    
+    def purge_expired(self) -> int:
+        """Drop expired entries from both tiers"""
+        now = time.time()
+        with self._lock:
+            expired = [key for key, (expires_at, _) in self.memory.items() if expires_at <= now]
+            for key in expired:
+                del self.memory[key]
+        removed = len(expired)
+        if self.db is not None:
+            with self._db_lock:
+                removed += self.db.execute("DELETE FROM ocr_cache WHERE expires_at <= ?", (now,)).rowcount
+                self.db.commit()
+        with self._lock:
+            self.stats["expirations"] += removed
+        return removed
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and current memory tier size"""
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+        lookups = hits + self.stats["misses"]
+        return {
+            **self.stats,
+            "hits": hits,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "memory_entries": len(self.memory)
+        }
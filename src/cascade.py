@@ -0,0 +1,104 @@
+import re
+import time
+from typing import Any, Callable, Dict, Optional, Sequence
+from src.upstream import UpstreamClient
+from src.histogram import LatencyHistogram
+from src.deadline import DeadlineExceeded
+from src.telemetry import telemetry
+from src.config import ANALYSIS_MODELS, CASCADE_MIN_CONFIDENCE
+
+CONFIDENCE_PATTERN = re.compile(r"confidence\W*(\d+(?:\.\d+)?)(\s*%)?", re.IGNORECASE)
+
+# Appended to analysis prompts so cheaper tiers can say when they are unsure
+CONFIDENCE_INSTRUCTION = "Finish with a line 'CONFIDENCE: <0 to 1>' saying how sure you are of this analysis."
+
+def parse_confidence(content: str) -> Optional[float]:
+    """Self-reported confidence (0-1) from a 'CONFIDENCE:' line, if the model gave one"""
+    match = CONFIDENCE_PATTERN.search(content)
+    if match is None:
+        return None
+    value = float(match.group(1))
+    if match.group(2) or value > 1:
+        value /= 100
+    return min(value, 1.0)
+
+# Labelled lines every analysis prompt asks for, e.g. "ERROR: ..."
+ANALYSIS_FIELDS = ("ERROR", "CORRECTION", "HINT", "COMPLETE")
+
+def has_analysis_fields(content: str) -> bool:
+    """Whether every labelled analysis field starts a line of ``content``, spelled as the prompt asks"""
+    labels = {line.strip().split(":", 1)[0] for line in content.split('\n') if ":" in line}
+    return set(ANALYSIS_FIELDS) <= labels
+
+class CascadeRouter:
+    """Runs a completion on the cheapest model first, escalating only when needed.
+    
+    ``models`` are tried in order. An answer from any tier but the last is
+    accepted only if it passes the caller's ``validate`` check and reports a
+    confidence of at least ``min_confidence``; otherwise (or if the call fails)
+    the next tier is asked. The last tier's answer is always returned.
+    """
+    def __init__(self, client: UpstreamClient, models: Sequence[str] = ANALYSIS_MODELS,
+                 min_confidence: float = CASCADE_MIN_CONFIDENCE):
+        if not models:
+            raise ValueError("Cascade needs at least one model")
+        self.client = client
+        self.models = list(models)
+        self.min_confidence = min_confidence
+        self.latency: Dict[str, LatencyHistogram] = {model: LatencyHistogram() for model in self.models}
+        self.stats = {"calls": 0, "escalations": 0, "invalid": 0, "low_confidence": 0, "failed": 0}
+    
+    async def complete(self, validate: Callable[[str], bool], **kwargs) -> str:
+        """Content of the first acceptable completion for ``kwargs`` (everything but ``model``)"""
+        self.stats["calls"] += 1
+        for tier, model in enumerate(self.models):
+            last = tier == len(self.models) - 1
+            start = time.perf_counter()
+            try:
+                response = await self.client.create_chat_completion(model=model, **kwargs)
+            except DeadlineExceeded:
+                raise  # No budget left for a bigger model either
+            except Exception:
+                if last:
+                    raise
+                self._escalate(model, "failed")
+                continue
+            finally:
+                self._observe(model, time.perf_counter() - start)
+            
+            content = response.choices[0].message.content or ""
+            if last:
+                return content
+            if not validate(content):
+                self._escalate(model, "invalid")
+            elif (parse_confidence(content) or 0.0) < self.min_confidence:
+                # A missing confidence line counts as unsure
+                self._escalate(model, "low_confidence")
+            else:
+                return content
+    
+    def _observe(self, model: str, latency: float):
+        self.latency[model].record(latency)
+        telemetry.observe("analysis_tier_duration_seconds", latency, model=model)
+    
+    def _escalate(self, model: str, reason: str):
+        self.stats["escalations"] += 1
+        self.stats[reason] += 1
+        telemetry.inc("analysis_escalations_total", model=model, reason=reason)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Escalation counts and rate, plus call count and latency percentiles per tier"""
+        calls = self.stats["calls"]
+        return {
+            **self.stats,
+            "escalation_rate": self.stats["escalations"] / calls if calls else 0.0,
+            "tiers": {
+                model: {
+                    "calls": histogram.count,
+                    "latency_p50": histogram.percentile(0.5),
+                    "latency_p95": histogram.percentile(0.95),
+                    "latency_mean": histogram.mean
+                }
+                for model, histogram in self.latency.items()
+            }
+        }
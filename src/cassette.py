@@ -0,0 +1,204 @@
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+import httpx
+from src.config import OPENAI_CASSETTE_MODE, OPENAI_CASSETTE_PATH, OPENAI_CASSETTE_LATENCY_SCALE
+
+MODES = ("off", "record", "replay")
+
+# Response headers that no longer apply once the body is stored decoded, or should not be stored at all
+DROPPED_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "connection", "set-cookie"}
+
+def request_key(method: str, url: str, body: bytes) -> str:
+    """Stable key for a request: method, URL and the body, with JSON keys sorted"""
+    try:
+        body = json.dumps(json.loads(body), sort_keys=True, separators=(",", ":")).encode()
+    except ValueError:
+        pass
+    return hashlib.sha256(f"{method} {url}\n".encode() + body).hexdigest()
+
+class Cassette:
+    """Recorded HTTP exchanges, stored one JSON object per line.
+    
+    Each entry holds the response status, headers and decoded body plus the
+    latency measured while recording; request headers (and so API keys) are
+    never stored. Several recordings of the same request are replayed in turn,
+    wrapping around, so e.g. a recorded 429 followed by a 200 replays the same way.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.entries: Dict[str, List[Dict[str, Any]]] = {}
+        self.positions: Dict[str, int] = {}
+        self.lock = threading.Lock()
+        self._load()
+    
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # Truncated last line from an interrupted recording
+                self.entries.setdefault(entry["key"], []).append(entry)
+    
+    def find(self, key: str) -> Optional[Dict[str, Any]]:
+        """Next recorded exchange for ``key``, or None if it was never recorded"""
+        with self.lock:
+            entries = self.entries.get(key)
+            if not entries:
+                return None
+            position = self.positions.get(key, 0)
+            self.positions[key] = position + 1
+            return entries[position % len(entries)]
+    
+    def record(self, entry: Dict[str, Any]):
+        with self.lock:
+            self.entries.setdefault(entry["key"], []).append(entry)
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, "a") as f:
+                f.write(json.dumps(entry) + "\n")
+    
+    def __len__(self) -> int:
+        return sum(len(entries) for entries in self.entries.values())
+
+class _CassetteTransport:
+    """Shared record/replay logic for the sync and async transports"""
+    def __init__(self, cassette: Cassette, mode: str, latency_scale: float):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Cassette transport mode must be 'record' or 'replay', not {mode!r}")
+        self.cassette = cassette
+        self.mode = mode
+        self.latency_scale = latency_scale
+    
+    @staticmethod
+    def _key(request: httpx.Request) -> str:
+        return request_key(request.method, str(request.url), request.content)
+    
+    def _replay(self, request: httpx.Request) -> Optional[Dict[str, Any]]:
+        return self.cassette.find(self._key(request))
+    
+    def _record(self, request: httpx.Request, response: httpx.Response, content: bytes, latency: float) -> httpx.Response:
+        headers = {name: value for name, value in response.headers.items() if name.lower() not in DROPPED_HEADERS}
+        entry = {
+            "key": self._key(request),
+            "method": request.method,
+            "url": str(request.url),
+            "status": response.status_code,
+            "headers": headers,
+            "latency": latency
+        }
+        try:
+            entry["body"] = content.decode("utf-8")
+        except UnicodeDecodeError:
+            entry["body_b64"] = base64.b64encode(content).decode("ascii")
+        self.cassette.record(entry)
+        return httpx.Response(response.status_code, headers=headers, content=content, request=request)
+    
+    @staticmethod
+    def _response(request: httpx.Request, entry: Optional[Dict[str, Any]]) -> httpx.Response:
+        if entry is None:
+            # A plain 404 rather than a transport error, so the governor does not retry it
+            return httpx.Response(404, request=request, json={"error": {
+                "message": f"No cassette recording for {request.method} {request.url}",
+                "type": "cassette_miss",
+                "code": "cassette_miss"
+            }})
+        if "body_b64" in entry:
+            content = base64.b64decode(entry["body_b64"])
+        else:
+            content = entry["body"].encode("utf-8")
+        return httpx.Response(entry["status"], headers=entry["headers"], content=content, request=request)
+
+class AsyncCassetteTransport(_CassetteTransport, httpx.AsyncBaseTransport):
+    """httpx transport that records exchanges to, or replays them from, a cassette.
+    
+    In record mode requests go to the wrapped ``transport`` and each response
+    is read in full before it is returned (a recorded stream arrives in one
+    piece). In replay mode nothing touches the network; each response is
+    delayed by ``latency_scale`` times its recorded latency (0 = instant).
+    """
+    def __init__(self, cassette: Cassette, mode: str, latency_scale: float = 0.0,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        super().__init__(cassette, mode, latency_scale)
+        self.transport = transport or httpx.AsyncHTTPTransport()
+    
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        await request.aread()
+        if self.mode == "replay":
+            entry = self._replay(request)
+            if entry is not None and self.latency_scale > 0:
+                await asyncio.sleep(entry["latency"] * self.latency_scale)
+            return self._response(request, entry)
+        
+        start = time.perf_counter()
+        response = await self.transport.handle_async_request(request)
+        try:
+            content = await response.aread()
+        finally:
+            await response.aclose()
+        return self._record(request, response, content, time.perf_counter() - start)
+    
+    async def aclose(self):
+        await self.transport.aclose()
+
+class CassetteTransport(_CassetteTransport, httpx.BaseTransport):
+    """Blocking counterpart of AsyncCassetteTransport, for the synchronous OpenAI client"""
+    def __init__(self, cassette: Cassette, mode: str, latency_scale: float = 0.0,
+                 transport: Optional[httpx.BaseTransport] = None):
+        super().__init__(cassette, mode, latency_scale)
+        self.transport = transport or httpx.HTTPTransport()
+    
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        request.read()
+        if self.mode == "replay":
+            entry = self._replay(request)
+            if entry is not None and self.latency_scale > 0:
+                time.sleep(entry["latency"] * self.latency_scale)
+            return self._response(request, entry)
+        
+        start = time.perf_counter()
+        response = self.transport.handle_request(request)
+        try:
+            content = response.read()
+        finally:
+            response.close()
+        return self._record(request, response, content, time.perf_counter() - start)
+    
+    def close(self):
+        self.transport.close()
+
+def enabled() -> bool:
+    """Whether outbound HTTP goes through the cassette (OPENAI_CASSETTE_MODE is record or replay)"""
+    if OPENAI_CASSETTE_MODE not in MODES:
+        raise ValueError(f"OPENAI_CASSETTE_MODE must be one of {', '.join(MODES)}, not {OPENAI_CASSETTE_MODE!r}")
+    return OPENAI_CASSETTE_MODE != "off"
+
+_default_cassette: Optional[Cassette] = None
+
+def default_cassette() -> Cassette:
+    """Process-wide cassette at OPENAI_CASSETTE_PATH, shared by every client"""
+    global _default_cassette
+    if _default_cassette is None:
+        _default_cassette = Cassette(OPENAI_CASSETTE_PATH)
+    return _default_cassette
+
+def async_transport(transport: httpx.AsyncBaseTransport) -> httpx.AsyncBaseTransport:
+    """``transport`` wrapped in the configured cassette, or unchanged when cassettes are off"""
+    if not enabled():
+        return transport
+    return AsyncCassetteTransport(default_cassette(), OPENAI_CASSETTE_MODE, OPENAI_CASSETTE_LATENCY_SCALE, transport)
+
+def sync_transport(transport: httpx.BaseTransport) -> httpx.BaseTransport:
+    """Blocking counterpart of ``async_transport``"""
+    if not enabled():
+        return transport
+    return CassetteTransport(default_cassette(), OPENAI_CASSETTE_MODE, OPENAI_CASSETTE_LATENCY_SCALE, transport)
@@ -1,10 +1,135 @@
 import os
+from typing import Dict
 from dotenv import load_dotenv
 
 load_dotenv()
 
+def parse_key_values(spec: str) -> Dict[str, float]:
+    """Parse a ``key:value,key:value`` setting (keys may themselves contain colons)"""
+    values = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        key, _, value = item.rpartition(":")
+        values[key] = float(value)
+    return values
+
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 API_KEY = os.getenv("API_KEY", "default-key")
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
-MAX_CONCURRENT_REQUESTS = 5
-REQUEST_TIMEOUT = 30
\ No newline at end of file
+# Starting concurrency limit for detection requests; the admission controller adapts it (AIMD)
+MAX_CONCURRENT_REQUESTS = int(os.getenv("MAX_CONCURRENT_REQUESTS", "5"))
+REQUEST_TIMEOUT = 30
+# Optional stages (diagram detection) are skipped when less than this many seconds of the request's budget remain
+OPTIONAL_STAGE_MIN_BUDGET = float(os.getenv("OPTIONAL_STAGE_MIN_BUDGET", "10"))
+
+# Upstream client: AsyncOpenAI by default, blocking client (run on a worker thread) as fallback
+OPENAI_USE_SYNC_CLIENT = os.getenv("OPENAI_USE_SYNC_CLIENT", "false").lower() == "true"
+
+# "separate": one vision call for OCR and one for diagram detection per image; "fused": a single structured call
+OCR_MODE = os.getenv("OCR_MODE", "separate").lower()
+
+# OCR result cache (memory LRU + SQLite). OCR_CACHE_KEY: "url", or "content" to key on a hash of the image bytes
+OCR_CACHE_ENABLED = os.getenv("OCR_CACHE_ENABLED", "true").lower() == "true"
+OCR_CACHE_PATH = os.getenv("OCR_CACHE_PATH", "data/ocr_cache.sqlite3")
+OCR_CACHE_MAX_ENTRIES = int(os.getenv("OCR_CACHE_MAX_ENTRIES", "1024"))
+OCR_CACHE_TTL_SECONDS = float(os.getenv("OCR_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+OCR_CACHE_KEY = os.getenv("OCR_CACHE_KEY", "url").lower()
+
+# Pre-warmed question OCR/diagram results, keyed by question_id
+QUESTION_INDEX_PATH = os.getenv("QUESTION_INDEX_PATH", "data/questions.sqlite3")
+PREPARE_CONCURRENCY = int(os.getenv("PREPARE_CONCURRENCY", "4"))
+
+# Local image ingestion: fetch once, normalize orientation, grayscale, downscale and send as base64 JPEG
+IMAGE_PREPROCESS = os.getenv("IMAGE_PREPROCESS", "true").lower() == "true"
+IMAGE_MAX_SIDE = int(os.getenv("IMAGE_MAX_SIDE", "1024"))
+IMAGE_GRAYSCALE = os.getenv("IMAGE_GRAYSCALE", "true").lower() == "true"
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "80"))
+IMAGE_FETCH_TIMEOUT = float(os.getenv("IMAGE_FETCH_TIMEOUT", "10"))
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", str(20 * 1024 * 1024)))
+IMAGE_CACHE_MAX_ENTRIES = int(os.getenv("IMAGE_CACHE_MAX_ENTRIES", "64"))
+
+# Solution OCR region: "full" page, or "bbox" to crop to the bounding box plus SOLUTION_CROP_MARGIN pixels
+SOLUTION_CROP_MODE = os.getenv("SOLUTION_CROP_MODE", "full").lower()
+SOLUTION_CROP_MARGIN = float(os.getenv("SOLUTION_CROP_MARGIN", "150"))
+SOLUTION_CROP_FALLBACK = os.getenv("SOLUTION_CROP_FALLBACK", "true").lower() == "true"
+
+# Batch endpoint: internal concurrency and maximum items per batch
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "500"))
+
+# Asynchronous job mode (/jobs): worker pool size, queue bound and in-memory status retention
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_QUEUE_MAX = int(os.getenv("JOB_QUEUE_MAX", "1000"))
+JOB_RETENTION = int(os.getenv("JOB_RETENTION", "10000"))
+
+# Audit log background writer: max records per transaction and how long to wait for a batch to fill;
+# records older than AUDIT_RETENTION_DAYS are expired by compaction (0 keeps everything)
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "256"))
+AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", "0.05"))
+AUDIT_RETENTION_DAYS = float(os.getenv("AUDIT_RETENTION_DAYS", "0"))
+
+# Structured logging: records are handed to a background writer thread through a bounded queue
+# (dropped when full); successful requests are logged at LOG_SUCCESS_SAMPLE_RATE, errors always
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_SUCCESS_SAMPLE_RATE = float(os.getenv("LOG_SUCCESS_SAMPLE_RATE", "1.0"))
+
+# Adaptive admission control for detection requests: the concurrency limit moves between
+# ADMISSION_MIN_LIMIT and ADMISSION_MAX_LIMIT, shrinking when requests exceed ADMISSION_TARGET_LATENCY
+# seconds or fail. Waiting requests queue per tenant (API key or user_id), at most ADMISSION_MAX_QUEUE each,
+# and are served by weighted fair queueing with weights from "tenant:weight,..." (default weight 1)
+ADMISSION_MIN_LIMIT = int(os.getenv("ADMISSION_MIN_LIMIT", "2"))
+ADMISSION_MAX_LIMIT = int(os.getenv("ADMISSION_MAX_LIMIT", "64"))
+ADMISSION_TARGET_LATENCY = float(os.getenv("ADMISSION_TARGET_LATENCY", "10"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "100"))
+ADMISSION_TENANT_WEIGHTS = os.getenv("ADMISSION_TENANT_WEIGHTS", "")
+
+# Outbound governor for OpenAI calls: optional per-model requests/min and tokens/min limits
+# ("model:limit,..."; unlisted models are not throttled), retries with jittered exponential backoff
+# that honours Retry-After, and a per-model circuit breaker that fails fast after
+# CIRCUIT_FAILURE_THRESHOLD consecutive failures until a probe succeeds CIRCUIT_RESET_TIMEOUT seconds later
+OPENAI_RPM_LIMITS = os.getenv("OPENAI_RPM_LIMITS", "")
+OPENAI_TPM_LIMITS = os.getenv("OPENAI_TPM_LIMITS", "")
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "3"))
+OPENAI_RETRY_BASE_DELAY = float(os.getenv("OPENAI_RETRY_BASE_DELAY", "0.5"))
+OPENAI_RETRY_MAX_DELAY = float(os.getenv("OPENAI_RETRY_MAX_DELAY", "20"))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_TIMEOUT", "30"))
+
+# Hedged upstream requests (opt-in): a non-streaming vision/analysis call still running after the
+# HEDGE_QUANTILE of the last HEDGE_WINDOW calls of its kind gets a duplicate, first response wins;
+# duplicates add at most HEDGE_MAX_EXTRA_LOAD (fraction of calls) extra upstream load
+HEDGING_ENABLED = os.getenv("HEDGING_ENABLED", "false").lower() == "true"
+HEDGE_QUANTILE = float(os.getenv("HEDGE_QUANTILE", "0.95"))
+HEDGE_MAX_EXTRA_LOAD = float(os.getenv("HEDGE_MAX_EXTRA_LOAD", "0.05"))
+HEDGE_WINDOW = int(os.getenv("HEDGE_WINDOW", "100"))
+
+# Error analysis model cascade, cheapest first: the next model is only asked when an answer fails
+# validation or reports a confidence below CASCADE_MIN_CONFIDENCE (a single model disables the cascade)
+ANALYSIS_MODELS = [model.strip() for model in os.getenv("ANALYSIS_MODELS", "gpt-4.1-mini,gpt-4").split(",") if model.strip()]
+CASCADE_MIN_CONFIDENCE = float(os.getenv("CASCADE_MIN_CONFIDENCE", "0.7"))
+
+# Evaluation harness: test cases run concurrently (both variants of a case together), and per-case
+# results are appended to EVAL_CHECKPOINT_PATH so an interrupted run resumes where it stopped
+EVAL_CONCURRENCY = int(os.getenv("EVAL_CONCURRENCY", "4"))
+EVAL_CHECKPOINT_PATH = os.getenv("EVAL_CHECKPOINT_PATH", "eval_checkpoint.jsonl")
+
+# Record/replay of outbound HTTP (OpenAI calls and image fetches) for reproducible, offline runs:
+# "record" appends every exchange with its measured latency to OPENAI_CASSETTE_PATH, "replay" serves
+# them back without network (unrecorded requests get a 404), each delayed by OPENAI_CASSETTE_LATENCY_SCALE
+# times its recorded latency (0 = instant, 1 = as recorded)
+OPENAI_CASSETTE_MODE = os.getenv("OPENAI_CASSETTE_MODE", "off").lower()
+OPENAI_CASSETTE_PATH = os.getenv("OPENAI_CASSETTE_PATH", "data/cassettes/openai.jsonl")
+OPENAI_CASSETTE_LATENCY_SCALE = float(os.getenv("OPENAI_CASSETTE_LATENCY_SCALE", "0"))
+
+# OpenAI API base URL (unset = api.openai.com); point it at the mock upstream, e.g. http://localhost:8100/v1
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+
+# Mock OpenAI upstream for load tests (python -m src.mock_upstream): time to first token
+# ("fixed:s", "uniform:low:high" or "lognormal:median:sigma") plus MOCK_UPSTREAM_TOKEN_LATENCY seconds
+# per completion token, injected failure rates per status ("429:0.05,503:0.01", 429s carry
+# Retry-After: MOCK_UPSTREAM_RETRY_AFTER) and an optional JSON file of canned replies per call kind
+MOCK_UPSTREAM_PORT = int(os.getenv("MOCK_UPSTREAM_PORT", "8100"))
+MOCK_UPSTREAM_LATENCY = os.getenv("MOCK_UPSTREAM_LATENCY", "lognormal:1.0:0.5")
+MOCK_UPSTREAM_TOKEN_LATENCY = float(os.getenv("MOCK_UPSTREAM_TOKEN_LATENCY", "0.01"))
+MOCK_UPSTREAM_FAILURES = os.getenv("MOCK_UPSTREAM_FAILURES", "")
+MOCK_UPSTREAM_RETRY_AFTER = float(os.getenv("MOCK_UPSTREAM_RETRY_AFTER", "1"))
+MOCK_UPSTREAM_RESPONSES = os.getenv("MOCK_UPSTREAM_RESPONSES", "")
@@ -0,0 +1,78 @@
+import asyncio
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from typing import Awaitable, Iterator, Optional, TypeVar
+
+T = TypeVar("T")
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    """The request's time budget ran out; handled wherever a request timeout already is"""
+    pass
+
+class Deadline:
+    """Absolute time budget for one request, measured on the monotonic clock.
+    
+    The deadline is created when a request arrives (so time spent queueing
+    counts against it) and carried through every stage, so each upstream call
+    gets only what is left of the budget instead of a fixed timeout of its own.
+    """
+    def __init__(self, timeout: float):
+        self.timeout = timeout
+        self.expires_at = time.monotonic() + timeout
+    
+    def remaining(self) -> float:
+        """Seconds left, never negative"""
+        return max(0.0, self.expires_at - time.monotonic())
+    
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+    
+    def check(self):
+        """Raise DeadlineExceeded if the budget is already spent"""
+        if self.expired:
+            raise DeadlineExceeded(f"Deadline of {self.timeout:g}s exceeded")
+    
+    async def run(self, awaitable: Awaitable[T]) -> T:
+        """Await ``awaitable``, cancelling it when the budget runs out"""
+        try:
+            return await asyncio.wait_for(awaitable, timeout=self.remaining())
+        except asyncio.TimeoutError as e:
+            if isinstance(e, DeadlineExceeded):
+                raise
+            raise DeadlineExceeded(f"Deadline of {self.timeout:g}s exceeded") from e
+
+# Deadline of the request being served; work it spawns inherits it, except calls shared with other requests
+_deadline: ContextVar[Optional[Deadline]] = ContextVar("deadline", default=None)
+
+@contextmanager
+def scope(deadline: Optional[Deadline]) -> Iterator[None]:
+    """Make ``deadline`` the current deadline for upstream calls made in this context"""
+    token = _deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+def current() -> Optional[Deadline]:
+    return _deadline.get()
+
+def detached(awaitable: Awaitable[T]) -> "asyncio.Task[T]":
+    """Start work shared by several requests as a task with no deadline of its own.
+    
+    Otherwise the task would copy the deadline of whichever request started
+    it and fail every other waiter when that budget ran out; instead each
+    waiter bounds its own wait with ``wait``.
+    """
+    context = copy_context()
+    context.run(_deadline.set, None)
+    # The task copies the context it is created in
+    return context.run(asyncio.ensure_future, awaitable)
+
+async def wait(future: Awaitable[T]) -> T:
+    """Await a shared ``future`` within the current deadline, without cancelling it for other waiters"""
+    deadline = current()
+    if deadline is None:
+        return await asyncio.shield(future)
+    return await deadline.run(asyncio.shield(future))
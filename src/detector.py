@@ -1,11 +1,26 @@
+import asyncio
+import math
 import uuid
 import time
-from typing import Dict, Any
-from src.models import DetectErrorRequest, DetectErrorResponse
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+from src.models import DetectErrorRequest, DetectErrorResponse, PreparedQuestion
 from src.ocr import OCRProcessor
 from src.llm import LLMAnalyzer
 from src.storage import SimpleStorage
+from src.admission import AdmissionController, AdmissionRejected
 from src.logging import StructuredLogger
+from src.pipeline import Stage, StagePipeline
+from src.questions import QuestionIndex
+from src.images import CropBox
+from src.telemetry import telemetry, span, timed
+from src import accounting
+from src import deadline as deadlines
+from src.accounting import UsageLedger, UserUsage, attributed
+from src.deadline import Deadline, DeadlineExceeded
+from src.config import SOLUTION_CROP_MODE, SOLUTION_CROP_MARGIN, SOLUTION_CROP_FALLBACK, OPTIONAL_STAGE_MIN_BUDGET
+
+async def _resolved(value: Any) -> Any:
+    return value
 
 class ErrorDetector:
     def __init__(self):
@@ -13,32 +28,302 @@ class ErrorDetector:
         self.llm = LLMAnalyzer()
         self.storage = SimpleStorage()
         self.logger = StructuredLogger()
+        self.questions = QuestionIndex()
+        self.solution_crop_mode = SOLUTION_CROP_MODE
+        self.solution_crop_margin = SOLUTION_CROP_MARGIN
+        self.solution_crop_fallback = SOLUTION_CROP_FALLBACK
+        self.optional_stage_min_budget = OPTIONAL_STAGE_MIN_BUDGET
+        self.user_usage = UserUsage()
+    
+    async def prepare_question(self, question_id: str, question_url: str) -> PreparedQuestion:
+        """OCR a question image and check it for diagrams ahead of student requests"""
+        with accounting.stage("prepare_question"):
+            if self.ocr.mode == "fused":
+                lines, has_diagram = await self.ocr.analyze_image(question_url)
+            else:
+                lines, has_diagram = await asyncio.gather(
+                    self.ocr.extract_text_from_url(question_url),
+                    self.ocr.has_diagram(question_url)
+                )
+        
+        # Empty OCR means the vision call failed; leave the question cold rather than index nothing
+        prepared = bool(lines)
+        if prepared:
+            await self.questions.store(question_id, question_url, lines, has_diagram)
+        
+        return PreparedQuestion(
+            question_id=question_id,
+            question_url=question_url,
+            prepared=prepared,
+            question_lines=lines,
+            question_has_diagram=has_diagram
+        )
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Cache, request-coalescing and model-cascade counters, plus token and cost usage, for the upstream stages"""
+        return {
+            "ocr_cache": self.ocr.cache.get_stats() if self.ocr.cache is not None else None,
+            "ocr_coalescing": self.ocr.inflight.get_stats(),
+            "llm_coalescing": self.llm.inflight.get_stats(),
+            "analysis_cascade": self.llm.cascade.get_stats(),
+            "usage": {**accounting.totals.to_dict(), "by_user": self.user_usage.to_dict()}
+        }
+    
+    def _build_pipeline(self, request: DetectErrorRequest, prepared: Optional[Dict[str, Any]] = None,
+                        shared: Optional[Dict[Hashable, asyncio.Future]] = None,
+                        emit: Optional[Callable[[str, Dict[str, Any]], None]] = None) -> StagePipeline:
+        """OCR and diagram checks are independent; only the analysis waits on OCR.
+        
+        ``prepared`` is the question's entry in the question index, which replaces
+        its vision calls. ``shared`` lets requests in one batch reuse question-image
+        vision calls. With ``emit``, the analysis is streamed as ``analysis`` delta events.
+        """
+        bounding_box = request.bounding_box.dict()
+        
+        crop = self._solution_crop(request)
+        
+        if self.ocr.mode == "fused":
+            if prepared:
+                question_stage = Stage("question_image", lambda _: _resolved((prepared["lines"], prepared["has_diagram"])))
+            else:
+                question_stage = Stage("question_image", lambda _: self._shared(
+                    shared, ("fused", request.question_url), lambda: self.ocr.analyze_image(request.question_url)
+                ), default=([], False))
+            vision_stages = [
+                question_stage,
+                Stage("solution_image", lambda _: self._analyze_solution(request.solution_url, crop), default=([], False)),
+            ]
+        else:
+            if prepared:
+                question_stages = [
+                    Stage("question_ocr", lambda _: _resolved(prepared["lines"])),
+                    Stage("question_diagram", lambda _: _resolved(prepared["has_diagram"])),
+                ]
+            else:
+                question_stages = [
+                    Stage("question_ocr", lambda _: self._shared(
+                        shared, ("text", request.question_url), lambda: self.ocr.extract_text_from_url(request.question_url)
+                    ), default=[]),
+                    Stage("question_diagram", lambda _: self._shared(
+                        shared, ("diagram", request.question_url), lambda: self.ocr.has_diagram(request.question_url)
+                    ), default=False, min_budget=self.optional_stage_min_budget),
+                ]
+            vision_stages = question_stages + [
+                Stage("solution_ocr", lambda _: self._solution_text(request.solution_url, crop), default=[]),
+                # The crop only narrows OCR: a diagram anywhere on the page still counts
+                Stage("solution_diagram", lambda _: self.ocr.has_diagram(request.solution_url), default=False,
+                      min_budget=self.optional_stage_min_budget),
+            ]
+        text_stages = ("question_image", "solution_image") if self.ocr.mode == "fused" else ("question_ocr", "solution_ocr")
+        
+        async def analyze(results: Dict[str, Any]) -> Dict[str, Any]:
+            question_lines, solution_lines, _, _ = self._vision_results(results)
+            if emit is not None:
+                return await self.llm.analyze_error_stream(
+                    " ".join(question_lines),
+                    " ".join(solution_lines),
+                    bounding_box,
+                    on_delta=lambda delta: emit("analysis", {"delta": delta})
+                )
+            return await self.llm.analyze_error(
+                " ".join(question_lines),
+                " ".join(solution_lines),
+                bounding_box
+            )
+        
+        stages = vision_stages + [Stage("analysis", analyze, deps=text_stages)]
+        # Each stage is reported as a span (Server-Timing and the stage latency histogram)
+        # and its upstream token usage is attributed to it
+        return StagePipeline([
+            Stage(s.name, timed(s.name, attributed(s.name, s.func)), s.deps, s.default, s.min_budget) for s in stages
+        ])
+    
+    @staticmethod
+    def _shared(shared: Optional[Dict[Hashable, asyncio.Future]], key: Hashable,
+                factory: Callable[[], Awaitable[Any]]) -> Awaitable[Any]:
+        """Start a call once per key within a batch and hand every request the same result"""
+        if shared is None:
+            return factory()
+        if key not in shared:
+            shared[key] = deadlines.detached(factory())
+        return deadlines.wait(shared[key])
+    
+    def _solution_crop(self, request: DetectErrorRequest) -> Optional[CropBox]:
+        """Bounding box plus context margin, in solution-image pixels, when cropping is enabled"""
+        if self.solution_crop_mode != "bbox":
+            return None
+        box = request.bounding_box
+        margin = self.solution_crop_margin
+        return (
+            math.floor(box.minX - margin),
+            math.floor(box.minY - margin),
+            math.ceil(box.maxX + margin),
+            math.ceil(box.maxY + margin)
+        )
+    
+    async def _solution_text(self, solution_url: str, crop: Optional[CropBox]) -> List[str]:
+        """OCR the solution region, falling back to the full page if the crop yields nothing"""
+        if crop is not None:
+            lines = await self.ocr.extract_text_from_url(solution_url, crop)
+            if lines or not self.solution_crop_fallback:
+                return lines
+        return await self.ocr.extract_text_from_url(solution_url)
+    
+    async def _analyze_solution(self, solution_url: str, crop: Optional[CropBox]) -> Tuple[List[str], bool]:
+        """Fused-mode counterpart of _solution_text; the diagram flag always describes the full page"""
+        if crop is not None:
+            (lines, _), has_diagram = await asyncio.gather(
+                self.ocr.analyze_image(solution_url, crop),
+                self.ocr.has_diagram(solution_url)
+            )
+            if lines or not self.solution_crop_fallback:
+                return lines, has_diagram
+        return await self.ocr.analyze_image(solution_url)
+    
+    @staticmethod
+    def _ocr_event(stage: str, value: Any) -> Optional[Dict[str, Any]]:
+        """Client-facing payload for a finished vision stage; None for other stages"""
+        if stage in ("question_ocr", "solution_ocr"):
+            return {"stage": stage, "lines": value}
+        if stage in ("question_diagram", "solution_diagram"):
+            return {"stage": stage, "has_diagram": value}
+        if stage in ("question_image", "solution_image"):
+            lines, has_diagram = value
+            return {"stage": stage, "lines": lines, "has_diagram": has_diagram}
+        return None
+    
+    def _vision_results(self, results: Dict[str, Any]) -> Tuple[List[str], List[str], bool, bool]:
+        """Question/solution lines and diagram flags, whichever OCR mode produced them"""
+        if "question_image" in results or "solution_image" in results:
+            question_lines, question_has_diagram = results.get("question_image", ([], False))
+            solution_lines, solution_has_diagram = results.get("solution_image", ([], False))
+            return question_lines, solution_lines, question_has_diagram, solution_has_diagram
+        return (
+            results.get("question_ocr", []),
+            results.get("solution_ocr", []),
+            results.get("question_diagram", False),
+            results.get("solution_diagram", False)
+        )
     
-    async def detect_error(self, request: DetectErrorRequest) -> DetectErrorResponse:
-        """Main error detection pipeline"""
-        job_id = str(uuid.uuid4())
+    async def detect_errors(self, requests: List[DetectErrorRequest], concurrency: int, timeout: float,
+                            admission: Optional[AdmissionController] = None,
+                            tenant: Callable[[DetectErrorRequest], str] = lambda request: "anonymous"
+                            ) -> AsyncIterator[Tuple[int, Optional[DetectErrorResponse], Optional[str]]]:
+        """Process a batch with bounded concurrency, yielding (index, response, error) as items finish.
+        
+        Items that share a question image share its OCR and diagram calls. With
+        ``admission``, each item also holds a slot for its ``tenant(item)``, so
+        batches count against the same adaptive limit as single requests.
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+        shared: Dict[Hashable, asyncio.Future] = {}
+        
+        async def admitted(request: DetectErrorRequest, deadline: Deadline) -> DetectErrorResponse:
+            if admission is None:
+                return await self.detect_error(request, shared=shared, deadline=deadline)
+            async with admission.slot(tenant(request)) as outcome:
+                response = await self.detect_error(request, shared=shared, deadline=deadline)
+                outcome.success = response.llm_used
+                return response
+        
+        async def run_item(index: int, request: DetectErrorRequest):
+            async with semaphore:
+                deadline = Deadline(timeout)
+                try:
+                    return index, await deadline.run(admitted(request, deadline)), None
+                except AdmissionRejected as e:
+                    return index, None, str(e)
+                except asyncio.TimeoutError:
+                    return index, None, "Request timeout"
+        
+        tasks = [asyncio.create_task(run_item(i, request)) for i, request in enumerate(requests)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # Client went away or the batch finished: stop outstanding items and shared calls
+            for task in tasks + list(shared.values()):
+                task.cancel()
+    
+    async def detect_error_events(self, request: DetectErrorRequest,
+                                  timeout: float) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """Run the pipeline and yield progress events as they happen.
+        
+        Yields ``ocr`` events as vision stages finish, ``analysis`` events with
+        streamed text deltas, and finally ``result`` with the full response (or
+        ``error`` if the timeout is exceeded).
+        """
+        events: asyncio.Queue = asyncio.Queue()
+        deadline = Deadline(timeout)
+        task = asyncio.create_task(self.detect_error(
+            request, emit=lambda event, data: events.put_nowait((event, data)), deadline=deadline
+        ))
+        task.add_done_callback(lambda _: events.put_nowait(None))
+        
+        try:
+            while True:
+                item = await deadline.run(events.get())
+                if item is None:
+                    break
+                yield item
+            yield "result", task.result().dict()
+        except asyncio.TimeoutError:
+            yield "error", {"detail": "Request timeout"}
+        finally:
+            task.cancel()
+    
+    async def detect_error(self, request: DetectErrorRequest, job_id: Optional[str] = None,
+                           shared: Optional[Dict[Hashable, asyncio.Future]] = None,
+                           emit: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+                           deadline: Optional[Deadline] = None) -> DetectErrorResponse:
+        """Main error detection pipeline.
+        
+        With a ``deadline``, every upstream call is limited to the remaining
+        budget, diagram detection is skipped when little budget is left, and
+        DeadlineExceeded is raised once the analysis can no longer finish in time.
+        """
+        job_id = job_id or str(uuid.uuid4())
+        usage = UsageLedger()
+        
+        try:
+            # Upstream tokens and cost of this request, across all of its stages
+            with accounting.track(usage), deadlines.scope(deadline):
+                return await self._detect_error(request, job_id, usage, shared, emit, deadline)
+        finally:
+            self.user_usage.add(request.user_id or "anonymous", usage)
+    
+    async def _detect_error(self, request: DetectErrorRequest, job_id: str, usage: UsageLedger,
+                            shared: Optional[Dict[Hashable, asyncio.Future]] = None,
+                            emit: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+                            deadline: Optional[Deadline] = None) -> DetectErrorResponse:
         start_time = time.time()
         
         try:
             self.logger.log_request(job_id, request.dict())
             
-            # Extract text from images
-            question_lines = self.ocr.extract_text_from_url(request.question_url)
-            solution_lines = self.ocr.extract_text_from_url(request.solution_url)
+            timed_out = set()
             
-            # Check for diagrams
-            question_has_diagram = self.ocr.has_diagram(request.question_url)
-            solution_has_diagram = self.ocr.has_diagram(request.solution_url)
+            def on_error(stage: str, e: Exception):
+                self.logger.log_error(job_id, f"{stage}: {e}")
+                if isinstance(e, DeadlineExceeded):
+                    timed_out.add(stage)
             
-            # Analyze for errors
-            question_text = " ".join(question_lines)
-            solution_text = " ".join(solution_lines)
+            def on_complete(stage: str, value: Any):
+                event = self._ocr_event(stage, value)
+                # A stage cut off by the deadline has no result to report, only its default
+                if emit is not None and event is not None and stage not in timed_out:
+                    emit("ocr", event)
             
-            analysis = self.llm.analyze_error(
-                question_text, 
-                solution_text, 
-                request.bounding_box.dict()
+            prepared = await self.questions.lookup(request.question_id, request.question_url) if request.question_id else None
+            run = await self._build_pipeline(request, prepared, shared, emit).run(
+                on_error=on_error,
+                on_complete=on_complete,
+                deadline=deadline
             )
+            for stage in run.skipped:
+                telemetry.inc("error_detection_stages_skipped_total", stage=stage)
+            question_lines, solution_lines, question_has_diagram, solution_has_diagram = self._vision_results(run.results)
+            analysis = run.results["analysis"]
             
             # Build response
             response = DetectErrorResponse(
@@ -57,21 +342,32 @@ class ErrorDetector:
             )
             
             # Store for auditing
-            self.storage.save_request_response(
-                job_id, 
-                request.dict(), 
-                response.dict()
-            )
+            with span("storage"):
+                self.storage.save_request_response(
+                    job_id, 
+                    request.dict(), 
+                    response.dict(),
+                    usage=usage.to_dict()
+                )
             
             latency = time.time() - start_time
             self.logger.log_response(job_id, latency, True)
+            telemetry.observe("error_detection_request_duration_seconds", latency, outcome="success")
             
             return response
             
+        except DeadlineExceeded as e:
+            # Surfaced as a request timeout by the caller rather than papered over with a fallback
+            self.logger.log_error(job_id, str(e))
+            latency = time.time() - start_time
+            self.logger.log_response(job_id, latency, False)
+            telemetry.observe("error_detection_request_duration_seconds", latency, outcome="timeout")
+            raise
         except Exception as e:
             self.logger.log_error(job_id, str(e))
             latency = time.time() - start_time
             self.logger.log_response(job_id, latency, False)
+            telemetry.observe("error_detection_request_duration_seconds", latency, outcome="error")
             
             # Return partial result instead of failing
             return DetectErrorResponse(
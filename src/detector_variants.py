@@ -5,14 +5,15 @@ from src.models import DetectErrorRequest, DetectErrorResponse
 from src.ocr import OCRProcessor
 from src.storage import SimpleStorage
 from src.logging import StructuredLogger
-import openai
-from src.config import OPENAI_API_KEY
+from src.upstream import UpstreamClient
+from src.accounting import stage
+from src.cascade import CascadeRouter, has_analysis_fields
 
 class BaselineDetector:
     """Baseline: Simple OCR + basic LLM prompt"""
     def __init__(self):
         self.ocr = OCRProcessor()
-        self.client = openai.OpenAI(api_key=OPENAI_API_KEY)
+        self.client = UpstreamClient()
         self.storage = SimpleStorage()
         self.logger = StructuredLogger()
     
@@ -22,16 +23,18 @@ class BaselineDetector:
         
         try:
             # Basic OCR
-            solution_lines = self.ocr.extract_text_from_url(request.solution_url)
+            with stage("solution_ocr"):
+                solution_lines = await self.ocr.extract_text_from_url(request.solution_url)
             solution_text = " ".join(solution_lines)
             
             # Simple LLM analysis
-            response = self.client.chat.completions.create(
-                model="gpt-4",
-                messages=[{"role": "user", "content": f"Check this math solution for errors: {solution_text}"}],
-                max_tokens=100,
-                temperature=0.5
-            )
+            with stage("analysis"):
+                response = await self.client.create_chat_completion(
+                    model="gpt-4",
+                    messages=[{"role": "user", "content": f"Check this math solution for errors: {solution_text}"}],
+                    max_tokens=100,
+                    temperature=0.5
+                )
             
             content = response.choices[0].message.content
             
@@ -64,10 +67,11 @@ class BaselineDetector:
             )
 
 class ImprovedDetector:
-    """Improved: Enhanced prompting + context + structured analysis"""
+    """Improved: Enhanced prompting + context + structured analysis, cheapest capable model first"""
     def __init__(self):
         self.ocr = OCRProcessor()
-        self.client = openai.OpenAI(api_key=OPENAI_API_KEY)
+        self.client = UpstreamClient()
+        self.cascade = CascadeRouter(self.client)
         self.storage = SimpleStorage()
         self.logger = StructuredLogger()
     
@@ -77,8 +81,10 @@ class ImprovedDetector:
         
         try:
             # Enhanced OCR with context
-            question_lines = self.ocr.extract_text_from_url(request.question_url)
-            solution_lines = self.ocr.extract_text_from_url(request.solution_url)
+            with stage("question_ocr"):
+                question_lines = await self.ocr.extract_text_from_url(request.question_url)
+            with stage("solution_ocr"):
+                solution_lines = await self.ocr.extract_text_from_url(request.solution_url)
             
             question_text = " ".join(question_lines)
             solution_text = " ".join(solution_lines)
@@ -102,19 +108,20 @@ class ImprovedDetector:
             CORRECTION: [how to fix it]
             HINT: [educational guidance]
             COMPLETE: [yes/no if solution is finished]
+            CONFIDENCE: [0 to 1, how sure you are of this analysis]
             """
             
-            response = self.client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": "You are an expert mathematics tutor focused on identifying and explaining errors in student work."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=300,
-                temperature=0.1
-            )
+            with stage("analysis"):
+                content = await self.cascade.complete(
+                    self._is_structured_response,
+                    messages=[
+                        {"role": "system", "content": "You are an expert mathematics tutor focused on identifying and explaining errors in student work."},
+                        {"role": "user", "content": prompt}
+                    ],
+                    max_tokens=300,
+                    temperature=0.1
+                )
             
-            content = response.choices[0].message.content
             analysis = self._parse_structured_response(content)
             
             return DetectErrorResponse(
@@ -146,6 +153,11 @@ class ImprovedDetector:
                 llm_used=False
             )
     
+    @staticmethod
+    def _is_structured_response(content: str) -> bool:
+        """Whether every field of the response format is present"""
+        return has_analysis_fields(content)
+    
     def _parse_structured_response(self, content: str) -> Dict[str, Any]:
         """Parse structured LLM response"""
         lines = content.split('\n')
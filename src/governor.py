@@ -0,0 +1,227 @@
+import asyncio
+import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, Optional
+import openai
+from src import deadline as deadlines
+from src.deadline import DeadlineExceeded
+from src.telemetry import telemetry
+from src.config import (
+    parse_key_values, OPENAI_RPM_LIMITS, OPENAI_TPM_LIMITS, OPENAI_MAX_RETRIES, OPENAI_RETRY_BASE_DELAY,
+    OPENAI_RETRY_MAX_DELAY, CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT
+)
+
+class CircuitOpenError(Exception):
+    pass
+
+class TokenBucket:
+    """Per-minute rate limit that callers reserve from up front.
+    
+    A reservation always succeeds immediately and returns how long the caller
+    must wait for it to be covered, so waiters are served in arrival order
+    without a lock. The balance can go negative, e.g. when actual token usage
+    turns out higher than estimated.
+    """
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+    
+    def reserve(self, amount: float) -> float:
+        """Take ``amount`` and return the seconds until it is paid for"""
+        self.adjust(-min(amount, self.capacity))
+        return max(0.0, -self.tokens / self.rate)
+    
+    def adjust(self, delta: float):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate) + delta
+        self.updated = now
+
+class CircuitBreaker:
+    """Opens after consecutive upstream failures and fails fast until a probe succeeds"""
+    def __init__(self, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD, reset_timeout: float = CIRCUIT_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False
+    
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+    
+    def allow(self) -> bool:
+        """Whether a call may go out now; in half-open state only one probe at a time"""
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self.probing:
+            self.probing = True
+            return True
+        return False
+    
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+    
+    def record_failure(self):
+        self.failures += 1
+        self.probing = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+class UpstreamGovernor:
+    """Shared outbound policy for OpenAI calls.
+    
+    Each model gets optional requests/min and tokens/min token buckets, so a
+    burst is spread out before it reaches the upstream instead of turning into
+    429s. Rate limits, 5xx responses and connection errors are retried with
+    full-jitter exponential backoff, waiting at least as long as any
+    ``Retry-After`` the upstream sends. A per-model circuit breaker opens after
+    repeated failures and rejects calls immediately while it is open.
+    """
+    def __init__(self, rpm_limits: Optional[Dict[str, float]] = None, tpm_limits: Optional[Dict[str, float]] = None,
+                 max_retries: int = OPENAI_MAX_RETRIES, base_delay: float = OPENAI_RETRY_BASE_DELAY,
+                 max_delay: float = OPENAI_RETRY_MAX_DELAY, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+                 reset_timeout: float = CIRCUIT_RESET_TIMEOUT):
+        rpm_limits = rpm_limits if rpm_limits is not None else parse_key_values(OPENAI_RPM_LIMITS)
+        tpm_limits = tpm_limits if tpm_limits is not None else parse_key_values(OPENAI_TPM_LIMITS)
+        self.request_buckets = {model: TokenBucket(limit) for model, limit in rpm_limits.items()}
+        self.token_buckets = {model: TokenBucket(limit) for model, limit in tpm_limits.items()}
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.stats = {"calls": 0, "retries": 0, "throttled_seconds": 0.0, "rejected": 0, "failures": 0}
+    
+    def breaker(self, model: str) -> CircuitBreaker:
+        if model not in self.breakers:
+            self.breakers[model] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+        return self.breakers[model]
+    
+    async def call(self, model: str, estimated_tokens: int, func: Callable[[], Awaitable[Any]]) -> Any:
+        """Run ``func`` (one upstream request) under the model's rate limits, retries and breaker"""
+        breaker = self.breaker(model)
+        deadline = deadlines.current()
+        self.stats["calls"] += 1
+        attempt = 0
+        while True:
+            if not breaker.allow():
+                self.stats["rejected"] += 1
+                telemetry.inc("upstream_rejected_total", model=model)
+                raise CircuitOpenError(f"Upstream circuit for {model} is open")
+            try:
+                await self._throttle(model, estimated_tokens, deadline)
+                response = await func()
+            except Exception as e:
+                if isinstance(e, DeadlineExceeded) or (deadline is not None and deadline.expired):
+                    # Our own budget ran out; that says nothing about the upstream's health
+                    breaker.probing = False
+                    if isinstance(e, DeadlineExceeded):
+                        raise
+                    raise DeadlineExceeded(f"Deadline of {deadline.timeout:g}s exceeded") from e
+                if not self._retryable(e):
+                    # The upstream answered; a bad request says nothing about its health
+                    breaker.record_success()
+                    raise
+                breaker.record_failure()
+                self.stats["failures"] += 1
+                delay = self._backoff(attempt, e)
+                if attempt >= self.max_retries or breaker.state != "closed":
+                    raise
+                if deadline is not None and delay >= deadline.remaining():
+                    # Not worth waiting for a retry that could not finish in time
+                    raise
+                attempt += 1
+                self.stats["retries"] += 1
+                telemetry.inc("upstream_retries_total", model=model)
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # Cancelled mid-call: release a half-open probe without judging the upstream
+                breaker.probing = False
+                raise
+            breaker.record_success()
+            return response
+    
+    def settle(self, model: str, estimated_tokens: int, actual_tokens: int):
+        """Correct the tokens/min bucket once the real usage of a call is known"""
+        bucket = self.token_buckets.get(model)
+        if bucket is not None:
+            bucket.adjust(estimated_tokens - actual_tokens)
+    
+    async def _throttle(self, model: str, estimated_tokens: int, deadline: Optional[deadlines.Deadline] = None):
+        waits = []
+        if model in self.request_buckets:
+            waits.append(self.request_buckets[model].reserve(1))
+        if model in self.token_buckets:
+            waits.append(self.token_buckets[model].reserve(estimated_tokens))
+        wait = max(waits, default=0.0)
+        if deadline is not None and wait >= deadline.remaining():
+            raise DeadlineExceeded(f"Rate limit wait of {wait:.1f}s exceeds the remaining budget")
+        if wait > 0:
+            self.stats["throttled_seconds"] += wait
+            telemetry.inc("upstream_throttled_seconds_total", wait, model=model)
+            await asyncio.sleep(wait)
+    
+    @staticmethod
+    def _retryable(error: Exception) -> bool:
+        if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError)):
+            return True
+        if isinstance(error, openai.RateLimitError):
+            # Exhausted quota will not recover by waiting
+            return getattr(error, "code", None) != "insufficient_quota"
+        if isinstance(error, openai.APIStatusError):
+            return error.status_code >= 500 or error.status_code == 408
+        return False
+    
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        """Full-jitter exponential backoff, never shorter than the upstream's Retry-After"""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        retry_after = self._retry_after(error)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+    
+    @staticmethod
+    def _retry_after(error: Exception) -> Optional[float]:
+        response = getattr(error, "response", None)
+        headers = getattr(response, "headers", None)
+        if not headers:
+            return None
+        if headers.get("retry-after-ms"):
+            try:
+                return float(headers["retry-after-ms"]) / 1000
+            except ValueError:
+                pass
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                return None
+    
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "circuits": {model: breaker.state for model, breaker in self.breakers.items()}}
+
+_default_governor: Optional[UpstreamGovernor] = None
+
+def default_governor() -> UpstreamGovernor:
+    """Process-wide governor shared by every UpstreamClient"""
+    global _default_governor
+    if _default_governor is None:
+        _default_governor = UpstreamGovernor()
+    return _default_governor
@@ -0,0 +1,96 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, TypeVar
+from src.histogram import LatencyHistogram
+from src.telemetry import telemetry
+from src.config import HEDGE_QUANTILE, HEDGE_MAX_EXTRA_LOAD, HEDGE_WINDOW
+
+T = TypeVar("T")
+
+class Hedger:
+    """Sends a backup request when the first one is slower than usual.
+    
+    Latency is tracked per call type (e.g. model and max_tokens) over windows
+    of ``window`` completed calls; once a window is full, its ``quantile``
+    becomes the hedging delay for that call type. A call still running after
+    that delay gets a duplicate, the first successful response wins and the
+    other is cancelled. Every call earns ``max_extra_load`` of a hedge and a
+    hedge spends one, so duplicates add at most that fraction of extra load
+    (with a small burst allowance).
+    """
+    def __init__(self, quantile: float = HEDGE_QUANTILE, max_extra_load: float = HEDGE_MAX_EXTRA_LOAD,
+                 window: int = HEDGE_WINDOW, burst: float = 10.0):
+        if not 0 < quantile < 1:
+            raise ValueError("quantile must be between 0 and 1")
+        self.quantile = quantile
+        self.max_extra_load = max_extra_load
+        self.window = window
+        self.burst = burst
+        self.budget = 0.0
+        self.windows: Dict[Hashable, LatencyHistogram] = {}
+        self.delays: Dict[Hashable, float] = {}
+        self.stats = {"calls": 0, "hedges_fired": 0, "hedges_won": 0, "hedges_denied": 0}
+    
+    async def run(self, key: Hashable, func: Callable[[], Awaitable[T]]) -> T:
+        """Run ``func``, starting one duplicate if it outlasts the hedging delay for ``key``"""
+        self.stats["calls"] += 1
+        self.budget = min(self.burst, self.budget + self.max_extra_load)
+        starts: Dict[asyncio.Future, float] = {}
+        
+        def start() -> asyncio.Future:
+            task = asyncio.ensure_future(func())
+            starts[task] = time.monotonic()
+            return task
+        
+        primary = start()
+        pending = {primary}
+        hedge_after = self.delays.get(key)
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=hedge_after, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # The original outlasted the hedging delay
+                    hedge_after = None
+                    if self.budget >= 1:
+                        self.budget -= 1
+                        self.stats["hedges_fired"] += 1
+                        telemetry.inc("upstream_hedges_fired_total", call=str(key))
+                        pending.add(start())
+                    else:
+                        self.stats["hedges_denied"] += 1
+                    continue
+                for task in done:
+                    if task.exception() is not None:
+                        error = error or task.exception()
+                        continue
+                    # Time the call from the original's start, so a winning hedge does not add a short sample
+                    self._observe(key, time.monotonic() - starts[primary])
+                    if task is not primary:
+                        self.stats["hedges_won"] += 1
+                        telemetry.inc("upstream_hedges_won_total", call=str(key))
+                    return task.result()
+            raise error
+        finally:
+            for task in starts:
+                task.cancel()
+    
+    def _observe(self, key: Hashable, latency: float):
+        histogram = self.windows.setdefault(key, LatencyHistogram())
+        histogram.record(latency)
+        if histogram.count >= self.window:
+            # Only recent latency matters: start a fresh window once this one is full
+            self.delays[key] = histogram.percentile(self.quantile)
+            self.windows[key] = LatencyHistogram()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "delays": {str(key): delay for key, delay in self.delays.items()}}
+
+_default_hedger: Optional[Hedger] = None
+
+def default_hedger() -> Hedger:
+    """Process-wide hedger shared by every UpstreamClient"""
+    global _default_hedger
+    if _default_hedger is None:
+        _default_hedger = Hedger()
+    return _default_hedger
@@ -0,0 +1,110 @@
+import math
+from typing import Dict, Iterable, Optional, Tuple
+
+DEFAULT_QUANTILES = (0.5, 0.9, 0.95, 0.99, 0.999)
+
+class LatencyHistogram:
+    """Log-bucketed (HDR-style) histogram with bounded memory.
+    
+    Bucket boundaries grow geometrically, so every recorded value is known to
+    within ``relative_error`` regardless of magnitude. Recording is O(1), memory
+    is bounded by the number of buckets between ``min_value`` and ``max_value``
+    (values outside are clamped into the edge buckets), and histograms with the
+    same layout can be merged, e.g. across eval workers or service processes.
+    """
+    def __init__(self, relative_error: float = 0.01, min_value: float = 1e-4, max_value: float = 3600.0):
+        if not 0 < relative_error < 1:
+            raise ValueError("relative_error must be between 0 and 1")
+        if not 0 < min_value < max_value:
+            raise ValueError("Need 0 < min_value < max_value")
+        self.relative_error = relative_error
+        self.min_value = min_value
+        self.max_value = max_value
+        self._gamma = (1 + relative_error) / (1 - relative_error)
+        self._log_gamma = math.log(self._gamma)
+        self._max_index = math.ceil(math.log(max_value / min_value) / self._log_gamma)
+        self.counts: Dict[int, int] = {}
+        self.count = 0
+        self.sum = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+    
+    def _index(self, value: float) -> int:
+        if value <= self.min_value:
+            return 0
+        return min(math.ceil(math.log(value / self.min_value) / self._log_gamma), self._max_index)
+    
+    def _bounds(self, index: int) -> Tuple[float, float]:
+        """Value range covered by a bucket"""
+        if index == 0:
+            return 0.0, self.min_value
+        return self.min_value * self._gamma ** (index - 1), self.min_value * self._gamma ** index
+    
+    def _representative(self, index: int) -> float:
+        """Value reported for samples in a bucket, within relative_error of each of them"""
+        lower, upper = self._bounds(index)
+        value = 2 * lower * upper / (lower + upper) if lower > 0 else upper
+        return min(max(value, self.min), self.max)
+    
+    def record(self, value: float, count: int = 1):
+        index = self._index(value)
+        self.counts[index] = self.counts.get(index, 0) + count
+        self.count += count
+        self.sum += value * count
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+    
+    def merge(self, other: "LatencyHistogram"):
+        """Add another histogram's samples into this one"""
+        if (other.relative_error, other.min_value, other.max_value) != (self.relative_error, self.min_value, self.max_value):
+            raise ValueError("Cannot merge histograms with different bucket layouts")
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+        self.sum += other.sum
+        if other.count:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+    
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+    
+    def percentile(self, quantile: float) -> float:
+        """Value at ``quantile`` (0-1), interpolating linearly between neighbouring ranks"""
+        if not 0 <= quantile <= 1:
+            raise ValueError("quantile must be between 0 and 1")
+        if self.count == 0:
+            return 0.0
+        rank = quantile * (self.count - 1)
+        lower_rank = math.floor(rank)
+        upper_rank = min(lower_rank + 1, self.count - 1)
+        lower, upper = self._values_at((lower_rank, upper_rank))
+        # The extremes are tracked exactly
+        exact = {0: self.min, self.count - 1: self.max}
+        lower = exact.get(lower_rank, lower)
+        upper = exact.get(upper_rank, upper)
+        return lower + (upper - lower) * (rank - lower_rank)
+    
+    def percentiles(self, quantiles: Iterable[float] = DEFAULT_QUANTILES) -> Dict[float, float]:
+        return {q: self.percentile(q) for q in quantiles}
+    
+    def _values_at(self, ranks: Tuple[int, ...]) -> Tuple[float, ...]:
+        """Values of the given (ascending, 0-based) ranks"""
+        values = []
+        seen = 0
+        pending = list(ranks)
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            while pending and pending[0] < seen:
+                pending.pop(0)
+                values.append(self._representative(index))
+            if not pending:
+                break
+        return tuple(values)
+    
+    def count_at_or_below(self, value: float) -> int:
+        """Samples no greater than ``value`` (to bucket precision), e.g. for Prometheus buckets"""
+        if self.max is not None and value >= self.max:
+            return self.count
+        return sum(count for index, count in self.counts.items() if self._representative(index) <= value)
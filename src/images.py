@@ -0,0 +1,126 @@
+import asyncio
+import base64
+import hashlib
+import httpx
+from collections import OrderedDict
+from dataclasses import dataclass
+from io import BytesIO
+from typing import Optional, Tuple
+from PIL import Image, ImageOps
+from src.singleflight import SingleFlight
+from src import cassette
+from src.config import (
+    IMAGE_MAX_SIDE, IMAGE_GRAYSCALE, IMAGE_JPEG_QUALITY, IMAGE_FETCH_TIMEOUT,
+    IMAGE_MAX_BYTES, IMAGE_CACHE_MAX_ENTRIES
+)
+
+@dataclass
+class PreparedImage:
+    """A fetched image re-encoded as a compact payload for the vision model"""
+    source_url: str
+    data_url: str
+    sha256: str
+    width: int
+    height: int
+    original_width: int
+    original_height: int
+    original_bytes: int
+    payload_bytes: int
+
+CropBox = Tuple[int, int, int, int]
+
+class ImageIngestor:
+    """Fetches each image once over a pooled HTTP client and prepares it for vision calls.
+
+    Images are orientation-normalized, optionally converted to grayscale,
+    downscaled so the longest side is at most ``max_side`` and re-encoded as a
+    base64 JPEG data URL. Prepared images are kept in a small LRU so the OCR and
+    diagram calls for the same image share one download and decode.
+    
+    An optional ``crop`` box (left, top, right, bottom in original-image pixels)
+    is applied after orientation normalization and before downscaling.
+    """
+    def __init__(self, max_side: int = IMAGE_MAX_SIDE, grayscale: bool = IMAGE_GRAYSCALE,
+                 jpeg_quality: int = IMAGE_JPEG_QUALITY, max_entries: int = IMAGE_CACHE_MAX_ENTRIES,
+                 http_client: Optional[httpx.AsyncClient] = None):
+        self.max_side = max_side
+        self.grayscale = grayscale
+        self.jpeg_quality = jpeg_quality
+        self.max_entries = max_entries
+        if http_client is None:
+            limits = httpx.Limits(max_connections=20, max_keepalive_connections=10)
+            transport = None
+            if cassette.enabled():
+                # Image fetches are recorded too, so replayed runs need no network at all
+                transport = cassette.async_transport(httpx.AsyncHTTPTransport(limits=limits))
+            http_client = httpx.AsyncClient(
+                timeout=IMAGE_FETCH_TIMEOUT,
+                follow_redirects=True,
+                limits=limits,
+                transport=transport
+            )
+        self.http = http_client
+        self.inflight = SingleFlight()
+        self.prepared: "OrderedDict[str, PreparedImage]" = OrderedDict()
+    
+    async def prepare(self, image_url: str, crop: Optional[CropBox] = None) -> PreparedImage:
+        """Fetch, normalize and downscale an image, reusing recent results"""
+        key = (image_url, crop)
+        image = self.prepared.get(key)
+        if image is not None:
+            self.prepared.move_to_end(key)
+            return image
+        
+        image = await self.inflight.do(key, lambda: self._fetch_and_prepare(image_url, crop))
+        self.prepared[key] = image
+        self.prepared.move_to_end(key)
+        while len(self.prepared) > self.max_entries:
+            self.prepared.popitem(last=False)
+        return image
+    
+    async def fetch(self, image_url: str) -> bytes:
+        """Download raw image bytes"""
+        response = await self.http.get(image_url)
+        response.raise_for_status()
+        if len(response.content) > IMAGE_MAX_BYTES:
+            raise ValueError(f"Image too large: {len(response.content)} bytes")
+        return response.content
+    
+    async def _fetch_and_prepare(self, image_url: str, crop: Optional[CropBox]) -> PreparedImage:
+        data = await self.fetch(image_url)
+        # Decoding and resampling are CPU-bound; keep them off the event loop
+        return await asyncio.to_thread(self._transform, image_url, data, crop)
+    
+    def _transform(self, image_url: str, data: bytes, crop: Optional[CropBox] = None) -> PreparedImage:
+        with Image.open(BytesIO(data)) as source:
+            image = ImageOps.exif_transpose(source)
+            original_width, original_height = image.size
+            if crop is not None:
+                image = image.crop(self._clamp(crop, original_width, original_height))
+            image = image.convert("L" if self.grayscale else "RGB")
+            image.thumbnail((self.max_side, self.max_side), Image.Resampling.LANCZOS)
+            
+            buffer = BytesIO()
+            image.save(buffer, format="JPEG", quality=self.jpeg_quality, optimize=True)
+            payload = buffer.getvalue()
+            
+            return PreparedImage(
+                source_url=image_url,
+                data_url="data:image/jpeg;base64," + base64.b64encode(payload).decode("ascii"),
+                sha256=hashlib.sha256(data).hexdigest(),
+                width=image.width,
+                height=image.height,
+                original_width=original_width,
+                original_height=original_height,
+                original_bytes=len(data),
+                payload_bytes=len(payload)
+            )
+    
+    @staticmethod
+    def _clamp(crop: CropBox, width: int, height: int) -> CropBox:
+        """Clip a crop box to the image, rejecting boxes that miss it entirely"""
+        left, top, right, bottom = crop
+        box = (max(0, left), max(0, top), min(width, right), min(height, bottom))
+        if box[2] <= box[0] or box[3] <= box[1]:
+            raise ValueError(f"Crop box {crop} lies outside the {width}x{height} image")
+        return box
@@ -0,0 +1,125 @@
+import asyncio
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from src.models import DetectErrorRequest
+from src.admission import AdmissionController
+from src.deadline import Deadline
+from src.config import JOB_WORKERS, JOB_QUEUE_MAX, JOB_RETENTION, REQUEST_TIMEOUT
+
+class JobQueueFull(Exception):
+    pass
+
+class JobQueue:
+    """In-process job queue drained by a pool of worker tasks.
+
+    Submitting returns a job_id immediately; workers run the detector in the
+    background. Status is tracked in memory for the most recent jobs, and
+    finished jobs, failed ones included, can always be recovered from the
+    detector's audit storage.
+    With ``admission``, each running job holds one of its tenant's slots.
+    """
+    def __init__(self, detector, workers: int = JOB_WORKERS, max_queue: int = JOB_QUEUE_MAX,
+                 retention: int = JOB_RETENTION, timeout: float = REQUEST_TIMEOUT,
+                 admission: Optional[AdmissionController] = None):
+        self.detector = detector
+        self.admission = admission
+        self.worker_count = workers
+        self.max_queue = max_queue
+        self.retention = retention
+        self.timeout = timeout
+        self.queue: Optional[asyncio.Queue] = None
+        self.workers: List[asyncio.Task] = []
+        self.jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+    
+    async def start(self):
+        """Start the worker pool on the running event loop"""
+        if self.workers:
+            return
+        self.queue = asyncio.Queue(maxsize=self.max_queue)
+        self.workers = [asyncio.create_task(self._worker()) for _ in range(self.worker_count)]
+    
+    async def stop(self):
+        """Cancel the workers; queued jobs are abandoned"""
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+    
+    def submit(self, request: DetectErrorRequest, tenant: str = "anonymous") -> str:
+        """Enqueue a request and return its job_id"""
+        if self.queue is None:
+            raise RuntimeError("Job queue is not running")
+        job_id = str(uuid.uuid4())
+        try:
+            self.queue.put_nowait((job_id, request, tenant))
+        except asyncio.QueueFull:
+            raise JobQueueFull(f"Job queue is full ({self.max_queue} jobs)")
+        self._track(job_id, {"status": "queued", "submitted_at": datetime.utcnow().isoformat()})
+        return job_id
+    
+    def get_status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Current job status, falling back to the audit record for older jobs"""
+        job = self.jobs.get(job_id)
+        if job is not None:
+            return {"job_id": job_id, **job}
+        record = self.detector.storage.get_record(job_id)
+        if not record:
+            return None
+        response = record.get("response") or None
+        error = record.get("error")
+        if error is None and response is not None and response.get("llm_used") is False:
+            error = f"Processing error: {response.get('error')}"
+        if error is not None:
+            status = {"job_id": job_id, "status": "failed", "error": error}
+            return {**status, "response": response} if response is not None else status
+        return {"job_id": job_id, "status": "completed", "response": response}
+    
+    def get_stats(self) -> Dict[str, Any]:
+        counts: Dict[str, int] = {}
+        for job in self.jobs.values():
+            counts[job["status"]] = counts.get(job["status"], 0) + 1
+        return {"workers": len(self.workers), "queue_depth": self.queue.qsize() if self.queue else 0, "jobs": counts}
+    
+    def _track(self, job_id: str, update: Dict[str, Any]):
+        self.jobs.setdefault(job_id, {}).update(update)
+        # Forget the oldest finished jobs once over the retention limit
+        while len(self.jobs) > self.retention:
+            oldest = next((k for k, v in self.jobs.items() if v["status"] in ("completed", "failed")), None)
+            if oldest is None:
+                break
+            del self.jobs[oldest]
+    
+    async def _worker(self):
+        while True:
+            job_id, request, tenant = await self.queue.get()
+            self._track(job_id, {"status": "running"})
+            try:
+                deadline = Deadline(self.timeout)
+                response = await deadline.run(self._detect(request, job_id, tenant, deadline))
+                if response.llm_used:
+                    self._track(job_id, {"status": "completed", "response": response.dict()})
+                else:
+                    # The detector fell back to a placeholder answer: processing did not succeed
+                    self._fail(job_id, request, f"Processing error: {response.error}", response.dict())
+            except asyncio.TimeoutError:
+                self._fail(job_id, request, "Request timeout")
+            except Exception as e:
+                self._fail(job_id, request, f"Processing error: {str(e)}")
+            finally:
+                self.queue.task_done()
+    
+    def _fail(self, job_id: str, request: DetectErrorRequest, error: str, response: Optional[Dict[str, Any]] = None):
+        """Mark a job failed, recording the failure in audit storage so it outlives the in-memory status"""
+        update = {"status": "failed", "error": error}
+        self._track(job_id, {**update, "response": response} if response is not None else update)
+        self.detector.storage.save_request_response(job_id, request.dict(), response or {}, error=error)
+    
+    async def _detect(self, request: DetectErrorRequest, job_id: str, tenant: str, deadline: Deadline):
+        if self.admission is None:
+            return await self.detector.detect_error(request, job_id=job_id, deadline=deadline)
+        async with self.admission.slot(tenant) as outcome:
+            response = await self.detector.detect_error(request, job_id=job_id, deadline=deadline)
+            outcome.success = response.llm_used
+            return response
@@ -1,46 +1,90 @@
-import openai
-from typing import Dict, Any
-from src.config import OPENAI_API_KEY
+import hashlib
+import json
+from typing import Any, Callable, Dict, List
+from src.upstream import UpstreamClient
+from src.singleflight import SingleFlight
+from src.deadline import DeadlineExceeded
+from src.cascade import CascadeRouter, CONFIDENCE_INSTRUCTION, has_analysis_fields
 
 class LLMAnalyzer:
     def __init__(self):
-        self.client = openai.OpenAI(api_key=OPENAI_API_KEY)
+        self.client = UpstreamClient()
+        self.cascade = CascadeRouter(self.client)
+        self.inflight = SingleFlight()
     
-    def analyze_error(self, question_text: str, solution_text: str, bounding_box: Dict[str, float]) -> Dict[str, Any]:
-        """Analyze mathematical solution for errors"""
-        
-        prompt = f"""
-        Question: {question_text}
-        Student Solution: {solution_text}
-        
-        Analyze the student's mathematical work and identify any errors. Focus on the area around y-coordinate {bounding_box.get('minY', 0)}.
-        
-        Respond with:
-        1. Error description (or "No error found")
-        2. Correction suggestion
-        3. Helpful hint
-        4. Whether solution appears complete
+    async def analyze_error(self, question_text: str, solution_text: str, bounding_box: Dict[str, float]) -> Dict[str, Any]:
+        """Analyze mathematical solution for errors, sharing one call among identical concurrent requests"""
+        key = hashlib.sha256(json.dumps([question_text, solution_text, bounding_box], sort_keys=True).encode()).hexdigest()
+        result = await self.inflight.do(key, lambda: self._analyze(question_text, solution_text, bounding_box))
+        return dict(result)
+    
+    async def analyze_error_stream(self, question_text: str, solution_text: str, bounding_box: Dict[str, float],
+                                   on_delta: Callable[[str], None]) -> Dict[str, Any]:
+        """Analyze a solution, passing each text delta to ``on_delta`` as the upstream streams it.
         
-        Be specific and educational.
+        Streaming calls are not coalesced, since every caller needs its own deltas, and
+        go straight to the last cascade tier, since streamed text cannot be taken back.
         """
+        try:
+            chunks = []
+            async for delta in self.client.stream_chat_completion(
+                model=self.cascade.models[-1],
+                messages=self._messages(question_text, solution_text, bounding_box),
+                max_tokens=300,
+                temperature=0.1
+            ):
+                chunks.append(delta)
+                on_delta(delta)
+            
+            return self._parse_analysis("".join(chunks), bounding_box)
         
+        except DeadlineExceeded:
+            raise  # Out of time is a timeout for the request, not an analysis to fall back from
+        except Exception as e:
+            return self._default_response(str(e), bounding_box)
+    
+    async def _analyze(self, question_text: str, solution_text: str, bounding_box: Dict[str, float]) -> Dict[str, Any]:
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": "You are a mathematics tutor helping students identify and correct errors in their work."},
-                    {"role": "user", "content": prompt}
-                ],
+            content = await self.cascade.complete(
+                self._is_complete_analysis,
+                messages=self._messages(question_text, solution_text, bounding_box),
                 max_tokens=300,
                 temperature=0.1
             )
-            
-            content = response.choices[0].message.content
             return self._parse_analysis(content, bounding_box)
         
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             return self._default_response(str(e), bounding_box)
     
+    def _messages(self, question_text: str, solution_text: str, bounding_box: Dict[str, float]) -> List[Dict[str, str]]:
+        """Chat messages for the error analysis prompt"""
+        prompt = f"""
+        Question: {question_text}
+        Student Solution: {solution_text}
+        
+        Analyze the student's mathematical work and identify any errors. Focus on the area around y-coordinate {bounding_box.get('minY', 0)}.
+        
+        Respond in this format:
+        ERROR: [error description or "No error found"]
+        CORRECTION: [correction suggestion]
+        HINT: [helpful hint]
+        COMPLETE: [yes/no if solution appears complete]
+        
+        Be specific and educational. {CONFIDENCE_INSTRUCTION}
+        """
+        
+        return [
+            {"role": "system", "content": "You are a mathematics tutor helping students identify and correct errors in their work."},
+            {"role": "user", "content": prompt}
+        ]
+    
+    @staticmethod
+    def _is_complete_analysis(content: str) -> bool:
+        """Whether a cheaper model gave every labelled field of the response format"""
+        return has_analysis_fields(content)
+    
     def _parse_analysis(self, content: str, bounding_box: Dict[str, float]) -> Dict[str, Any]:
         """Parse LLM response into structured format"""
         lines = content.split('\n')
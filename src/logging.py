@@ -1,36 +1,100 @@
-import logging
+import atexit
 import json
+import logging
+import logging.handlers
+import queue
+import zlib
 from datetime import datetime
-from src.config import LOG_LEVEL
+from typing import Any, Dict
+from src.config import LOG_LEVEL, LOG_QUEUE_SIZE, LOG_SUCCESS_SAMPLE_RATE
+
+try:
+    import orjson
+except ImportError:  # Optional fast encoder
+    orjson = None
+
+def _dumps(payload: Dict[str, Any]) -> str:
+    if orjson is not None:
+        return orjson.dumps(payload, default=str).decode()
+    return json.dumps(payload, default=str)
+
+class JSONFormatter(logging.Formatter):
+    """Renders structured events; runs on the listener thread, not the event loop"""
+    def format(self, record: logging.LogRecord) -> str:
+        payload = getattr(record, "payload", None)
+        if payload is None:
+            return super().format(record)
+        
+        event = {"timestamp": datetime.utcfromtimestamp(record.created).isoformat(), **payload}
+        request_data = event.pop("request_data", None)
+        if request_data is not None:
+            event["request_size"] = len(str(request_data))
+        return _dumps(event)
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Hands raw records to the listener thread, dropping them if the queue is full"""
+    dropped = 0
+    
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record  # Formatting happens on the listener thread
+    
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _DroppingQueueHandler.dropped += 1
+
+_log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+_output = logging.StreamHandler()
+_output.setFormatter(JSONFormatter())
+_listener = logging.handlers.QueueListener(_log_queue, _output, respect_handler_level=True)
+_listener.start()
+atexit.register(_listener.stop)
 
-logging.basicConfig(level=LOG_LEVEL)
 logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+logger.addHandler(_DroppingQueueHandler(_log_queue))
+logger.propagate = False
+
+def flush():
+    """Block until every queued log record has been written"""
+    _log_queue.join()
 
 class StructuredLogger:
-    @staticmethod
-    def log_request(job_id: str, request_data: dict):
-        logger.info(json.dumps({
-            "timestamp": datetime.utcnow().isoformat(),
-            "event": "request_received",
-            "job_id": job_id,
-            "request_size": len(str(request_data))
-        }))
+    """Structured JSON event logger.
     
-    @staticmethod
-    def log_response(job_id: str, latency: float, success: bool):
-        logger.info(json.dumps({
-            "timestamp": datetime.utcnow().isoformat(),
-            "event": "request_completed",
-            "job_id": job_id,
-            "latency_ms": latency * 1000,
-            "success": success
-        }))
+    Records are queued for a background listener thread, which timestamps,
+    encodes and writes them. Success events are sampled at ``sample_rate``
+    (consistently per job_id); error events are always kept.
+    """
+    def __init__(self, sample_rate: float = LOG_SUCCESS_SAMPLE_RATE):
+        self.sample_rate = sample_rate
+    
+    def _sampled(self, job_id: str) -> bool:
+        if self.sample_rate >= 1:
+            return True
+        return zlib.crc32(job_id.encode()) / 0xFFFFFFFF < self.sample_rate
+    
+    def log_request(self, job_id: str, request_data: dict):
+        if logger.isEnabledFor(logging.INFO) and self._sampled(job_id):
+            logger.info("request_received", extra={"payload": {
+                "event": "request_received",
+                "job_id": job_id,
+                "request_data": request_data
+            }})
+    
+    def log_response(self, job_id: str, latency: float, success: bool):
+        if logger.isEnabledFor(logging.INFO) and (not success or self._sampled(job_id)):
+            logger.info("request_completed", extra={"payload": {
+                "event": "request_completed",
+                "job_id": job_id,
+                "latency_ms": latency * 1000,
+                "success": success
+            }})
     
-    @staticmethod
-    def log_error(job_id: str, error: str):
-        logger.error(json.dumps({
-            "timestamp": datetime.utcnow().isoformat(),
+    def log_error(self, job_id: str, error: str):
+        logger.error("error", extra={"payload": {
             "event": "error",
             "job_id": job_id,
             "error": error
-        }))
\ No newline at end of file
+        }})
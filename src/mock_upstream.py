@@ -0,0 +1,257 @@
+import argparse
+import asyncio
+import json
+import math
+import random
+import re
+import time
+import uuid
+from io import BytesIO
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Union
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from PIL import Image, ImageDraw
+from src.upstream import IMAGE_TOKEN_ESTIMATE
+from src.config import (
+    parse_key_values, MOCK_UPSTREAM_PORT, MOCK_UPSTREAM_LATENCY, MOCK_UPSTREAM_TOKEN_LATENCY,
+    MOCK_UPSTREAM_FAILURES, MOCK_UPSTREAM_RETRY_AFTER, MOCK_UPSTREAM_RESPONSES
+)
+
+# Canned replies per call kind, in the formats OCRProcessor, LLMAnalyzer and the detector variants parse
+DEFAULT_RESPONSES = {
+    "ocr": "2x + 3 = 11\n2x = 8\nx = 4",
+    "diagram": "no",
+    "fused": json.dumps({"lines": ["2x + 3 = 11", "2x = 8", "x = 4"], "has_diagram": False}),
+    "analysis": (
+        "ERROR: No error found\n"
+        "CORRECTION: None needed\n"
+        "HINT: Substitute x = 4 back into the equation to check\n"
+        "COMPLETE: yes\n"
+        "CONFIDENCE: 0.9"
+    )
+}
+
+ERROR_TYPES = {429: "rate_limit_exceeded", 500: "server_error", 502: "bad_gateway", 503: "service_unavailable"}
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """Sampler for a latency spec in seconds: "fixed:s", "uniform:low:high" or "lognormal:median:sigma" """
+    kind, _, params = spec.partition(":")
+    try:
+        values = [float(value) for value in params.split(":")] if params else []
+    except ValueError:
+        raise ValueError(f"Invalid latency spec {spec!r}")
+    if kind == "fixed" and len(values) == 1:
+        return lambda rng: values[0]
+    if kind == "uniform" and len(values) == 2:
+        low, high = values
+        return lambda rng: rng.uniform(low, high)
+    if kind == "lognormal" and len(values) == 2 and values[0] > 0:
+        median, sigma = values
+        return lambda rng: rng.lognormvariate(math.log(median), sigma)
+    raise ValueError(f"Invalid latency spec {spec!r}: use fixed:s, uniform:low:high or lognormal:median:sigma")
+
+def call_kind(body: Dict[str, Any]) -> str:
+    """Which pipeline call a chat-completions request is: "ocr", "diagram", "fused" or "analysis" """
+    parts = []
+    for message in body.get("messages", []):
+        content = message.get("content")
+        if isinstance(content, list):
+            parts.extend(content)
+    if not any(part.get("type") == "image_url" for part in parts):
+        return "analysis"
+    if (body.get("response_format") or {}).get("type") == "json_object":
+        return "fused"
+    text = " ".join(part.get("text", "") for part in parts)
+    return "diagram" if "'yes' or 'no'" in text else "ocr"
+
+def estimate_prompt_tokens(body: Dict[str, Any]) -> int:
+    """~4 characters per text token plus a flat cost per image, as UpstreamClient estimates it"""
+    tokens = 0
+    for message in body.get("messages", []):
+        content = message.get("content")
+        parts = content if isinstance(content, list) else [{"type": "text", "text": content or ""}]
+        for part in parts:
+            if part.get("type") == "image_url":
+                tokens += IMAGE_TOKEN_ESTIMATE
+            else:
+                tokens += len(part.get("text", "")) // 4
+    return tokens
+
+class MockUpstream:
+    """Stand-in for the OpenAI chat-completions endpoint, for load tests.
+    
+    A call is rejected with status ``s`` at rate ``failures[s]``: 429s come back
+    at once with Retry-After, 5xx only after the sampled latency. Otherwise the
+    reply is the canned response for the call's kind, after a sampled time to
+    first token plus ``token_latency`` per completion token (spread across the
+    chunks of a streamed reply). A kind may have several canned responses, one
+    is picked at random.
+    """
+    def __init__(self, latency: str = "fixed:0", token_latency: float = 0.0,
+                 failures: Optional[Dict[int, float]] = None, retry_after: float = 1.0,
+                 responses: Optional[Dict[str, Union[str, List[str]]]] = None, seed: Optional[int] = None):
+        self.sample_latency = parse_latency(latency)
+        self.token_latency = token_latency
+        self.failures = {int(status): rate for status, rate in (failures or {}).items()}
+        if sum(self.failures.values()) > 1:
+            raise ValueError("Failure rates must add up to at most 1")
+        self.retry_after = retry_after
+        self.responses = {**DEFAULT_RESPONSES, **(responses or {})}
+        self.random = random.Random(seed)
+        self.image = self._placeholder_image()
+        self.stats = {"requests": 0, "streamed": 0, "calls": {}, "injected": {}}
+    
+    async def complete(self, body: Dict[str, Any]) -> Response:
+        """Response to one chat-completions request body"""
+        kind = call_kind(body)
+        self.stats["requests"] += 1
+        self.stats["calls"][kind] = self.stats["calls"].get(kind, 0) + 1
+        
+        status = self._injected_failure()
+        if status == 429:
+            return self._error(status)
+        await asyncio.sleep(self.sample_latency(self.random))
+        if status is not None:
+            return self._error(status)
+        
+        content = self._content(kind)
+        completion_tokens = max(1, len(content) // 4)
+        if body.get("max_tokens"):
+            completion_tokens = min(completion_tokens, body["max_tokens"])
+        prompt_tokens = estimate_prompt_tokens(body)
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                 "total_tokens": prompt_tokens + completion_tokens}
+        completion_id = f"chatcmpl-mock-{uuid.uuid4().hex[:12]}"
+        model = body.get("model", "mock")
+        
+        if body.get("stream"):
+            self.stats["streamed"] += 1
+            include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+            return StreamingResponse(
+                self._stream(completion_id, model, content, completion_tokens, usage if include_usage else None),
+                media_type="text/event-stream"
+            )
+        
+        await asyncio.sleep(completion_tokens * self.token_latency)
+        return JSONResponse({
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": content}}],
+            "usage": usage
+        })
+    
+    async def _stream(self, completion_id: str, model: str, content: str, completion_tokens: int,
+                      usage: Optional[Dict[str, int]]) -> AsyncIterator[str]:
+        pieces = re.findall(r"\S+\s*|\s+", content) or [""]
+        delay = completion_tokens * self.token_latency / len(pieces)
+        
+        def chunk(delta: Optional[Dict[str, str]], finish_reason: Optional[str] = None, **extra) -> str:
+            choices = [{"index": 0, "delta": delta, "finish_reason": finish_reason}] if delta is not None else []
+            payload = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                       "model": model, "choices": choices, **extra}
+            return f"data: {json.dumps(payload)}\n\n"
+        
+        yield chunk({"role": "assistant", "content": ""})
+        for piece in pieces:
+            await asyncio.sleep(delay)
+            yield chunk({"content": piece})
+        yield chunk({}, "stop")
+        if usage is not None:
+            # With include_usage the final chunk carries token counts and no choices
+            yield chunk(None, usage=usage)
+        yield "data: [DONE]\n\n"
+    
+    def _injected_failure(self) -> Optional[int]:
+        roll = self.random.random()
+        for status, rate in self.failures.items():
+            if roll < rate:
+                self.stats["injected"][status] = self.stats["injected"].get(status, 0) + 1
+                return status
+            roll -= rate
+        return None
+    
+    def _error(self, status: int) -> Response:
+        error_type = ERROR_TYPES.get(status, "server_error")
+        headers = {"retry-after": str(self.retry_after)} if status == 429 else None
+        return JSONResponse(
+            {"error": {"message": f"Injected {status} from mock upstream", "type": error_type, "code": error_type}},
+            status_code=status, headers=headers
+        )
+    
+    def _content(self, kind: str) -> str:
+        response = self.responses[kind]
+        return self.random.choice(response) if isinstance(response, list) else response
+    
+    @staticmethod
+    def _placeholder_image() -> bytes:
+        """A small handwritten-looking worksheet, so image fetches can stay local too"""
+        image = Image.new("L", (800, 600), 255)
+        draw = ImageDraw.Draw(image)
+        for row, line in enumerate(DEFAULT_RESPONSES["ocr"].split("\n")):
+            draw.text((60, 80 + row * 60), line, fill=0)
+        buffer = BytesIO()
+        image.save(buffer, format="JPEG", quality=80)
+        return buffer.getvalue()
+
+def load_responses(path: str) -> Dict[str, Union[str, List[str]]]:
+    """Canned responses from a JSON object mapping call kind to a reply or list of replies"""
+    if not path:
+        return {}
+    with open(path) as f:
+        responses = json.load(f)
+    unknown = set(responses) - set(DEFAULT_RESPONSES)
+    if unknown:
+        raise ValueError(f"Unknown call kinds in {path}: {', '.join(sorted(unknown))}")
+    return responses
+
+def create_app(upstream: MockUpstream) -> FastAPI:
+    app = FastAPI(title="Mock OpenAI upstream")
+    
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        return await upstream.complete(await request.json())
+    
+    @app.get("/images/{name}")
+    async def image(name: str):
+        """Placeholder image for any name, e.g. question_url=http://localhost:8100/images/q1.jpg"""
+        return Response(upstream.image, media_type="image/jpeg")
+    
+    @app.get("/stats")
+    async def stats():
+        return upstream.stats
+    
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock OpenAI-compatible upstream for load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=MOCK_UPSTREAM_PORT)
+    parser.add_argument("--latency", default=MOCK_UPSTREAM_LATENCY,
+                        help="Time to first token: fixed:s, uniform:low:high or lognormal:median:sigma")
+    parser.add_argument("--token-latency", type=float, default=MOCK_UPSTREAM_TOKEN_LATENCY,
+                        help="Extra seconds per completion token")
+    parser.add_argument("--failures", default=MOCK_UPSTREAM_FAILURES,
+                        help="Injected failure rate per status, e.g. 429:0.05,503:0.01")
+    parser.add_argument("--retry-after", type=float, default=MOCK_UPSTREAM_RETRY_AFTER)
+    parser.add_argument("--responses", default=MOCK_UPSTREAM_RESPONSES,
+                        help="JSON file of canned replies per call kind (ocr, diagram, fused, analysis)")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    
+    upstream = MockUpstream(
+        latency=args.latency,
+        token_latency=args.token_latency,
+        failures=parse_key_values(args.failures),
+        retry_after=args.retry_after,
+        responses=load_responses(args.responses),
+        seed=args.seed
+    )
+    print(f"Mock OpenAI upstream on http://{args.host}:{args.port}/v1 (set OPENAI_BASE_URL to use it)")
+    uvicorn.run(create_app(upstream), host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
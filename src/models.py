@@ -27,4 +27,43 @@ class DetectErrorResponse(BaseModel):
     solution_has_diagram: bool
     llm_used: bool
     solution_lines: Optional[List[str]] = None
-    llm_ocr_lines: Optional[List[str]] = None
\ No newline at end of file
+    llm_ocr_lines: Optional[List[str]] = None
+
+class PrepareQuestionRequest(BaseModel):
+    question_url: str
+
+class BulkPrepareItem(BaseModel):
+    question_id: str
+    question_url: str
+
+class BulkPrepareRequest(BaseModel):
+    questions: List[BulkPrepareItem]
+
+class PreparedQuestion(BaseModel):
+    question_id: str
+    question_url: str
+    prepared: bool
+    question_lines: List[str] = []
+    question_has_diagram: bool = False
+
+class BulkPrepareResponse(BaseModel):
+    results: List[PreparedQuestion]
+
+class BatchDetectErrorRequest(BaseModel):
+    requests: List[DetectErrorRequest]
+
+class BatchItemResult(BaseModel):
+    index: int
+    response: Optional[DetectErrorResponse] = None
+    error: Optional[str] = None
+
+class JobSubmission(BaseModel):
+    job_id: str
+    status: str
+
+class JobStatus(BaseModel):
+    job_id: str
+    status: str
+    submitted_at: Optional[str] = None
+    response: Optional[DetectErrorResponse] = None
+    error: Optional[str] = None
\ No newline at end of file
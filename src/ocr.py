@@ -1,52 +1,186 @@
-import requests
-from PIL import Image
-from io import BytesIO
-from typing import List, Tuple
-import openai
-from src.config import OPENAI_API_KEY
+import json
+from typing import Any, Awaitable, Callable, List, Optional, Tuple, Union
+from src.upstream import UpstreamClient
+from src.cache import OCRCache
+from src.singleflight import SingleFlight
+from src.images import ImageIngestor, PreparedImage, CropBox
+from src.accounting import record_image
+from src.deadline import DeadlineExceeded
+from src.logging import StructuredLogger
+from src.config import OCR_MODE, OCR_CACHE_ENABLED, OCR_CACHE_KEY, IMAGE_PREPROCESS
+
+FUSED_PROMPT = (
+    "Extract all mathematical text and equations from this image, one entry per line, "
+    "and say whether the image contains any diagrams, graphs, or geometric figures. "
+    'Respond with JSON only: {"lines": ["..."], "has_diagram": true or false}'
+)
+
+OCR_MODEL = "gpt-4.1-mini"
+
+# Bump when prompts or models change so stale cache entries are not reused
+CACHE_VERSION = "v1"
 
 class OCRProcessor:
-    def __init__(self):
-        self.client = openai.OpenAI(api_key=OPENAI_API_KEY)
+    def __init__(self, mode: str = OCR_MODE, cache: Union[OCRCache, bool, None] = None, cache_key: str = OCR_CACHE_KEY,
+                 preprocess: bool = IMAGE_PREPROCESS, images: Optional[ImageIngestor] = None):
+        if mode not in ("separate", "fused"):
+            raise ValueError(f"Unknown OCR mode: {mode}")
+        if cache_key not in ("url", "content"):
+            raise ValueError(f"Unknown OCR cache key: {cache_key}")
+        self.mode = mode
+        self.cache_key = cache_key
+        self.preprocess = preprocess
+        self.images = images or ImageIngestor()
+        # None picks the configured default cache, False turns caching off
+        if cache is False:
+            self.cache = None
+        elif cache is None:
+            self.cache = OCRCache() if OCR_CACHE_ENABLED else None
+        else:
+            self.cache = cache
+        self.client = UpstreamClient()
+        self.inflight = SingleFlight()
+        self.logger = StructuredLogger()
     
-    def extract_text_from_url(self, image_url: str) -> List[str]:
+    async def extract_text_from_url(self, image_url: str, crop: Optional[CropBox] = None) -> List[str]:
         """Extract text from image URL using OpenAI Vision API"""
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4.1-mini",
-                messages=[{
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": "Extract all mathematical text and equations from this image. Return each line separately."},
-                        {"type": "image_url", "image_url": {"url": image_url}}
-                    ]
-                }],
-                max_tokens=500
-            )
-            
-            text = response.choices[0].message.content
-            return [line.strip() for line in text.split('\n') if line.strip()]
-        
+            return await self._cached("text", image_url, self._extract_text, crop)
+        except DeadlineExceeded:
+            raise  # Let the pipeline tell a timed-out stage from an empty image
         except Exception as e:
             print(f"OCR error: {e}")
             return []
     
-    def has_diagram(self, image_url: str) -> bool:
+    async def has_diagram(self, image_url: str, crop: Optional[CropBox] = None) -> bool:
         """Check if image contains diagrams/graphs"""
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4.1-mini",
-                messages=[{
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": "Does this image contain any diagrams, graphs, or geometric figures? Answer only 'yes' or 'no'."},
-                        {"type": "image_url", "image_url": {"url": image_url}}
-                    ]
-                }],
-                max_tokens=10
-            )
-            
-            return response.choices[0].message.content.lower().strip() == "yes"
-        
+            return await self._cached("diagram", image_url, self._detect_diagram, crop)
+        except DeadlineExceeded:
+            raise
         except Exception:
-            return False
\ No newline at end of file
+            return False
+    
+    async def analyze_image(self, image_url: str, crop: Optional[CropBox] = None) -> Tuple[List[str], bool]:
+        """Extract text lines and detect diagrams with a single structured vision call"""
+        try:
+            lines, has_diagram = await self._cached("fused", image_url, self._analyze_fused, crop)
+            return lines, has_diagram
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            print(f"OCR error: {e}")
+            return [], False
+    
+    async def _cached(self, kind: str, image_url: str, compute: Callable[[str], Awaitable[Any]],
+                      crop: Optional[CropBox] = None) -> Any:
+        """Serve a vision result from cache, computing and storing it on a miss.
+        
+        Concurrent requests for the same image share one lookup and upstream call.
+        Failures raise out of ``compute`` and are therefore never cached.
+        """
+        return await self.inflight.do((kind, image_url, crop), lambda: self._lookup(kind, image_url, compute, crop))
+    
+    async def _lookup(self, kind: str, image_url: str, compute: Callable[[str], Awaitable[Any]],
+                      crop: Optional[CropBox] = None) -> Any:
+        image = None
+        if self.cache is not None:
+            if self.cache_key == "content":
+                image = await self._ingest(image_url, crop)
+            key = self._cache_key_for(kind, image_url, image, crop)
+            value = await self.cache.lookup(key)
+            if value is not None:
+                return value
+        
+        # Only fetch and downscale locally once we know the vision call is needed
+        if image is None and (self.preprocess or crop is not None):
+            image = await self._ingest(image_url, crop)
+        send_local = image is not None and (self.preprocess or crop is not None)
+        payload_url = image.data_url if send_local else image_url
+        
+        value = await compute(payload_url)
+        if send_local:
+            # Image tokens can only be estimated when we know the dimensions we sent
+            record_image(OCR_MODEL, image.width, image.height)
+        if self.cache is not None:
+            await self.cache.store(key, value)
+        return value
+    
+    async def _ingest(self, image_url: str, crop: Optional[CropBox] = None) -> Optional[PreparedImage]:
+        """Fetch and prepare the image locally; None means fall back to the remote URL.
+        
+        A crop can only be sent as a locally prepared image, so ingestion errors
+        for cropped requests propagate to the caller.
+        """
+        if crop is not None:
+            return await self.images.prepare(image_url, crop)
+        try:
+            return await self.images.prepare(image_url)
+        except Exception as e:
+            # No job_id reaches the OCR layer; the image URL identifies what failed
+            self.logger.log_error(image_url, f"Image ingestion error: {e}")
+            return None
+    
+    def _cache_key_for(self, kind: str, image_url: str, image: Optional[PreparedImage] = None,
+                       crop: Optional[CropBox] = None) -> str:
+        """Cache key from the URL, or from a hash of the image bytes in content mode"""
+        region = f"#crop={','.join(str(v) for v in crop)}" if crop is not None else ""
+        if self.cache_key == "content" and image is not None:
+            return f"{CACHE_VERSION}:{kind}:sha256:{image.sha256}{region}"
+        return f"{CACHE_VERSION}:{kind}:url:{image_url}{region}"
+    
+    async def _extract_text(self, image_url: str) -> List[str]:
+        response = await self.client.create_chat_completion(
+            model=OCR_MODEL,
+            messages=[{
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": "Extract all mathematical text and equations from this image. Return each line separately."},
+                    {"type": "image_url", "image_url": {"url": image_url}}
+                ]
+            }],
+            max_tokens=500
+        )
+        
+        text = response.choices[0].message.content
+        return [line.strip() for line in text.split('\n') if line.strip()]
+    
+    async def _detect_diagram(self, image_url: str) -> bool:
+        response = await self.client.create_chat_completion(
+            model=OCR_MODEL,
+            messages=[{
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": "Does this image contain any diagrams, graphs, or geometric figures? Answer only 'yes' or 'no'."},
+                    {"type": "image_url", "image_url": {"url": image_url}}
+                ]
+            }],
+            max_tokens=10
+        )
+        
+        return response.choices[0].message.content.lower().strip() == "yes"
+    
+    async def _analyze_fused(self, image_url: str) -> Tuple[List[str], bool]:
+        response = await self.client.create_chat_completion(
+            model=OCR_MODEL,
+            messages=[{
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": FUSED_PROMPT},
+                    {"type": "image_url", "image_url": {"url": image_url}}
+                ]
+            }],
+            response_format={"type": "json_object"},
+            max_tokens=510
+        )
+        
+        return self._parse_fused(response.choices[0].message.content)
+    
+    def _parse_fused(self, content: str) -> Tuple[List[str], bool]:
+        """Parse the fused JSON payload, degrading to plain lines if it is malformed"""
+        try:
+            data = json.loads(content)
+            lines = [str(line).strip() for line in data.get("lines", []) if str(line).strip()]
+            return lines, data.get("has_diagram") is True
+        except (ValueError, AttributeError):
+            return [line.strip() for line in content.split('\n') if line.strip()], False
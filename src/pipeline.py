@@ -0,0 +1,120 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+from src.deadline import Deadline
+
+_REQUIRED = object()
+
+class Stage:
+    """A named unit of pipeline work with explicit dependencies.
+
+    ``func`` receives the results of the stages listed in ``deps`` and returns an
+    awaitable. A stage with a ``default`` is optional: if it fails, the error is
+    recorded and the default is handed to its dependents instead. An optional
+    stage with ``min_budget`` is skipped outright (yielding its default) when
+    less than that many seconds of the run's deadline remain as it starts.
+    """
+    def __init__(self, name: str, func: Callable[[Dict[str, Any]], Awaitable[Any]],
+                 deps: Iterable[str] = (), default: Any = _REQUIRED, min_budget: float = 0.0):
+        if min_budget and default is _REQUIRED:
+            raise ValueError(f"Stage '{name}' needs a default to be skippable")
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+        self.default = default
+        self.min_budget = min_budget
+    
+    @property
+    def required(self) -> bool:
+        return self.default is _REQUIRED
+
+class PipelineRun:
+    """Outcome of a pipeline run: stage results, isolated stage errors and stages skipped for budget"""
+    def __init__(self):
+        self.results: Dict[str, Any] = {}
+        self.errors: Dict[str, Exception] = {}
+        self.skipped: List[str] = []
+
+class StagePipeline:
+    """Runs a small dependency graph of async stages.
+
+    Every stage starts as soon as all of its dependencies have finished, so
+    independent stages are fanned out concurrently.
+    """
+    def __init__(self, stages: List[Stage]):
+        self.stages = self._topological_order(stages)
+    
+    @staticmethod
+    def _topological_order(stages: List[Stage]) -> List[Stage]:
+        """Order stages so dependencies come first, rejecting unknown deps and cycles"""
+        by_name = {stage.name: stage for stage in stages}
+        if len(by_name) != len(stages):
+            raise ValueError("Duplicate stage names in pipeline")
+        
+        ordered = []
+        state: Dict[str, str] = {}
+        
+        def visit(stage: Stage):
+            if state.get(stage.name) == "done":
+                return
+            if state.get(stage.name) == "visiting":
+                raise ValueError(f"Dependency cycle at stage '{stage.name}'")
+            state[stage.name] = "visiting"
+            for dep in stage.deps:
+                if dep not in by_name:
+                    raise ValueError(f"Stage '{stage.name}' depends on unknown stage '{dep}'")
+                visit(by_name[dep])
+            state[stage.name] = "done"
+            ordered.append(stage)
+        
+        for stage in stages:
+            visit(stage)
+        return ordered
+    
+    async def run(self, on_error: Optional[Callable[[str, Exception], None]] = None,
+                  on_complete: Optional[Callable[[str, Any], None]] = None,
+                  deadline: Optional[Deadline] = None) -> PipelineRun:
+        """Run all stages; a failing required stage cancels the rest and re-raises.
+        
+        ``on_complete`` is called with each stage's result (or default) as soon as it is known.
+        With a ``deadline``, every stage is cancelled when it expires, so optional
+        stages fall back to their defaults and a required one raises DeadlineExceeded.
+        """
+        run = PipelineRun()
+        tasks: Dict[str, asyncio.Task] = {}
+        
+        async def run_stage(stage: Stage):
+            if stage.deps:
+                await asyncio.gather(*(tasks[dep] for dep in stage.deps))
+            inputs = {dep: run.results[dep] for dep in stage.deps}
+            try:
+                if deadline is None:
+                    value = await stage.func(inputs)
+                elif stage.min_budget and deadline.remaining() < stage.min_budget:
+                    run.skipped.append(stage.name)
+                    value = stage.default
+                else:
+                    value = await deadline.run(stage.func(inputs))
+            except Exception as e:
+                if stage.required:
+                    raise
+                run.errors[stage.name] = e
+                if on_error:
+                    on_error(stage.name, e)
+                value = stage.default
+            run.results[stage.name] = value
+            if on_complete:
+                on_complete(stage.name, value)
+            return value
+        
+        for stage in self.stages:
+            tasks[stage.name] = asyncio.create_task(run_stage(stage))
+        
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+        
+        return run
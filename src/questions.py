@@ -0,0 +1,64 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from src.config import QUESTION_INDEX_PATH
+
+class QuestionIndex:
+    """Pre-computed OCR and diagram results for questions, keyed by question_id.
+
+    Entries are written by the prepare endpoints and consulted by ErrorDetector
+    before any vision call is made for the question image. Code on the event
+    loop uses ``lookup``/``store``, which run SQLite on a worker thread.
+    """
+    def __init__(self, db_path: str = QUESTION_INDEX_PATH):
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(db_path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS questions ("
+            "question_id TEXT PRIMARY KEY, question_url TEXT NOT NULL, lines TEXT NOT NULL, "
+            "has_diagram INTEGER NOT NULL, prepared_at TEXT NOT NULL)"
+        )
+        self.db.commit()
+    
+    def put(self, question_id: str, question_url: str, lines: List[str], has_diagram: bool):
+        """Store (or replace) the prepared results for a question"""
+        with self._lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO questions (question_id, question_url, lines, has_diagram, prepared_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (question_id, question_url, json.dumps(lines), int(has_diagram), datetime.utcnow().isoformat())
+            )
+            self.db.commit()
+    
+    def get(self, question_id: str, question_url: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Look up a prepared question; a different question_url means the entry is stale"""
+        with self._lock:
+            row = self.db.execute(
+                "SELECT question_url, lines, has_diagram, prepared_at FROM questions WHERE question_id = ?",
+                (question_id,)
+            ).fetchone()
+        if row is None or (question_url is not None and row[0] != question_url):
+            return None
+        return {
+            "question_id": question_id,
+            "question_url": row[0],
+            "lines": json.loads(row[1]),
+            "has_diagram": bool(row[2]),
+            "prepared_at": row[3]
+        }
+    
+    async def lookup(self, question_id: str, question_url: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """``get`` for the event loop"""
+        return await asyncio.to_thread(self.get, question_id, question_url)
+    
+    async def store(self, question_id: str, question_url: str, lines: List[str], has_diagram: bool):
+        """``put`` for the event loop"""
+        await asyncio.to_thread(self.put, question_id, question_url, lines, has_diagram)
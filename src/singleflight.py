@@ -0,0 +1,45 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+from src import deadline as deadlines
+
+class SingleFlight:
+    """Coalesces concurrent calls that share a key onto one in-flight upstream call.
+
+    The first caller for a key starts the work; callers arriving while it is
+    still running await the same future instead of issuing a duplicate. The
+    shared task is shielded, so one caller being cancelled does not cancel the
+    work for the others, and it runs without the first caller's deadline:
+    each caller waits for it within its own.
+    """
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.stats = {"calls": 0, "executions": 0, "coalesced": 0}
+    
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        """Run ``func`` once per key at a time and share its result"""
+        self.stats["calls"] += 1
+        future = self._inflight.get(key)
+        if future is not None:
+            self.stats["coalesced"] += 1
+            return await deadlines.wait(future)
+        
+        future = deadlines.detached(func())
+        self._inflight[key] = future
+        self.stats["executions"] += 1
+        future.add_done_callback(lambda done: self._finish(key, done))
+        return await deadlines.wait(future)
+    
+    def _finish(self, key: Hashable, future: asyncio.Future):
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+        if not future.cancelled():
+            future.exception()  # Mark retrieved so abandoned failures are not reported as unhandled
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Call counters plus the number of keys currently in flight"""
+        calls = self.stats["calls"]
+        return {
+            **self.stats,
+            "coalesced_rate": self.stats["coalesced"] / calls if calls else 0.0,
+            "in_flight": len(self._inflight)
+        }
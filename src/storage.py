@@ -1,30 +1,295 @@
+import argparse
+import atexit
 import json
 import os
-from datetime import datetime
-from typing import Dict, Any
+import queue
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Any, Iterator, List, Optional, Union
+from src.logging import StructuredLogger
+from src.config import AUDIT_BATCH_SIZE, AUDIT_FLUSH_INTERVAL, AUDIT_RETENTION_DAYS
+
+# Request fields with a secondary index, for per-key scans and deletions
+INDEXED_FIELDS = ("user_id", "session_id", "question_id")
+
+Timestamp = Union[str, datetime]
 
 class SimpleStorage:
-    def __init__(self, storage_dir: str = "data/requests"):
+    """Audit log of request/response records.
+    
+    Records are appended to a SQLite database in WAL mode (``audit.sqlite3`` in
+    ``storage_dir``) with ``job_id`` as the primary key. Saving only enqueues
+    the record; a background writer thread batches records into a single
+    transaction, so the request path never waits on disk I/O. Records that are
+    still queued are served from memory, and per-job JSON files written by
+    older versions are still readable.
+    
+    ``user_id``, ``session_id``, ``question_id`` and ``timestamp`` are indexed,
+    so per-key and time-range scans, GDPR deletions and retention do not need
+    to read every record.
+    """
+    def __init__(self, storage_dir: str = "data/requests", batch_size: int = AUDIT_BATCH_SIZE,
+                 flush_interval: float = AUDIT_FLUSH_INTERVAL, max_write_attempts: int = 3):
         self.storage_dir = storage_dir
         os.makedirs(storage_dir, exist_ok=True)
+        self.db_path = os.path.join(storage_dir, "audit.sqlite3")
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_write_attempts = max_write_attempts
+        self.logger = StructuredLogger()
+        
+        self.db = self._connect()
+        self._create_schema()
+        self._read_lock = threading.Lock()
+        
+        self._pending: Dict[str, Dict[Any, Any]] = {}
+        self._pending_lock = threading.Lock()
+        self._queue: "queue.Queue[Optional[Dict[Any, Any]]]" = queue.Queue()
+        self._write_attempts: Dict[str, int] = {}
+        # Opened here so a missing or unwritable directory fails the constructor, not the thread
+        self._writer_db = self._connect()
+        self._writer = threading.Thread(target=self._write_loop, name="audit-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+    
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
     
-    def save_request_response(self, job_id: str, request_data: Dict[Any, Any], response_data: Dict[Any, Any]):
-        """Save request and response for auditing"""
+    def _create_schema(self):
+        """Create the audit table and indexes, adding index columns to older databases"""
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS audit (job_id TEXT PRIMARY KEY, timestamp TEXT NOT NULL, record TEXT NOT NULL)"
+        )
+        columns = {row[1] for row in self.db.execute("PRAGMA table_info(audit)")}
+        for field in INDEXED_FIELDS:
+            if field not in columns:
+                self.db.execute(f"ALTER TABLE audit ADD COLUMN {field} TEXT")
+                self.db.execute(f"UPDATE audit SET {field} = json_extract(record, '$.request.{field}')")
+        self.db.execute("CREATE INDEX IF NOT EXISTS audit_timestamp ON audit (timestamp)")
+        for field in INDEXED_FIELDS:
+            self.db.execute(f"CREATE INDEX IF NOT EXISTS audit_{field} ON audit ({field}, timestamp)")
+        self.db.commit()
+    
+    def save_request_response(self, job_id: str, request_data: Dict[Any, Any], response_data: Dict[Any, Any],
+                              usage: Optional[Dict[str, Any]] = None, timestamp: Optional[Timestamp] = None,
+                              error: Optional[str] = None):
+        """Save request and response (and upstream token usage, or why processing failed) for auditing,
+        queued for the background writer"""
+        timestamp = timestamp or datetime.utcnow()
         record = {
             "job_id": job_id,
-            "timestamp": datetime.utcnow().isoformat(),
+            "timestamp": timestamp.isoformat() if isinstance(timestamp, datetime) else timestamp,
             "request": request_data,
             "response": response_data
         }
+        if usage is not None:
+            record["usage"] = usage
+        if error is not None:
+            record["error"] = error
         
-        filepath = os.path.join(self.storage_dir, f"{job_id}.json")
-        with open(filepath, 'w') as f:
-            json.dump(record, f, indent=2)
+        with self._pending_lock:
+            self._pending[job_id] = record
+        self._queue.put(record)
     
     def get_record(self, job_id: str) -> Dict[Any, Any]:
         """Retrieve stored record"""
+        with self._pending_lock:
+            record = self._pending.get(job_id)
+        if record is not None:
+            return record
+        
+        with self._read_lock:
+            row = self.db.execute("SELECT record FROM audit WHERE job_id = ?", (job_id,)).fetchone()
+        if row is not None:
+            return json.loads(row[0])
+        
+        # Records written before the audit log existed
         filepath = os.path.join(self.storage_dir, f"{job_id}.json")
         if os.path.exists(filepath):
             with open(filepath, 'r') as f:
                 return json.load(f)
-        return {}
\ No newline at end of file
+        return {}
+    
+    def iter_records(self, start: Optional[Timestamp] = None, end: Optional[Timestamp] = None) -> Iterator[Dict[Any, Any]]:
+        """Stream records with start <= timestamp < end, oldest first"""
+        yield from self._scan(None, None, start, end)
+    
+    def iter_by(self, field: str, value: str, start: Optional[Timestamp] = None,
+                end: Optional[Timestamp] = None) -> Iterator[Dict[Any, Any]]:
+        """Stream records for one user_id, session_id or question_id, oldest first"""
+        if field not in INDEXED_FIELDS:
+            raise ValueError(f"Field {field} is not indexed; choose one of {INDEXED_FIELDS}")
+        yield from self._scan(field, value, start, end)
+    
+    def delete_by(self, field: str, value: str) -> int:
+        """Delete every record for a user_id, session_id or question_id (e.g. GDPR erasure)"""
+        if field not in INDEXED_FIELDS:
+            raise ValueError(f"Field {field} is not indexed; choose one of {INDEXED_FIELDS}")
+        self.flush()
+        # Legacy per-job files are not indexed: merge them into the log so their records are erased too
+        self._import_legacy_files()
+        with self._read_lock, self.db:
+            return self.db.execute(f"DELETE FROM audit WHERE {field} = ?", (value,)).rowcount
+    
+    def compact(self, retention_days: Optional[float] = AUDIT_RETENTION_DAYS) -> Dict[str, int]:
+        """Merge legacy per-job JSON files into the log, expire old records and reclaim space.
+        
+        ``retention_days`` of 0 or None keeps records forever.
+        """
+        self.flush()
+        imported = self._import_legacy_files()
+        expired = 0
+        with self._read_lock:
+            if retention_days:
+                cutoff = (datetime.utcnow() - timedelta(days=retention_days)).isoformat()
+                with self.db:
+                    expired = self.db.execute("DELETE FROM audit WHERE timestamp < ?", (cutoff,)).rowcount
+            self.db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self.db.execute("VACUUM")
+        return {"imported": imported, "expired": expired}
+    
+    def _scan(self, field: Optional[str], value: Optional[str], start: Optional[Timestamp],
+              end: Optional[Timestamp]) -> Iterator[Dict[Any, Any]]:
+        """Run an indexed scan on its own connection, fetching rows in chunks"""
+        clauses, params = [], []
+        if field is not None:
+            clauses.append(f"{field} = ?")
+            params.append(value)
+        if start is not None:
+            clauses.append("timestamp >= ?")
+            params.append(start.isoformat() if isinstance(start, datetime) else start)
+        if end is not None:
+            clauses.append("timestamp < ?")
+            params.append(end.isoformat() if isinstance(end, datetime) else end)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        
+        self.flush()
+        db = self._connect()
+        try:
+            cursor = db.execute(f"SELECT record FROM audit{where} ORDER BY timestamp", params)
+            while True:
+                rows = cursor.fetchmany(500)
+                if not rows:
+                    break
+                for row in rows:
+                    yield json.loads(row[0])
+        finally:
+            db.close()
+    
+    def _import_legacy_files(self) -> int:
+        """Move per-job JSON files from the old storage format into the audit log"""
+        paths = [os.path.join(self.storage_dir, name) for name in os.listdir(self.storage_dir) if name.endswith(".json")]
+        records = []
+        for path in paths:
+            with open(path, 'r') as f:
+                records.append(json.load(f))
+        if records:
+            with self._read_lock:
+                self._write_batch(self.db, records)
+            for path in paths:
+                os.remove(path)
+        return len(records)
+    
+    def flush(self):
+        """Block until every queued record has been written"""
+        self._queue.join()
+    
+    def close(self):
+        """Flush queued records and stop the writer thread"""
+        if self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join()
+    
+    def _write_loop(self):
+        db = self._writer_db
+        stopping = False
+        while not stopping:
+            batch: List[Dict[Any, Any]] = []
+            item = self._queue.get()
+            # Gather whatever else arrives within the flush interval into the same transaction
+            while item is not None:
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    break
+            stopping = item is None
+            
+            try:
+                if batch:
+                    self._write_batch(db, batch)
+                    for record in batch:
+                        self._write_attempts.pop(record["job_id"], None)
+            except sqlite3.Error as e:
+                # Keep the writer alive; unwritten records stay readable from memory until given up on
+                self._write_failed(batch, e, retry=not stopping)
+            finally:
+                for _ in range(len(batch) + (1 if stopping else 0)):
+                    self._queue.task_done()
+        db.close()
+    
+    def _write_failed(self, batch: List[Dict[Any, Any]], error: sqlite3.Error, retry: bool):
+        """Requeue records from a failed batch, dropping those that failed ``max_write_attempts`` times"""
+        dropped = []
+        for record in batch:
+            attempts = self._write_attempts.get(record["job_id"], 0) + 1
+            if retry and attempts < self.max_write_attempts:
+                self._write_attempts[record["job_id"]] = attempts
+                self._queue.put(record)
+            else:
+                self._write_attempts.pop(record["job_id"], None)
+                dropped.append(record)
+        with self._pending_lock:
+            for record in dropped:
+                if self._pending.get(record["job_id"]) is record:
+                    del self._pending[record["job_id"]]
+        self.logger.log_error(
+            batch[0]["job_id"],
+            f"Audit log write failed for {len(batch)} records, {len(dropped)} dropped: {error}"
+        )
+    
+    def _write_batch(self, db: sqlite3.Connection, batch: List[Dict[Any, Any]]):
+        rows = []
+        for r in batch:
+            request = r.get("request") or {}
+            rows.append((
+                r["job_id"], r["timestamp"], json.dumps(r, separators=(",", ":")),
+                *(request.get(field) for field in INDEXED_FIELDS)
+            ))
+        with db:
+            db.executemany(
+                "INSERT OR REPLACE INTO audit (job_id, timestamp, record, user_id, session_id, question_id) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+        with self._pending_lock:
+            for record in batch:
+                if self._pending.get(record["job_id"]) is record:
+                    del self._pending[record["job_id"]]
+
+def main():
+    parser = argparse.ArgumentParser(description="Audit log maintenance")
+    parser.add_argument("command", choices=["compact", "delete-user"])
+    parser.add_argument("--storage-dir", default="data/requests")
+    parser.add_argument("--retention-days", type=float, default=AUDIT_RETENTION_DAYS,
+                        help="Expire records older than this many days (0 keeps everything)")
+    parser.add_argument("--user-id", help="User whose records to delete (delete-user)")
+    args = parser.parse_args()
+    
+    storage = SimpleStorage(args.storage_dir)
+    if args.command == "compact":
+        print(json.dumps(storage.compact(args.retention_days)))
+    else:
+        if not args.user_id:
+            parser.error("delete-user requires --user-id")
+        print(json.dumps({"deleted": storage.delete_by("user_id", args.user_id)}))
+    storage.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+import asyncio
+import functools
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+from src.histogram import LatencyHistogram, DEFAULT_QUANTILES
+
+# Upper bounds (seconds) of the exported Prometheus histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+METRIC_HELP = {
+    "error_detection_stage_duration_seconds": "Duration of each error detection pipeline stage",
+    "error_detection_request_duration_seconds": "End-to-end duration of ErrorDetector.detect_error",
+    "error_detection_stages_skipped_total": "Optional pipeline stages skipped because too little of the request deadline remained",
+    "http_request_duration_seconds": "HTTP request duration by route and status",
+    "http_requests_in_flight": "HTTP requests currently being served",
+    "semaphore_in_use": "Concurrency slots currently held",
+    "semaphore_waiting": "Requests queued for a concurrency slot",
+    "job_queue_depth": "Jobs waiting for a worker",
+    "admission_limit": "Current adaptive concurrency limit for detection requests",
+    "admission_in_flight": "Detection requests holding an admission slot",
+    "admission_queued": "Detection requests waiting in the per-tenant fair queues",
+    "upstream_calls_total": "Upstream model calls by pipeline stage and model",
+    "upstream_tokens_total": "Upstream tokens by pipeline stage, model and type (image tokens are estimated and part of prompt)",
+    "upstream_cost_usd_total": "Estimated upstream spend in USD by pipeline stage and model",
+    "upstream_retries_total": "Upstream calls retried after a rate limit, 5xx or connection error",
+    "upstream_rejected_total": "Upstream calls rejected without being sent because the model's circuit was open",
+    "upstream_hedges_fired_total": "Duplicate upstream requests sent because the first one was slower than usual",
+    "upstream_hedges_won_total": "Duplicate upstream requests that answered before the original",
+    "upstream_throttled_seconds_total": "Time spent waiting for the outbound requests/min and tokens/min limits",
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+# Stage timings of the request being served, for its Server-Timing header
+_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("timings", default=None)
+
+class Telemetry:
+    """Process-wide histograms and gauges, rendered in Prometheus text format"""
+    def __init__(self):
+        self.histograms: Dict[str, Dict[Labels, LatencyHistogram]] = {}
+        self.gauges: Dict[str, Dict[Labels, float]] = {}
+        self.counters: Dict[str, Dict[Labels, float]] = {}
+        self.gauge_callbacks: Dict[str, Callable[[], Dict[Labels, float]]] = {}
+    
+    def observe(self, name: str, value: float, **labels: str):
+        series = self.histograms.setdefault(name, {})
+        key = tuple(sorted(labels.items()))
+        if key not in series:
+            series[key] = LatencyHistogram()
+        series[key].record(value)
+    
+    def inc(self, name: str, amount: float = 1, **labels: str):
+        """Increase a monotonic counter"""
+        series = self.counters.setdefault(name, {})
+        key = tuple(sorted(labels.items()))
+        series[key] = series.get(key, 0) + amount
+    
+    def add(self, name: str, delta: float, **labels: str):
+        """Move a gauge up or down"""
+        series = self.gauges.setdefault(name, {})
+        key = tuple(sorted(labels.items()))
+        series[key] = series.get(key, 0) + delta
+    
+    def register_gauge(self, name: str, func: Callable[[], float], **labels: str):
+        """Gauge whose value is read from ``func`` at scrape time"""
+        key = tuple(sorted(labels.items()))
+        previous = self.gauge_callbacks.get(name)
+        self.gauge_callbacks[name] = lambda: {**(previous() if previous else {}), key: func()}
+    
+    def percentiles(self, name: str) -> Dict[str, Dict[str, float]]:
+        """p50-p99.9 of each series of a histogram, keyed by its label values"""
+        return {
+            ",".join(value for _, value in labels) or name: {
+                f"p{q * 100:g}": histogram.percentile(q) for q in DEFAULT_QUANTILES
+            }
+            for labels, histogram in self.histograms.get(name, {}).items()
+        }
+    
+    def render(self) -> str:
+        lines: List[str] = []
+        for name, series in sorted(self.histograms.items()):
+            self._header(lines, name, "histogram")
+            for labels, histogram in series.items():
+                for bound in LATENCY_BUCKETS:
+                    count = histogram.count_at_or_below(bound)
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', repr(bound)),))} {count}")
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {histogram.count}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {histogram.sum}")
+                lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+        for name, series in sorted(self.counters.items()):
+            self._header(lines, name, "counter")
+            for labels, value in series.items():
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+        gauges = {name: dict(series) for name, series in self.gauges.items()}
+        for name, callback in self.gauge_callbacks.items():
+            gauges.setdefault(name, {}).update(callback())
+        for name, series in sorted(gauges.items()):
+            self._header(lines, name, "gauge")
+            for labels, value in series.items():
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+    
+    @staticmethod
+    def _header(lines: List[str], name: str, kind: str):
+        if name in METRIC_HELP:
+            lines.append(f"# HELP {name} {METRIC_HELP[name]}")
+        lines.append(f"# TYPE {name} {kind}")
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + "}"
+
+telemetry = Telemetry()
+
+def start_request() -> Dict[str, float]:
+    """Begin collecting stage timings for the current request (and the tasks it spawns)"""
+    timings: Dict[str, float] = {}
+    _timings.set(timings)
+    return timings
+
+def record_span(name: str, seconds: float):
+    telemetry.observe("error_detection_stage_duration_seconds", seconds, stage=name)
+    timings = _timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """Time a block as a named stage"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, time.perf_counter() - start)
+
+def timed(name: str, func: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+    """Wrap an async function so each call is recorded as a span"""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        with span(name):
+            return await func(*args, **kwargs)
+    return wrapper
+
+def server_timing(timings: Dict[str, float]) -> str:
+    """Server-Timing header value, durations in milliseconds"""
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items())
+
+class TrackedSemaphore:
+    """asyncio.Semaphore that reports held and waiting slots as gauges"""
+    def __init__(self, name: str, value: int):
+        self.semaphore = asyncio.Semaphore(value)
+        self.in_use = 0
+        self.waiting = 0
+        telemetry.register_gauge("semaphore_in_use", lambda: self.in_use, pool=name)
+        telemetry.register_gauge("semaphore_waiting", lambda: self.waiting, pool=name)
+    
+    async def __aenter__(self):
+        self.waiting += 1
+        try:
+            await self.semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_use += 1
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        self.in_use -= 1
+        self.semaphore.release()
@@ -0,0 +1,133 @@
+import asyncio
+import httpx
+import openai
+from typing import Any, AsyncIterator, Dict, Optional
+from src.accounting import record_call
+from src import deadline as deadlines
+from src.governor import UpstreamGovernor, default_governor
+from src.hedging import Hedger, default_hedger
+from src import cassette
+from src.config import (
+    OPENAI_API_KEY, OPENAI_USE_SYNC_CLIENT, HEDGING_ENABLED, OPENAI_CASSETTE_MODE,
+    OPENAI_BASE_URL
+)
+
+# Rough prompt-token estimate per image part, for tokens/min throttling before the real usage is known
+IMAGE_TOKEN_ESTIMATE = 1000
+
+class UpstreamClient:
+    """Chat-completions client used by the OCR, LLM and detector variant stages.
+
+    Calls go through AsyncOpenAI so a slow upstream never blocks the event loop.
+    The synchronous client is only used when explicitly requested, and is then
+    run on a worker thread. Rate limiting, retries and circuit breaking are
+    left to the shared UpstreamGovernor rather than the SDK. With hedging
+    enabled, slow non-streaming calls are raced against a duplicate. With a
+    cassette mode configured, HTTP traffic is recorded or replayed underneath.
+    """
+    def __init__(self, use_sync: bool = OPENAI_USE_SYNC_CLIENT, governor: Optional[UpstreamGovernor] = None,
+                 hedger: Optional[Hedger] = None):
+        self.use_sync = use_sync
+        # Replaying needs no real key, but the SDK refuses to start without one
+        api_key = OPENAI_API_KEY or ("cassette-replay" if OPENAI_CASSETTE_MODE == "replay" else None)
+        if use_sync:
+            http_client = None
+            if cassette.enabled():
+                http_client = openai.DefaultHttpxClient(transport=cassette.sync_transport(
+                    httpx.HTTPTransport(limits=openai.DEFAULT_CONNECTION_LIMITS)))
+            self.client = openai.OpenAI(api_key=api_key, base_url=OPENAI_BASE_URL, max_retries=0,
+                                        http_client=http_client)
+        else:
+            http_client = None
+            if cassette.enabled():
+                http_client = openai.DefaultAsyncHttpxClient(transport=cassette.async_transport(
+                    httpx.AsyncHTTPTransport(limits=openai.DEFAULT_CONNECTION_LIMITS)))
+            self.client = openai.AsyncOpenAI(api_key=api_key, base_url=OPENAI_BASE_URL, max_retries=0,
+                                             http_client=http_client)
+        self.governor = governor or default_governor()
+        self.hedger = hedger or (default_hedger() if HEDGING_ENABLED else None)
+        self.usage = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0}
+    
+    async def create_chat_completion(self, **kwargs):
+        """Create a chat completion without blocking the event loop"""
+        model = kwargs.get("model")
+        estimate = self._estimate_tokens(kwargs)
+        deadline = deadlines.current()
+        
+        async def create():
+            if deadline is None:
+                return await self._create(kwargs)
+            # The HTTP timeout also bounds the blocking client, whose worker thread cannot be cancelled
+            deadline.check()
+            return await deadline.run(self._create({**kwargs, "timeout": deadline.remaining()}))
+        
+        if self.hedger is None:
+            response = await self.governor.call(model, estimate, create)
+        else:
+            # Calls of one kind (e.g. OCR text vs diagram yes/no) have very different latency
+            response = await self.hedger.run(
+                f"{model}:{kwargs.get('max_tokens')}", lambda: self.governor.call(model, estimate, create)
+            )
+        self._record_usage(model, getattr(response, "usage", None), estimate)
+        return response
+    
+    async def stream_chat_completion(self, **kwargs) -> AsyncIterator[str]:
+        """Stream content deltas as they arrive; the blocking fallback yields the whole completion at once"""
+        if self.use_sync:
+            response = await self.create_chat_completion(**kwargs)
+            yield response.choices[0].message.content or ""
+            return
+        
+        model = kwargs.get("model")
+        estimate = self._estimate_tokens(kwargs)
+        deadline = deadlines.current()
+        
+        async def open_stream():
+            options = {"stream": True, "stream_options": {"include_usage": True}}
+            if deadline is None:
+                return await self.client.chat.completions.create(**options, **kwargs)
+            deadline.check()
+            return await deadline.run(self.client.chat.completions.create(**options, timeout=deadline.remaining(), **kwargs))
+        
+        # Only opening the stream is retried; a stream that fails midway has already yielded deltas.
+        # Reading it is bounded by the caller, e.g. the pipeline cancelling the stage at the deadline
+        stream = await self.governor.call(model, estimate, open_stream)
+        usage = None
+        try:
+            async for chunk in stream:
+                # With include_usage the final chunk carries token counts and no choices
+                usage = getattr(chunk, "usage", None) or usage
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            self._record_usage(model, usage, estimate)
+    
+    async def _create(self, kwargs: Dict[str, Any]):
+        if self.use_sync:
+            return await asyncio.to_thread(self.client.chat.completions.create, **kwargs)
+        return await self.client.chat.completions.create(**kwargs)
+    
+    def _record_usage(self, model: str, usage, estimate: int):
+        """Accumulate token usage reported by the upstream, here, in the per-stage ledgers and the governor"""
+        self.usage["calls"] += 1
+        if usage is not None:
+            prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+            completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+            self.usage["prompt_tokens"] += prompt_tokens
+            self.usage["completion_tokens"] += completion_tokens
+            self.governor.settle(model, estimate, prompt_tokens + completion_tokens)
+        record_call(model, usage)
+    
+    @staticmethod
+    def _estimate_tokens(kwargs: Dict[str, Any]) -> int:
+        """Upper-bound token estimate for a request: ~4 characters per text token plus max_tokens"""
+        tokens = kwargs.get("max_tokens") or 0
+        for message in kwargs.get("messages", []):
+            content = message.get("content")
+            parts = content if isinstance(content, list) else [{"type": "text", "text": content or ""}]
+            for part in parts:
+                if part.get("type") == "image_url":
+                    tokens += IMAGE_TOKEN_ESTIMATE
+                else:
+                    tokens += len(part.get("text", "")) // 4 + 1
+        return tokens
@@ -0,0 +1,55 @@
+import pytest
+import asyncio
+from types import SimpleNamespace
+from src.accounting import UsageLedger, UserUsage, estimate_image_tokens, cost_usd, record_call, record_image, stage, track
+
+def test_image_token_estimates_follow_published_sizing():
+    """Test tile-based and patch-based image token estimates against OpenAI's worked examples"""
+    assert estimate_image_tokens("gpt-4", 1024, 1024) == 765
+    assert estimate_image_tokens("gpt-4", 2048, 4096) == 1105
+    assert estimate_image_tokens("gpt-4.1-mini", 1024, 1024) == 1659
+    assert estimate_image_tokens("gpt-4.1-mini", 1800, 2400) == 2353  # 1452 patches * 1.62
+
+def test_cost_uses_model_prices():
+    """Test per-model pricing, with unknown models counted at zero cost"""
+    assert cost_usd("gpt-4", 1000, 500) == pytest.approx(0.06)
+    assert cost_usd("gpt-4.1-mini", 1_000_000, 0) == pytest.approx(0.40)
+    assert cost_usd("unknown-model", 1000, 1000) == 0
+
+def test_usage_is_attributed_to_stages_and_ledgers():
+    """Test that concurrent stages record into the request's ledger under their own stage names"""
+    request, variant = UsageLedger(), UsageLedger()
+    
+    async def call(name, prompt_tokens):
+        with stage(name):
+            await asyncio.sleep(0)
+            record_call("gpt-4.1-mini", SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=10))
+            record_image("gpt-4.1-mini", 1024, 1024)
+    
+    async def main():
+        with track(variant, request):
+            await asyncio.gather(call("question_ocr", 2000), call("solution_ocr", 3000))
+        record_call("gpt-4", SimpleNamespace(prompt_tokens=1, completion_tokens=1))  # outside the request
+    
+    asyncio.run(main())
+    
+    summary = request.to_dict()
+    assert summary["total"]["calls"] == 2
+    assert summary["total"]["prompt_tokens"] == 5000
+    assert summary["total"]["image_tokens"] == 2 * 1659
+    assert summary["by_stage"]["solution_ocr"]["prompt_tokens"] == 3000
+    assert summary["by_model"]["gpt-4.1-mini"]["cost_usd"] == pytest.approx(cost_usd("gpt-4.1-mini", 5000, 20))
+    assert variant.totals() == request.totals()
+
+def test_user_usage_is_bounded():
+    """Test that per-user totals keep only the most recently active users"""
+    users = UserUsage(max_users=2)
+    ledger = UsageLedger()
+    ledger.add("analysis", "gpt-4", calls=1, prompt_tokens=100)
+    
+    for user_id in ("a", "b", "a", "c"):
+        users.add(user_id, ledger)
+    
+    totals = users.to_dict()
+    assert list(totals) == ["a", "c"]
+    assert totals["a"]["prompt_tokens"] == 200
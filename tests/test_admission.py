@@ -0,0 +1,149 @@
+import pytest
+import asyncio
+from src.admission import AdmissionController, AdmissionRejected
+from src.config import parse_key_values
+
+def make_controller(**kwargs):
+    options = {"initial_limit": 1, "min_limit": 1, "max_limit": 8, "target_latency": 1.0, "max_queue": 100, "weights": {}}
+    options.update(kwargs)
+    return AdmissionController(**options)
+
+def test_fair_queueing_interleaves_tenants():
+    """Test that a tenant with a deep backlog cannot starve a later tenant"""
+    controller = make_controller()
+    order = []
+    
+    async def request(tenant):
+        async with controller.slot(tenant):
+            order.append(tenant)
+            await asyncio.sleep(0.01)
+    
+    async def main():
+        noisy = [asyncio.create_task(request("noisy")) for _ in range(6)]
+        await asyncio.sleep(0)
+        quiet = [asyncio.create_task(request("quiet")) for _ in range(2)]
+        await asyncio.gather(*noisy, *quiet)
+    
+    asyncio.run(main())
+    
+    # The quiet tenant is served within the first few grants, not after the whole noisy backlog
+    assert order.index("quiet") <= 2
+    assert order[:6].count("quiet") == 2
+
+def test_weights_share_slots_proportionally():
+    """Test that a weight-2 tenant gets twice the slots while both are backlogged"""
+    controller = make_controller(weights={"gold": 2.0})
+    order = []
+    
+    async def request(tenant):
+        async with controller.slot(tenant):
+            order.append(tenant)
+            await asyncio.sleep(0.01)
+    
+    async def main():
+        blocker = asyncio.create_task(request("warmup"))
+        await asyncio.sleep(0)
+        tasks = [asyncio.create_task(request(t)) for t in ["gold"] * 10 + ["basic"] * 10]
+        await asyncio.gather(blocker, *tasks)
+    
+    asyncio.run(main())
+    
+    served = order[1:10]
+    assert served.count("gold") == 6
+    assert served.count("basic") == 3
+
+def test_limit_grows_on_fast_requests_and_shrinks_on_failures():
+    """Test additive increase on healthy completions and multiplicative decrease on failures"""
+    controller = make_controller(initial_limit=4, target_latency=10.0)
+    
+    for _ in range(20):
+        controller.in_flight += 1
+        controller.release(0.1, True)
+    grown = controller.limit
+    assert grown > 6
+    
+    controller.in_flight += 1
+    controller.release(0.1, False)
+    assert controller.limit == pytest.approx(grown * 0.7)
+    
+    # A burst of failures within one target-latency window only cuts once
+    controller.in_flight += 1
+    controller.release(0.1, False)
+    assert controller.limit == pytest.approx(grown * 0.7)
+
+def test_reported_outcome_feeds_the_limit():
+    """Test that a caller-reported failure shrinks the limit and an unknown outcome leaves it alone"""
+    controller = make_controller(initial_limit=4, target_latency=10.0)
+    
+    async def request(success):
+        async with controller.slot("a") as outcome:
+            outcome.success = success
+    
+    asyncio.run(request(None))
+    assert controller.limit == 4
+    assert controller.in_flight == 0
+    
+    asyncio.run(request(False))
+    assert controller.limit == pytest.approx(4 * 0.7)
+    assert controller.in_flight == 0
+
+def test_queue_cap_rejects_and_cancelled_waiters_leave():
+    """Test the per-tenant queue cap and that cancelled waiters do not leak slots"""
+    controller = make_controller(max_queue=1)
+    
+    async def main():
+        await controller.acquire("a")
+        waiter = asyncio.create_task(controller.acquire("a"))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected):
+            await controller.acquire("a")
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        controller.release(0.1, True)
+        return controller.get_stats()
+    
+    stats = asyncio.run(main())
+    assert stats["in_flight"] == 0
+    assert stats["queue_depths"] == {}
+    assert stats["rejected"] == 1
+
+def test_waiter_cancelled_before_it_resumes_is_skipped():
+    """Test that a queued acquirer cancelled before it resumes neither breaks release nor leaks a slot"""
+    controller = make_controller()
+    
+    async def main():
+        await controller.acquire("a")
+        waiter = asyncio.create_task(controller.acquire("b"))
+        await asyncio.sleep(0)
+        waiter.cancel()  # Cancels the queued future at once; the task only leaves the queue when it next runs
+        controller.release(0.1, True)
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert controller.in_flight == 0
+        await asyncio.wait_for(controller.acquire("c"), timeout=1)
+        return controller.get_stats()
+    
+    stats = asyncio.run(main())
+    assert stats["in_flight"] == 1
+    assert stats["queue_depths"] == {}
+
+def test_slot_granted_to_a_cancelled_task_is_handed_on():
+    """Test that a waiter cancelled after its slot was granted, but before it ran, gives the slot back"""
+    controller = make_controller()
+    
+    async def main():
+        await controller.acquire("a")
+        waiter = asyncio.create_task(controller.acquire("b"))
+        await asyncio.sleep(0)
+        controller.release(0.1, True)  # Grants the slot to the waiter...
+        waiter.cancel()  # ...which is cancelled before it resumes
+        await asyncio.gather(waiter, return_exceptions=True)
+        return controller.get_stats()
+    
+    stats = asyncio.run(main())
+    assert stats["in_flight"] == 0
+
+def test_parse_tenant_weights():
+    """Test the tenant weight config format"""
+    assert parse_key_values("key:abc:2, user:7:0.5") == {"key:abc": 2.0, "user:7": 0.5}
+    assert parse_key_values("") == {}
@@ -55,4 +55,157 @@ def test_detect_error_valid_auth(test_case_data):
     # This will likely fail due to OpenAI API call, but should pass auth
     response = client.post("/detect-error", json=payload, headers=headers)
     # Should not be 401 (auth error) or 422 (validation error)
-    assert response.status_code not in [401, 422]
\ No newline at end of file
+    assert response.status_code not in [401, 422]
+
+def test_prepare_question_endpoints(monkeypatch):
+    """Test single and bulk question pre-warming endpoints"""
+    from src.models import PreparedQuestion
+    from src import api
+    
+    async def fake_prepare(question_id, question_url):
+        return PreparedQuestion(
+            question_id=question_id,
+            question_url=question_url,
+            prepared=True,
+            question_lines=["Solve x + 2 = 5"],
+            question_has_diagram=False
+        )
+    monkeypatch.setattr(api.detector, "prepare_question", fake_prepare)
+    headers = {"x-api-key": API_KEY}
+    
+    response = client.post("/questions/q1/prepare", json={"question_url": "https://example.com/q1.png"}, headers=headers)
+    assert response.status_code == 200
+    assert response.json()["question_id"] == "q1"
+    assert response.json()["prepared"] is True
+    
+    payload = {"questions": [
+        {"question_id": "q1", "question_url": "https://example.com/q1.png"},
+        {"question_id": "q2", "question_url": "https://example.com/q2.png"}
+    ]}
+    response = client.post("/questions/prepare", json=payload, headers=headers)
+    assert response.status_code == 200
+    assert [r["question_id"] for r in response.json()["results"]] == ["q1", "q2"]
+    
+    response = client.post("/questions/prepare", json=payload)
+    assert response.status_code == 401
+
+
+def test_detect_error_batch_streams_ndjson(monkeypatch, test_case_data):
+    """Test that the batch endpoint streams one JSON line per item"""
+    from src.models import DetectErrorResponse
+    from src import api
+    
+    async def fake_detect_errors(requests, concurrency, timeout, admission=None, tenant=None):
+        for index in reversed(range(len(requests))):
+            response = DetectErrorResponse(
+                job_id=f"job-{index}", y=50.0, error="No error found", correction="", hint="",
+                solution_complete=True, contains_diagram=False, question_has_diagram=False,
+                solution_has_diagram=False, llm_used=True
+            )
+            yield index, response, None
+    monkeypatch.setattr(api.detector, "detect_errors", fake_detect_errors)
+    
+    item = {
+        "question_url": test_case_data["question_url"],
+        "solution_url": test_case_data["solution_url"],
+        "bounding_box": test_case_data["bounding_box"]
+    }
+    headers = {"x-api-key": API_KEY}
+    response = client.post("/detect-error/batch", json={"requests": [item, item]}, headers=headers)
+    
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["index"] for line in lines] == [1, 0]
+    assert lines[0]["response"]["job_id"] == "job-1"
+
+def test_job_submission_and_polling(monkeypatch, test_case_data):
+    """Test enqueuing a job and polling it to completion"""
+    import time
+    from src.models import DetectErrorResponse
+    from src import api
+    
+    async def fake_detect_error(request, job_id=None, deadline=None):
+        return DetectErrorResponse(
+            job_id=job_id, y=50.0, error="No error found", correction="", hint="",
+            solution_complete=True, contains_diagram=False, question_has_diagram=False,
+            solution_has_diagram=False, llm_used=True
+        )
+    monkeypatch.setattr(api.detector, "detect_error", fake_detect_error)
+    
+    payload = {
+        "question_url": test_case_data["question_url"],
+        "solution_url": test_case_data["solution_url"],
+        "bounding_box": test_case_data["bounding_box"]
+    }
+    headers = {"x-api-key": API_KEY}
+    with TestClient(app) as job_client:
+        response = job_client.post("/jobs", json=payload, headers=headers)
+        assert response.status_code == 202
+        job_id = response.json()["job_id"]
+        
+        for _ in range(50):
+            status = job_client.get(f"/jobs/{job_id}", headers=headers).json()
+            if status["status"] == "completed":
+                break
+            time.sleep(0.02)
+        
+        assert status["status"] == "completed"
+        assert status["response"]["job_id"] == job_id
+        assert job_client.get("/jobs/unknown", headers=headers).status_code == 404
+
+
+def test_detect_error_stream_sse(monkeypatch, test_case_data):
+    """Test that the streaming endpoint emits Server-Sent Events"""
+    from src import api
+    
+    async def fake_events(request, timeout):
+        yield "ocr", {"stage": "solution_ocr", "lines": ["x = 3"]}
+        yield "analysis", {"delta": "No error"}
+        yield "result", {"job_id": "job-1", "error": "No error found", "llm_used": True}
+    monkeypatch.setattr(api.detector, "detect_error_events", fake_events)
+    
+    payload = {
+        "question_url": test_case_data["question_url"],
+        "solution_url": test_case_data["solution_url"],
+        "bounding_box": test_case_data["bounding_box"]
+    }
+    response = client.post("/detect-error/stream", json=payload, headers={"x-api-key": API_KEY})
+    
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    blocks = [block for block in response.text.split("\n\n") if block]
+    assert [block.split("\n")[0] for block in blocks] == ["event: ocr", "event: analysis", "event: result"]
+    assert json.loads(blocks[-1].split("data: ", 1)[1])["job_id"] == "job-1"
+
+def test_server_timing_and_metrics(monkeypatch, test_case_data):
+    """Test that stage spans reach the Server-Timing header and /metrics"""
+    from src.models import DetectErrorResponse
+    from src.telemetry import span
+    from src import api
+    
+    async def fake_detect_error(request, deadline=None):
+        with span("analysis"):
+            pass
+        return DetectErrorResponse(
+            job_id="job-1", y=50.0, error="No error found", correction="", hint="",
+            solution_complete=True, contains_diagram=False, question_has_diagram=False,
+            solution_has_diagram=False, llm_used=True
+        )
+    monkeypatch.setattr(api.detector, "detect_error", fake_detect_error)
+    
+    payload = {
+        "question_url": test_case_data["question_url"],
+        "solution_url": test_case_data["solution_url"],
+        "bounding_box": test_case_data["bounding_box"]
+    }
+    response = client.post("/detect-error", json=payload, headers={"x-api-key": API_KEY})
+    assert response.status_code == 200
+    assert response.headers["server-timing"].startswith("analysis;dur=")
+    
+    metrics = client.get("/metrics")
+    assert metrics.status_code == 200
+    assert metrics.headers["content-type"].startswith("text/plain")
+    assert 'error_detection_stage_duration_seconds_count{stage="analysis"}' in metrics.text
+    assert 'http_request_duration_seconds_count{method="POST",path="/detect-error",status="200"}' in metrics.text
+    assert 'admission_queued 0' in metrics.text
@@ -0,0 +1,83 @@
+import pytest
+import asyncio
+import os
+import threading
+import time
+import tempfile
+import shutil
+from src.cache import OCRCache
+
+@pytest.fixture
+def cache_dir():
+    temp_dir = tempfile.mkdtemp()
+    yield temp_dir
+    shutil.rmtree(temp_dir)
+
+def test_memory_hit_and_miss_counters():
+    """Test hit/miss accounting on the memory tier"""
+    cache = OCRCache(db_path=None, max_entries=10, ttl_seconds=60)
+    assert cache.get("k") is None
+    cache.set("k", ["x + 1 = 2"])
+    assert cache.get("k") == ["x + 1 = 2"]
+    
+    stats = cache.get_stats()
+    assert stats["misses"] == 1
+    assert stats["memory_hits"] == 1
+    assert stats["hit_rate"] == 0.5
+
+def test_lru_eviction():
+    """Test that the memory tier is bounded and evicts least recently used"""
+    cache = OCRCache(db_path=None, max_entries=2, ttl_seconds=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")  # a is now most recently used
+    cache.set("c", 3)
+    
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.get_stats()["evictions"] == 1
+
+def test_ttl_expiry(cache_dir):
+    """Test that expired entries are not served from either tier"""
+    cache = OCRCache(db_path=os.path.join(cache_dir, "cache.sqlite3"), ttl_seconds=0.05)
+    cache.set("k", True)
+    time.sleep(0.1)
+    
+    assert cache.get("k") is None
+    assert cache.get_stats()["expirations"] == 2
+
+def test_disk_tier_survives_restart(cache_dir):
+    """Test that a new cache instance is warmed from the SQLite tier"""
+    path = os.path.join(cache_dir, "cache.sqlite3")
+    OCRCache(db_path=path, ttl_seconds=60).set("k", [["line"], False])
+    
+    cache = OCRCache(db_path=path, ttl_seconds=60)
+    assert cache.get("k") == [["line"], False]
+    assert cache.get("k") == [["line"], False]
+    assert cache.get_stats()["disk_hits"] == 1
+    assert cache.get_stats()["memory_hits"] == 1
+
+def test_async_lookup_keeps_sqlite_off_the_event_loop(cache_dir):
+    """Test that lookup/store hit SQLite on worker threads and serve memory hits inline"""
+    path = os.path.join(cache_dir, "cache.sqlite3")
+    cache = OCRCache(db_path=path, ttl_seconds=60)
+    disk_threads = []
+    for name in ("_get_disk", "_set_disk"):
+        original = getattr(cache, name)
+        def traced(*args, original=original):
+            disk_threads.append(threading.current_thread())
+            return original(*args)
+        setattr(cache, name, traced)
+    
+    async def run():
+        await cache.store("k", ["x = 4"])
+        assert await cache.lookup("k") == ["x = 4"]
+        assert await cache.lookup("missing") is None
+    asyncio.run(run())
+    
+    assert len(disk_threads) == 2  # The store and the miss; the hit came from memory
+    assert threading.main_thread() not in disk_threads
+    assert OCRCache(db_path=path, ttl_seconds=60).get("k") == ["x = 4"]
+    assert cache.get_stats()["memory_hits"] == 1
+    assert cache.get_stats()["misses"] == 1
@@ -0,0 +1,79 @@
+import pytest
+import asyncio
+from types import SimpleNamespace
+from src.cascade import CascadeRouter, parse_confidence
+from src.llm import LLMAnalyzer
+from src.detector_variants import ImprovedDetector
+
+class FakeClient:
+    """Answers each model with a canned reply, or raises it if it is an exception"""
+    def __init__(self, replies):
+        self.replies = replies
+        self.models = []
+    
+    async def create_chat_completion(self, model, **kwargs):
+        self.models.append(model)
+        reply = self.replies[model]
+        if isinstance(reply, Exception):
+            raise reply
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=reply))])
+
+GOOD = "ERROR: sign slip\nCORRECTION: flip it\nHINT: line 2\nCOMPLETE: no\nCONFIDENCE: 0.9"
+
+def validate(content):
+    return content.startswith("ERROR:")
+
+def run(router):
+    return asyncio.run(router.complete(validate, messages=[], max_tokens=300))
+
+def test_confident_cheap_answer_is_not_escalated():
+    """Test that a valid, confident answer from the cheap tier is used as is"""
+    client = FakeClient({"gpt-4.1-mini": GOOD, "gpt-4": "big"})
+    router = CascadeRouter(client, ["gpt-4.1-mini", "gpt-4"], min_confidence=0.7)
+    
+    assert run(router) == GOOD
+    assert client.models == ["gpt-4.1-mini"]
+    assert router.get_stats()["escalation_rate"] == 0.0
+
+@pytest.mark.parametrize("cheap, reason", [
+    ("I am not sure", "invalid"),
+    (GOOD.replace("0.9", "0.4"), "low_confidence"),
+    (GOOD.replace("\nCONFIDENCE: 0.9", ""), "low_confidence"),
+    (RuntimeError("upstream down"), "failed"),
+])
+def test_unusable_cheap_answer_escalates(cheap, reason):
+    """Test that invalid, unsure or failed cheap answers go to the large model"""
+    client = FakeClient({"gpt-4.1-mini": cheap, "gpt-4": "big"})
+    router = CascadeRouter(client, ["gpt-4.1-mini", "gpt-4"], min_confidence=0.7)
+    
+    assert run(router) == "big"
+    assert client.models == ["gpt-4.1-mini", "gpt-4"]
+    stats = router.get_stats()
+    assert stats[reason] == 1
+    assert stats["escalation_rate"] == 1.0
+    assert stats["tiers"]["gpt-4"]["calls"] == 1
+
+def test_last_tier_failure_propagates():
+    """Test that a failing last tier is not swallowed"""
+    client = FakeClient({"gpt-4": RuntimeError("upstream down")})
+    with pytest.raises(RuntimeError):
+        run(CascadeRouter(client, ["gpt-4"]))
+
+def test_parse_confidence():
+    """Test fractional, percentage and missing confidence lines"""
+    assert parse_confidence("CONFIDENCE: 0.85") == 0.85
+    assert parse_confidence("Confidence - 80%") == 0.8
+    assert parse_confidence("confidence: 1") == 1.0
+    assert parse_confidence("no idea") is None
+
+def test_analysis_needs_every_labelled_field():
+    """Test that prose mentioning the field names does not pass as a complete analysis"""
+    assert LLMAnalyzer._is_complete_analysis(GOOD)
+    assert not LLMAnalyzer._is_complete_analysis("No error, so no correction or hint needed; the work is complete.")
+    assert not LLMAnalyzer._is_complete_analysis("ERROR: sign slip\nCORRECTION: flip it\nCOMPLETE: no")
+
+def test_analysis_validators_agree():
+    """Test that the analyzer and the improved detector accept the same labelled replies"""
+    for reply in (GOOD, GOOD.lower(), "Error, correction, hint and complete"):
+        assert LLMAnalyzer._is_complete_analysis(reply) == ImprovedDetector._is_structured_response(reply)
+    assert not LLMAnalyzer._is_complete_analysis(GOOD.lower())
@@ -0,0 +1,88 @@
+import pytest
+import asyncio
+import time
+import httpx
+import openai
+from src import cassette
+from src.cassette import Cassette, AsyncCassetteTransport, CassetteTransport, request_key
+from src.governor import UpstreamGovernor
+from src.upstream import UpstreamClient
+
+COMPLETION = {
+    "id": "chatcmpl-1", "object": "chat.completion", "created": 0, "model": "gpt-4",
+    "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "x = 4"}}],
+    "usage": {"prompt_tokens": 12, "completion_tokens": 3, "total_tokens": 15}
+}
+
+def offline(request):
+    raise AssertionError(f"Unexpected network call to {request.url}")
+
+def test_request_key_ignores_json_key_order():
+    """Test that requests differing only in JSON key order share a recording"""
+    assert request_key("POST", "https://api/x", b'{"a": 1, "b": 2}') == request_key("POST", "https://api/x", b'{"b":2,"a":1}')
+    assert request_key("POST", "https://api/x", b'{"a": 1}') != request_key("POST", "https://api/x", b'{"a": 2}')
+    assert request_key("GET", "https://img/1.jpg", b"") != request_key("GET", "https://img/2.jpg", b"")
+
+def test_recorded_completion_replays_offline(monkeypatch, tmp_path):
+    """Test that a recorded chat completion is served back with no network or API key"""
+    path = str(tmp_path / "openai.jsonl")
+    sent = []
+    
+    def upstream(request):
+        sent.append(request)
+        return httpx.Response(200, json=COMPLETION, headers={"x-request-id": "req-1"})
+    
+    recorder = UpstreamClient(use_sync=False, governor=UpstreamGovernor())
+    recorder.client = openai.AsyncOpenAI(api_key="test-key", max_retries=0, http_client=httpx.AsyncClient(
+        transport=AsyncCassetteTransport(Cassette(path), "record", transport=httpx.MockTransport(upstream))))
+    recorded = asyncio.run(recorder.create_chat_completion(model="gpt-4", messages=[{"role": "user", "content": "2+2"}]))
+    assert len(sent) == 1
+    assert "test-key" not in open(path).read()
+    
+    monkeypatch.setattr("src.upstream.OPENAI_API_KEY", None)
+    monkeypatch.setattr("src.upstream.OPENAI_CASSETTE_MODE", "replay")
+    monkeypatch.setattr(cassette, "OPENAI_CASSETTE_MODE", "replay")
+    monkeypatch.setattr(cassette, "_default_cassette", Cassette(path))
+    monkeypatch.setattr(httpx.AsyncHTTPTransport, "handle_async_request", lambda self, request: offline(request))
+    replayer = UpstreamClient(use_sync=False, governor=UpstreamGovernor())
+    replayed = asyncio.run(replayer.create_chat_completion(model="gpt-4", messages=[{"role": "user", "content": "2+2"}]))
+    
+    assert replayed.choices[0].message.content == recorded.choices[0].message.content == "x = 4"
+    assert replayer.usage["prompt_tokens"] == 12
+    assert len(sent) == 1
+
+def test_unrecorded_request_fails_fast(tmp_path):
+    """Test that a replay miss is a non-retryable 404 rather than a connection error"""
+    governor = UpstreamGovernor(base_delay=0)
+    client = UpstreamClient(use_sync=False, governor=governor)
+    client.client = openai.AsyncOpenAI(api_key="test-key", max_retries=0, http_client=httpx.AsyncClient(
+        transport=AsyncCassetteTransport(Cassette(str(tmp_path / "empty.jsonl")), "replay",
+                                         transport=httpx.MockTransport(offline))))
+    
+    with pytest.raises(openai.NotFoundError, match="No cassette recording"):
+        asyncio.run(client.create_chat_completion(model="gpt-4", messages=[]))
+    assert governor.stats["retries"] == 0
+
+def test_replay_rotates_recordings_and_scales_latency(tmp_path):
+    """Test that repeated recordings replay in order, binary bodies survive and latency is reproduced"""
+    path = str(tmp_path / "images.jsonl")
+    responses = iter([httpx.Response(429, json={"error": {"message": "slow down"}}), httpx.Response(200, content=b"\xff\xd8jpeg")])
+    
+    def upstream(request):
+        time.sleep(0.05)
+        return next(responses)
+    
+    with httpx.Client(transport=CassetteTransport(Cassette(path), "record", transport=httpx.MockTransport(upstream))) as http:
+        assert http.get("https://example.com/a.jpg").status_code == 429
+        assert http.get("https://example.com/a.jpg").content == b"\xff\xd8jpeg"
+    
+    replay = CassetteTransport(Cassette(path), "replay", latency_scale=0.5, transport=httpx.MockTransport(offline))
+    with httpx.Client(transport=replay) as http:
+        start = time.perf_counter()
+        first = http.get("https://example.com/a.jpg")
+        elapsed = time.perf_counter() - start
+        second = http.get("https://example.com/a.jpg")
+    
+    assert first.status_code == 429
+    assert (second.status_code, second.content) == (200, b"\xff\xd8jpeg")
+    assert 0.02 <= elapsed < 0.5
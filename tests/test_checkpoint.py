@@ -0,0 +1,61 @@
+import pytest
+import asyncio
+import os
+import tempfile
+import shutil
+from eval.checkpoint import CaseCheckpoint
+from eval.run_eval import EvaluationHarness
+from src.models import DetectErrorResponse
+
+@pytest.fixture
+def checkpoint():
+    temp_dir = tempfile.mkdtemp()
+    yield CaseCheckpoint(os.path.join(temp_dir, "checkpoint.jsonl"))
+    shutil.rmtree(temp_dir)
+
+def test_records_round_trip(checkpoint):
+    """Test that appended case results load back keyed by variant and index"""
+    assert checkpoint.load() == {}
+    checkpoint.append({"variant": "baseline", "index": 0, "case_id": "q1", "result": {"latency": 1.5}, "usage": []})
+    checkpoint.append({"variant": "improved", "index": 0, "case_id": "q1", "result": {"latency": 2.0}, "usage": []})
+    
+    records = checkpoint.load()
+    assert set(records) == {("baseline", 0), ("improved", 0)}
+    assert records[("improved", 0)]["result"]["latency"] == 2.0
+    
+    checkpoint.clear()
+    assert checkpoint.load() == {}
+
+def test_truncated_line_is_skipped_and_terminated(checkpoint):
+    """Test that a partial line from a crash is ignored and does not corrupt the next record"""
+    checkpoint.append({"variant": "baseline", "index": 0, "case_id": "q1", "result": {}, "usage": []})
+    with open(checkpoint.path, "a") as f:
+        f.write('{"variant": "baseline", "ind')
+    
+    assert set(checkpoint.load()) == {("baseline", 0)}
+    checkpoint.append({"variant": "baseline", "index": 1, "case_id": "q2", "result": {}, "usage": []})
+    assert set(checkpoint.load()) == {("baseline", 0), ("baseline", 1)}
+
+def test_failed_cases_are_not_checkpointed(checkpoint):
+    """Test that raised errors and fallback answers are not checkpointed, so a resumed run retries them"""
+    harness = EvaluationHarness(checkpoint_path=checkpoint.path)
+    
+    async def fail(request):
+        raise RuntimeError("upstream down")
+    
+    async def fall_back(request):
+        return DetectErrorResponse(job_id="j1", y=0.5, error="Processing failed", correction="Try again",
+                                   hint="Check input", solution_complete=False, contains_diagram=False,
+                                   question_has_diagram=False, solution_has_diagram=False, llm_used=False)
+    harness.baseline_detector.detect_error = fail
+    harness.improved_detector.detect_error = fall_back
+    case = {"question_id": "q1", "question_url": "https://example.com/q1.jpg",
+            "solution_url": "https://example.com/s1.jpg", "bounding_box": {"minX": 0, "maxX": 1, "minY": 0, "maxY": 1},
+            "has_error": True}
+    results = {"baseline": [None], "improved": [None]}
+    asyncio.run(harness._evaluate_case(results, "baseline", 0, case))
+    asyncio.run(harness._evaluate_case(results, "improved", 0, case))
+    
+    assert results["baseline"][0]["success"] is False
+    assert results["improved"][0]["success"] is False
+    assert checkpoint.load() == {}
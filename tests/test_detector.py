@@ -0,0 +1,311 @@
+import pytest
+import asyncio
+import os
+import time
+import tempfile
+import shutil
+from src.detector import ErrorDetector
+from src.models import DetectErrorRequest, BoundingBox
+from src.storage import SimpleStorage
+from src.questions import QuestionIndex
+from src.admission import AdmissionController
+
+class FakeOCR:
+    def __init__(self, delay: float = 0.1, mode: str = "separate"):
+        self.delay = delay
+        self.mode = mode
+        self.calls = []
+        self.crops = []
+        self.diagram_crops = []
+    
+    async def extract_text_from_url(self, image_url: str, crop=None):
+        self.calls.append(("text", image_url))
+        self.crops.append(crop)
+        await asyncio.sleep(self.delay)
+        return [f"text from {image_url}"]
+    
+    async def has_diagram(self, image_url: str, crop=None):
+        self.calls.append(("diagram", image_url))
+        self.diagram_crops.append(crop)
+        await asyncio.sleep(self.delay)
+        return image_url.endswith("diagram.png")
+    
+    async def analyze_image(self, image_url: str, crop=None):
+        self.calls.append(("fused", image_url))
+        self.crops.append(crop)
+        await asyncio.sleep(self.delay)
+        return [f"text from {image_url}"], image_url.endswith("diagram.png")
+
+class FakeLLM:
+    def __init__(self):
+        self.calls = []
+    
+    async def analyze_error(self, question_text, solution_text, bounding_box):
+        self.calls.append((question_text, solution_text))
+        return {
+            "error": "Sign error",
+            "correction": "Flip the sign",
+            "hint": "Check line 2",
+            "solution_complete": False,
+            "y": (bounding_box["minY"] + bounding_box["maxY"]) / 2
+        }
+    
+    async def analyze_error_stream(self, question_text, solution_text, bounding_box, on_delta):
+        for delta in ("ERROR: Sign", " error"):
+            on_delta(delta)
+            await asyncio.sleep(0)
+        return await self.analyze_error(question_text, solution_text, bounding_box)
+
+@pytest.fixture
+def detector(monkeypatch):
+    """ErrorDetector wired to fake upstream stages and temporary storage"""
+    monkeypatch.setattr("src.upstream.OPENAI_API_KEY", "test-key")
+    temp_dir = tempfile.mkdtemp()
+    detector = ErrorDetector()
+    detector.ocr = FakeOCR()
+    detector.llm = FakeLLM()
+    detector.storage = SimpleStorage(temp_dir)
+    detector.questions = QuestionIndex(os.path.join(temp_dir, "questions.sqlite3"))
+    detector.optional_stage_min_budget = 0
+    yield detector
+    shutil.rmtree(temp_dir)
+
+@pytest.fixture
+def request_data():
+    return DetectErrorRequest(
+        question_url="https://example.com/q-diagram.png",
+        solution_url="https://example.com/s.png",
+        bounding_box=BoundingBox(minX=0, maxX=100, minY=40, maxY=60),
+        question_id="q1"
+    )
+
+def test_vision_calls_run_concurrently(detector, request_data):
+    """Test that the four vision calls overlap instead of running back to back"""
+    start = time.perf_counter()
+    response = asyncio.run(detector.detect_error(request_data))
+    elapsed = time.perf_counter() - start
+    
+    assert len(detector.ocr.calls) == 4
+    assert elapsed < 0.3  # one vision round-trip, not four
+    assert response.error == "Sign error"
+    assert response.y == 50
+    assert response.question_has_diagram is True
+    assert response.solution_has_diagram is False
+    assert response.llm_ocr_lines == ["text from https://example.com/q-diagram.png", "text from https://example.com/s.png"]
+    assert detector.llm.calls[0] == ("text from https://example.com/q-diagram.png", "text from https://example.com/s.png")
+
+def test_failed_diagram_stage_is_isolated(detector, request_data):
+    """Test that a failing optional stage does not fail the request"""
+    async def broken(image_url):
+        raise RuntimeError("vision unavailable")
+    detector.ocr.has_diagram = broken
+    
+    response = asyncio.run(detector.detect_error(request_data))
+    
+    assert response.llm_used is True
+    assert response.error == "Sign error"
+    assert response.contains_diagram is False
+
+def test_fused_mode_makes_one_vision_call_per_image(detector, request_data):
+    """Test that fused OCR mode replaces the OCR and diagram calls"""
+    detector.ocr.mode = "fused"
+    response = asyncio.run(detector.detect_error(request_data))
+    
+    assert [kind for kind, _ in detector.ocr.calls] == ["fused", "fused"]
+    assert response.question_has_diagram is True
+    assert response.contains_diagram is True
+    assert response.solution_lines == ["text from https://example.com/s.png"]
+
+def test_prepared_question_skips_question_vision_calls(detector, request_data):
+    """Test that a pre-warmed question is served from the index"""
+    prepared = asyncio.run(detector.prepare_question("q1", request_data.question_url))
+    assert prepared.prepared is True
+    assert prepared.question_has_diagram is True
+    detector.ocr.calls.clear()
+    
+    response = asyncio.run(detector.detect_error(request_data))
+    
+    assert all(url == request_data.solution_url for _, url in detector.ocr.calls)
+    assert response.question_has_diagram is True
+    assert response.llm_ocr_lines[0] == "text from https://example.com/q-diagram.png"
+
+def test_failed_prepare_is_not_indexed(detector, request_data):
+    """Test that empty OCR output leaves the question cold"""
+    async def no_text(image_url):
+        return []
+    detector.ocr.extract_text_from_url = no_text
+    
+    prepared = asyncio.run(detector.prepare_question("q1", request_data.question_url))
+    
+    assert prepared.prepared is False
+    assert detector.questions.get("q1") is None
+
+def test_bbox_crop_mode_crops_solution_ocr(detector, request_data):
+    """Test that bbox mode OCRs the bounding box plus margin"""
+    detector.solution_crop_mode = "bbox"
+    detector.solution_crop_margin = 10
+    asyncio.run(detector.detect_error(request_data))
+    
+    assert (0 - 10, 40 - 10, 100 + 10, 60 + 10) in detector.ocr.crops
+    assert None in detector.ocr.crops  # question is still read in full
+    assert detector.ocr.diagram_crops == [None, None]  # diagrams are looked for on the whole page
+
+def test_bbox_crop_keeps_full_page_diagram_in_fused_mode(detector, request_data):
+    """Test that a cropped fused read still reports a diagram elsewhere on the solution page"""
+    detector.ocr.mode = "fused"
+    detector.solution_crop_mode = "bbox"
+    request_data.solution_url = "https://example.com/diagram.png"
+    
+    async def no_diagram_in_crop(image_url, crop=None):
+        detector.ocr.crops.append(crop)
+        return ["x = 4"], False if crop is not None else True
+    detector.ocr.analyze_image = no_diagram_in_crop
+    
+    response = asyncio.run(detector.detect_error(request_data))
+    
+    assert response.solution_lines == ["x = 4"]
+    assert response.solution_has_diagram is True
+    assert detector.ocr.diagram_crops == [None]
+
+def test_bbox_crop_falls_back_to_full_page(detector, request_data):
+    """Test that an empty cropped OCR result falls back to the full page"""
+    detector.solution_crop_mode = "bbox"
+    original = detector.ocr.extract_text_from_url
+    
+    async def empty_when_cropped(image_url, crop=None):
+        lines = await original(image_url, crop)
+        return [] if crop is not None else lines
+    detector.ocr.extract_text_from_url = empty_when_cropped
+    
+    response = asyncio.run(detector.detect_error(request_data))
+    
+    assert response.solution_lines == ["text from https://example.com/s.png"]
+    assert detector.ocr.crops.count(None) == 2
+
+def test_batch_shares_question_ocr_and_streams_all_items(detector):
+    """Test that batch items share question vision calls and all results are yielded"""
+    requests = [
+        DetectErrorRequest(
+            question_url="https://example.com/q.png",
+            solution_url=f"https://example.com/s{i}.png",
+            bounding_box=BoundingBox(minX=0, maxX=100, minY=40, maxY=60)
+        )
+        for i in range(6)
+    ]
+    
+    async def collect():
+        return [item async for item in detector.detect_errors(requests, concurrency=3, timeout=5)]
+    results = asyncio.run(collect())
+    
+    assert sorted(index for index, _, _ in results) == list(range(6))
+    assert all(response is not None and error is None for _, response, error in results)
+    question_calls = [call for call in detector.ocr.calls if call[1] == "https://example.com/q.png"]
+    assert sorted(question_calls) == [("diagram", "https://example.com/q.png"), ("text", "https://example.com/q.png")]
+
+def test_batch_item_timeout_is_reported(detector, request_data):
+    """Test that a slow item yields an error line instead of stalling the batch"""
+    detector.ocr.delay = 0.5
+    
+    async def collect():
+        return [item async for item in detector.detect_errors([request_data], concurrency=1, timeout=0.05)]
+    
+    assert asyncio.run(collect()) == [(0, None, "Request timeout")]
+
+def test_batch_items_hold_admission_slots(detector):
+    """Test that concurrent batches share the adaptive admission limit instead of multiplying it"""
+    admission = AdmissionController(initial_limit=2, min_limit=2, max_limit=2)
+    requests = [
+        DetectErrorRequest(
+            question_url="https://example.com/q.png",
+            solution_url=f"https://example.com/s{i}.png",
+            bounding_box=BoundingBox(minX=0, maxX=100, minY=40, maxY=60),
+            user_id=f"u{i % 2}"
+        )
+        for i in range(4)
+    ]
+    peak = []
+    detect_error = detector.detect_error
+    
+    async def tracked(*args, **kwargs):
+        peak.append(admission.in_flight)
+        return await detect_error(*args, **kwargs)
+    detector.detect_error = tracked
+    
+    async def collect():
+        batch = detector.detect_errors(requests, concurrency=3, timeout=5, admission=admission,
+                                       tenant=lambda item: item.user_id)
+        return [item async for item in batch]
+    
+    async def two_batches():
+        return await asyncio.gather(collect(), collect())
+    results = asyncio.run(two_batches())
+    
+    assert all(error is None for batch in results for _, _, error in batch)
+    assert max(peak) <= 2
+    assert admission.stats["admitted"] == 8
+    assert admission.in_flight == 0
+
+def test_events_stream_ocr_then_analysis_then_result(detector, request_data):
+    """Test the progressive event sequence used by the SSE endpoint"""
+    async def collect():
+        return [event async for event in detector.detect_error_events(request_data, timeout=5)]
+    events = asyncio.run(collect())
+    names = [name for name, _ in events]
+    
+    assert names == ["ocr"] * 4 + ["analysis", "analysis", "result"]
+    ocr = {data["stage"]: data for name, data in events if name == "ocr"}
+    assert ocr["question_ocr"]["lines"] == ["text from https://example.com/q-diagram.png"]
+    assert ocr["question_diagram"]["has_diagram"] is True
+    assert "".join(data["delta"] for name, data in events if name == "analysis") == "ERROR: Sign error"
+    assert events[-1][1]["error"] == "Sign error"
+
+def test_events_stream_reports_timeout(detector, request_data):
+    """Test that a stream exceeding its budget ends with an error event"""
+    detector.ocr.delay = 0.5
+    
+    async def collect():
+        return [event async for event in detector.detect_error_events(request_data, timeout=0.05)]
+    
+    assert asyncio.run(collect()) == [("error", {"detail": "Request timeout"})]
+
+def test_diagram_stages_are_skipped_on_a_tight_budget(detector, request_data):
+    """Test that optional diagram checks are dropped when little of the deadline remains"""
+    from src.deadline import Deadline
+    detector.optional_stage_min_budget = 10
+    request_data.question_id = None
+    
+    response = asyncio.run(detector.detect_error(request_data, deadline=Deadline(5)))
+    
+    assert sorted(kind for kind, _ in detector.ocr.calls) == ["text", "text"]
+    assert response.error == "Sign error"
+    assert response.contains_diagram is False
+
+def test_exhausted_deadline_raises_instead_of_falling_back(detector, request_data):
+    """Test that running out of budget is reported as a timeout, not a fallback response"""
+    from src.deadline import Deadline, DeadlineExceeded
+    detector.ocr.delay = 0.5
+    
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(detector.detect_error(request_data, deadline=Deadline(0.05)))
+    assert detector.llm.calls == []
+
+def test_usage_is_aggregated_per_request_and_user(detector, request_data):
+    """Test that upstream usage lands in the audit record and the per-user totals"""
+    from types import SimpleNamespace
+    from src.accounting import record_call
+    
+    analyze = detector.llm.analyze_error
+    
+    async def analyze_with_usage(question_text, solution_text, bounding_box):
+        record_call("gpt-4", SimpleNamespace(prompt_tokens=400, completion_tokens=50))
+        return await analyze(question_text, solution_text, bounding_box)
+    detector.llm.analyze_error = analyze_with_usage
+    
+    request_data.user_id = "student-7"
+    response = asyncio.run(detector.detect_error(request_data))
+    detector.storage.flush()
+    
+    record = detector.storage.get_record(response.job_id)
+    assert record["usage"]["by_stage"]["analysis"]["prompt_tokens"] == 400
+    assert record["usage"]["total"]["cost_usd"] > 0
+    assert detector.user_usage.to_dict()["student-7"]["completion_tokens"] == 50
@@ -0,0 +1,104 @@
+import pytest
+import asyncio
+import httpx
+import openai
+from src.governor import UpstreamGovernor, CircuitOpenError, TokenBucket
+
+def status_error(cls, status: int, headers=None, body=None):
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    response = httpx.Response(status, headers=headers or {}, request=request)
+    return cls("upstream error", response=response, body=body)
+
+class Flaky:
+    """Raises the queued errors in order, then succeeds"""
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+    
+    async def __call__(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return "ok"
+
+def test_rate_limit_retry_waits_for_retry_after(monkeypatch):
+    """Test that a 429 is retried no sooner than the upstream's Retry-After"""
+    sleeps = []
+    async def fake_sleep(delay):
+        sleeps.append(delay)
+    monkeypatch.setattr("src.governor.asyncio.sleep", fake_sleep)
+    governor = UpstreamGovernor(rpm_limits={}, tpm_limits={}, base_delay=0.01, max_delay=20)
+    func = Flaky(status_error(openai.RateLimitError, 429, {"retry-after": "3"}))
+    
+    assert asyncio.run(governor.call("gpt-4", 100, func)) == "ok"
+    assert func.calls == 2
+    assert sleeps == [3.0]
+    assert governor.get_stats()["retries"] == 1
+
+def test_retry_is_skipped_when_it_cannot_fit_the_deadline():
+    """Test that a Retry-After longer than the remaining budget fails fast instead of sleeping"""
+    from src import deadline as deadlines
+    from src.deadline import Deadline
+    governor = UpstreamGovernor(rpm_limits={}, tpm_limits={})
+    func = Flaky(status_error(openai.RateLimitError, 429, {"retry-after": "10"}))
+    
+    async def main():
+        with deadlines.scope(Deadline(1)):
+            return await governor.call("gpt-4", 100, func)
+    
+    with pytest.raises(openai.RateLimitError):
+        asyncio.run(main())
+    assert func.calls == 1
+    assert governor.get_stats()["retries"] == 0
+
+def test_non_retryable_errors_are_raised_immediately():
+    """Test that client errors and exhausted quota are not retried"""
+    governor = UpstreamGovernor(rpm_limits={}, tpm_limits={}, base_delay=0)
+    bad_request = Flaky(status_error(openai.BadRequestError, 400))
+    with pytest.raises(openai.BadRequestError):
+        asyncio.run(governor.call("gpt-4", 100, bad_request))
+    
+    quota = Flaky(status_error(openai.RateLimitError, 429, body={"code": "insufficient_quota"}))
+    with pytest.raises(openai.RateLimitError):
+        asyncio.run(governor.call("gpt-4", 100, quota))
+    
+    assert bad_request.calls == quota.calls == 1
+    assert governor.breaker("gpt-4").state == "closed"
+
+def test_circuit_opens_fails_fast_and_recovers(monkeypatch):
+    """Test that repeated failures open the circuit until a half-open probe succeeds"""
+    clock = [1000.0]
+    monkeypatch.setattr("src.governor.time.monotonic", lambda: clock[0])
+    governor = UpstreamGovernor(rpm_limits={}, tpm_limits={}, max_retries=0, failure_threshold=2, reset_timeout=30)
+    failing = Flaky(*[status_error(openai.InternalServerError, 503) for _ in range(2)])
+    
+    for _ in range(2):
+        with pytest.raises(openai.InternalServerError):
+            asyncio.run(governor.call("gpt-4", 100, failing))
+    assert governor.breaker("gpt-4").state == "open"
+    
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(governor.call("gpt-4", 100, failing))
+    assert failing.calls == 2
+    assert governor.breaker("gpt-4.1-mini").state == "closed"
+    
+    clock[0] += 30
+    assert governor.breaker("gpt-4").state == "half_open"
+    assert asyncio.run(governor.call("gpt-4", 100, failing)) == "ok"
+    assert governor.breaker("gpt-4").state == "closed"
+
+def test_token_bucket_paces_requests(monkeypatch):
+    """Test that reservations beyond the per-minute budget wait, and settled usage is credited back"""
+    clock = [0.0]
+    monkeypatch.setattr("src.governor.time.monotonic", lambda: clock[0])
+    bucket = TokenBucket(per_minute=60)
+    
+    assert bucket.reserve(60) == 0
+    assert bucket.reserve(3) == pytest.approx(3.0)
+    clock[0] += 1
+    assert bucket.reserve(1) == pytest.approx(3.0)
+    
+    governor = UpstreamGovernor(rpm_limits={}, tpm_limits={"gpt-4": 600})
+    governor.token_buckets["gpt-4"].reserve(600)
+    governor.settle("gpt-4", 600, 100)
+    assert governor.token_buckets["gpt-4"].reserve(500) == 0
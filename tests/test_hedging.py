@@ -0,0 +1,81 @@
+import asyncio
+from src.hedging import Hedger
+
+class Upstream:
+    """Answers after the queued delays in call order, remembering cancelled calls"""
+    def __init__(self, *delays):
+        self.delays = list(delays)
+        self.calls = 0
+        self.cancelled = 0
+    
+    async def __call__(self):
+        delay = self.delays[min(self.calls, len(self.delays) - 1)]
+        self.calls += 1
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return delay
+
+def test_full_window_sets_the_hedging_delay():
+    """Test that the delay is the window's percentile and a fresh window starts once it is full"""
+    hedger = Hedger(quantile=0.9, max_extra_load=1.0, window=10)
+    for _ in range(9):
+        hedger._observe("gpt-4:300", 0.01)
+    assert "gpt-4:300" not in hedger.delays
+    
+    hedger._observe("gpt-4:300", 0.01)
+    assert 0.009 <= hedger.delays["gpt-4:300"] <= 0.011
+    assert hedger.windows["gpt-4:300"].count == 0
+
+def test_slow_call_is_hedged_and_loser_cancelled():
+    """Test that a call slower than the recent percentile races a duplicate that wins"""
+    hedger = Hedger(quantile=0.9, max_extra_load=1.0, window=10)
+    hedger.delays["gpt-4:300"] = 0.01
+    
+    upstream = Upstream(1.0, 0.01)
+    assert asyncio.run(hedger.run("gpt-4:300", upstream)) == 0.01
+    assert upstream.calls == 2
+    assert upstream.cancelled == 1
+    assert hedger.stats["hedges_fired"] == hedger.stats["hedges_won"] == 1
+
+def test_winning_hedge_records_the_full_call_latency():
+    """Test that a hedged call is timed from the original's start, not the hedge's"""
+    hedger = Hedger(quantile=0.5, max_extra_load=1.0, window=1)
+    hedger.delays["gpt-4:300"] = 0.05
+    
+    asyncio.run(hedger.run("gpt-4:300", Upstream(1.0, 0.01)))
+    assert hedger.stats["hedges_won"] == 1
+    assert hedger.delays["gpt-4:300"] >= 0.05
+
+def test_no_hedging_without_history_or_budget():
+    """Test that hedges wait for a full latency window and respect the extra-load cap"""
+    hedger = Hedger(quantile=0.9, max_extra_load=0.0, window=10)
+    upstream = Upstream(0.05)
+    asyncio.run(hedger.run("gpt-4:300", upstream))
+    assert upstream.calls == 1
+    
+    hedger.delays["gpt-4:300"] = 0.01
+    upstream = Upstream(0.05)
+    asyncio.run(hedger.run("gpt-4:300", upstream))
+    assert upstream.calls == 1
+    assert hedger.stats["hedges_fired"] == 0
+    assert hedger.stats["hedges_denied"] == 1
+
+def test_failed_attempt_falls_back_to_the_other():
+    """Test that one failing attempt does not fail the call while the other can still answer"""
+    hedger = Hedger(quantile=0.9, max_extra_load=1.0, window=10)
+    hedger.delays["gpt-4:300"] = 0.01
+    calls = []
+    
+    async def flaky():
+        calls.append(None)
+        if len(calls) == 1:
+            await asyncio.sleep(0.05)
+            raise RuntimeError("upstream reset")
+        await asyncio.sleep(0.1)
+        return "ok"
+    
+    assert asyncio.run(hedger.run("gpt-4:300", flaky)) == "ok"
+    assert len(calls) == 2
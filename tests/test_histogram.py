@@ -0,0 +1,58 @@
+import pytest
+import random
+from src.histogram import LatencyHistogram
+
+def _exact_percentile(values, quantile):
+    ordered = sorted(values)
+    rank = quantile * (len(ordered) - 1)
+    lower = int(rank)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+def test_percentiles_within_relative_error():
+    """Test that percentiles stay within the configured relative error"""
+    rng = random.Random(7)
+    values = [rng.lognormvariate(0, 1) for _ in range(20000)]
+    histogram = LatencyHistogram(relative_error=0.01)
+    for value in values:
+        histogram.record(value)
+    
+    for quantile in (0.5, 0.9, 0.95, 0.99, 0.999):
+        assert histogram.percentile(quantile) == pytest.approx(_exact_percentile(values, quantile), rel=0.02)
+    assert histogram.percentile(0) == min(values)
+    assert histogram.percentile(1) == max(values)
+
+def test_memory_is_bounded():
+    """Test that the number of buckets does not grow with the sample count"""
+    histogram = LatencyHistogram()
+    for i in range(100000):
+        histogram.record(0.001 * (i % 5000 + 1))
+    
+    assert histogram.count == 100000
+    assert len(histogram.counts) < 1000
+
+def test_merge_matches_single_histogram():
+    """Test that merged worker histograms equal one histogram of all samples"""
+    values = [0.05 * i for i in range(1, 200)]
+    combined, left, right = LatencyHistogram(), LatencyHistogram(), LatencyHistogram()
+    for i, value in enumerate(values):
+        combined.record(value)
+        (left if i % 2 else right).record(value)
+    
+    left.merge(right)
+    
+    assert left.counts == combined.counts
+    assert left.percentiles() == combined.percentiles()
+    with pytest.raises(ValueError):
+        left.merge(LatencyHistogram(relative_error=0.05))
+
+def test_out_of_range_values_are_clamped():
+    """Test that values outside the tracked range still count"""
+    histogram = LatencyHistogram(min_value=0.01, max_value=10)
+    histogram.record(0.0)
+    histogram.record(50.0)
+    
+    assert histogram.count == 2
+    assert histogram.percentile(0) == 0.0
+    assert histogram.percentile(1) == 50.0
+    assert histogram.count_at_or_below(5) == 1
@@ -0,0 +1,117 @@
+import pytest
+import asyncio
+import base64
+import httpx
+from io import BytesIO
+from PIL import Image
+from src.images import ImageIngestor
+from src.ocr import OCRProcessor
+from src.cache import OCRCache
+
+def make_jpeg(width: int, height: int, orientation: int = None) -> bytes:
+    image = Image.new("RGB", (width, height), (200, 30, 30))
+    buffer = BytesIO()
+    if orientation:
+        exif = Image.Exif()
+        exif[0x0112] = orientation
+        image.save(buffer, format="JPEG", exif=exif)
+    else:
+        image.save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+def make_ingestor(payload: bytes, requests_seen: list, **kwargs) -> ImageIngestor:
+    def handler(request):
+        requests_seen.append(str(request.url))
+        return httpx.Response(200, content=payload)
+    return ImageIngestor(http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)), **kwargs)
+
+def test_image_is_downscaled_grayscaled_and_encoded():
+    """Test that a large photo becomes a compact grayscale JPEG data URL"""
+    payload = make_jpeg(4000, 3000)
+    ingestor = make_ingestor(payload, [], max_side=1024, grayscale=True)
+    
+    image = asyncio.run(ingestor.prepare("https://example.com/photo.jpg"))
+    
+    assert (image.width, image.height) == (1024, 768)
+    assert (image.original_width, image.original_height) == (4000, 3000)
+    assert image.payload_bytes < image.original_bytes
+    assert image.data_url.startswith("data:image/jpeg;base64,")
+    decoded = Image.open(BytesIO(base64.b64decode(image.data_url.split(",", 1)[1])))
+    assert decoded.mode == "L"
+
+def test_exif_orientation_is_normalized():
+    """Test that a rotated phone photo is turned upright before downscaling"""
+    ingestor = make_ingestor(make_jpeg(400, 200, orientation=6), [], max_side=1024)
+    image = asyncio.run(ingestor.prepare("https://example.com/rotated.jpg"))
+    assert (image.width, image.height) == (200, 400)
+
+def test_image_fetched_once_for_concurrent_and_repeat_calls():
+    """Test that the OCR and diagram calls share one download"""
+    seen = []
+    ingestor = make_ingestor(make_jpeg(800, 600), seen)
+    
+    async def main():
+        await asyncio.gather(*(ingestor.prepare("https://example.com/q.jpg") for _ in range(3)))
+        await ingestor.prepare("https://example.com/q.jpg")
+    asyncio.run(main())
+    
+    assert seen == ["https://example.com/q.jpg"]
+
+def test_ocr_sends_prepared_payload(monkeypatch):
+    """Test that OCR sends the downscaled data URL instead of the remote URL"""
+    monkeypatch.setattr("src.upstream.OPENAI_API_KEY", "test-key")
+    seen = []
+    ocr = OCRProcessor(mode="separate", cache=OCRCache(db_path=None), preprocess=True,
+                       images=make_ingestor(make_jpeg(800, 600), seen))
+    sent = []
+    
+    async def fake_extract(image_url):
+        sent.append(image_url)
+        return ["x = 3"]
+    
+    async def fake_detect(image_url):
+        sent.append(image_url)
+        return False
+    ocr._extract_text = fake_extract
+    ocr._detect_diagram = fake_detect
+    
+    async def main():
+        return await asyncio.gather(
+            ocr.extract_text_from_url("https://example.com/q.jpg"),
+            ocr.has_diagram("https://example.com/q.jpg")
+        )
+    
+    assert asyncio.run(main()) == [["x = 3"], False]
+    assert len(seen) == 1
+    assert all(url.startswith("data:image/jpeg;base64,") for url in sent)
+
+def test_ocr_falls_back_to_remote_url_when_fetch_fails(monkeypatch):
+    """Test that an unreachable image is still sent to the vision model by URL"""
+    monkeypatch.setattr("src.upstream.OPENAI_API_KEY", "test-key")
+    ingestor = ImageIngestor(http_client=httpx.AsyncClient(
+        transport=httpx.MockTransport(lambda request: httpx.Response(403))
+    ))
+    ocr = OCRProcessor(mode="separate", cache=OCRCache(db_path=None), preprocess=True, images=ingestor)
+    sent = []
+    
+    async def fake_extract(image_url):
+        sent.append(image_url)
+        return ["x = 3"]
+    ocr._extract_text = fake_extract
+    
+    assert asyncio.run(ocr.extract_text_from_url("https://example.com/q.jpg")) == ["x = 3"]
+    assert sent == ["https://example.com/q.jpg"]
+
+def test_crop_applied_before_downscale():
+    """Test that a crop box selects the region in original-image pixels"""
+    ingestor = make_ingestor(make_jpeg(4000, 3000), [], max_side=1024)
+    image = asyncio.run(ingestor.prepare("https://example.com/page.jpg", crop=(-50, 100, 900, 500)))
+    
+    assert (image.width, image.height) == (900, 400)
+    assert (image.original_width, image.original_height) == (4000, 3000)
+
+def test_crop_outside_image_is_rejected():
+    """Test that a bounding box that misses the image raises"""
+    ingestor = make_ingestor(make_jpeg(400, 300), [])
+    with pytest.raises(ValueError):
+        asyncio.run(ingestor.prepare("https://example.com/page.jpg", crop=(500, 500, 600, 600)))
@@ -0,0 +1,155 @@
+import pytest
+import asyncio
+import tempfile
+import shutil
+from src.jobs import JobQueue, JobQueueFull
+from src.models import DetectErrorRequest, DetectErrorResponse, BoundingBox
+from src.storage import SimpleStorage
+from src.admission import AdmissionController
+
+class FakeDetector:
+    def __init__(self, storage, delay: float = 0.01, fail: bool = False, fallback: bool = False):
+        self.storage = storage
+        self.delay = delay
+        self.fail = fail
+        self.fallback = fallback
+    
+    async def detect_error(self, request, job_id=None, deadline=None):
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("upstream down")
+        if self.fallback:
+            # What ErrorDetector returns when processing raised
+            return DetectErrorResponse(
+                job_id=job_id, y=40.0, error="Processing error occurred", correction="Please try again",
+                hint="Check your input and try again", solution_complete=False, contains_diagram=False,
+                question_has_diagram=False, solution_has_diagram=False, llm_used=False
+            )
+        response = DetectErrorResponse(
+            job_id=job_id, y=50.0, error="No error found", correction="", hint="",
+            solution_complete=True, contains_diagram=False, question_has_diagram=False,
+            solution_has_diagram=False, llm_used=True
+        )
+        self.storage.save_request_response(job_id, request.dict(), response.dict())
+        return response
+
+@pytest.fixture
+def storage():
+    temp_dir = tempfile.mkdtemp()
+    yield SimpleStorage(temp_dir)
+    shutil.rmtree(temp_dir)
+
+@pytest.fixture
+def request_data():
+    return DetectErrorRequest(
+        question_url="https://example.com/q.png",
+        solution_url="https://example.com/s.png",
+        bounding_box=BoundingBox(minX=0, maxX=100, minY=40, maxY=60)
+    )
+
+def test_jobs_are_processed_by_workers(storage, request_data):
+    """Test that submitted jobs complete in the background"""
+    queue = JobQueue(FakeDetector(storage), workers=2)
+    
+    async def main():
+        await queue.start()
+        job_ids = [queue.submit(request_data) for _ in range(5)]
+        assert all(queue.get_status(job_id)["status"] == "queued" for job_id in job_ids)
+        await queue.queue.join()
+        await queue.stop()
+        return job_ids
+    
+    job_ids = asyncio.run(main())
+    for job_id in job_ids:
+        status = queue.get_status(job_id)
+        assert status["status"] == "completed"
+        assert status["response"]["job_id"] == job_id
+
+def test_failed_and_timed_out_jobs(storage, request_data):
+    """Test that failures and timeouts are reported on the job"""
+    failing = JobQueue(FakeDetector(storage, fail=True), workers=1)
+    slow = JobQueue(FakeDetector(storage, delay=0.5), workers=1, timeout=0.05)
+    fallback = JobQueue(FakeDetector(storage, fallback=True), workers=1)
+    
+    async def main():
+        results = []
+        for queue in (failing, slow, fallback):
+            await queue.start()
+            job_id = queue.submit(request_data)
+            await queue.queue.join()
+            await queue.stop()
+            results.append(queue.get_status(job_id))
+        return results
+    
+    failed, timed_out, fell_back = asyncio.run(main())
+    assert failed["status"] == "failed"
+    assert "upstream down" in failed["error"]
+    assert timed_out["error"] == "Request timeout"
+    assert fell_back["status"] == "failed"
+    assert fell_back["response"]["llm_used"] is False
+
+def test_failed_jobs_stay_failed_after_restart(storage, request_data):
+    """Test that fallback and timed-out jobs are still reported as failed once no longer held in memory"""
+    fallback = JobQueue(FakeDetector(storage, fallback=True), workers=1)
+    slow = JobQueue(FakeDetector(storage, delay=0.5), workers=1, timeout=0.05)
+    
+    async def main():
+        job_ids = []
+        for queue in (fallback, slow):
+            await queue.start()
+            job_ids.append(queue.submit(request_data))
+            await queue.queue.join()
+            await queue.stop()
+        return job_ids
+    
+    fell_back_id, timed_out_id = asyncio.run(main())
+    restarted = JobQueue(FakeDetector(storage), workers=0)
+    fell_back = restarted.get_status(fell_back_id)
+    timed_out = restarted.get_status(timed_out_id)
+    
+    assert fell_back["status"] == "failed"
+    assert fell_back["response"]["llm_used"] is False
+    assert timed_out == {"job_id": timed_out_id, "status": "failed", "error": "Request timeout"}
+    
+    storage.save_request_response("legacy-fallback", {}, {"job_id": "legacy-fallback", "llm_used": False,
+                                                          "error": "Processing error occurred"})
+    assert restarted.get_status("legacy-fallback")["status"] == "failed"
+
+def test_job_workers_hold_admission_slots(storage, request_data):
+    """Test that background jobs count against the admission limit like interactive requests"""
+    admission = AdmissionController(initial_limit=1, min_limit=1, max_limit=1)
+    queue = JobQueue(FakeDetector(storage, delay=0.02), workers=3, admission=admission)
+    peak = []
+    detect_error = queue.detector.detect_error
+    
+    async def tracked(*args, **kwargs):
+        peak.append(admission.in_flight)
+        return await detect_error(*args, **kwargs)
+    queue.detector.detect_error = tracked
+    
+    async def main():
+        await queue.start()
+        job_ids = [queue.submit(request_data, tenant=f"user:u{i}") for i in range(3)]
+        await queue.queue.join()
+        await queue.stop()
+        return job_ids
+    job_ids = asyncio.run(main())
+    
+    assert all(queue.get_status(job_id)["status"] == "completed" for job_id in job_ids)
+    assert peak == [1, 1, 1]
+    assert admission.stats["admitted"] == 3
+
+def test_queue_bound_and_storage_fallback(storage, request_data):
+    """Test the queue limit and status lookup for jobs no longer held in memory"""
+    queue = JobQueue(FakeDetector(storage), workers=0, max_queue=1)
+    
+    async def main():
+        await queue.start()
+        queue.submit(request_data)
+        with pytest.raises(JobQueueFull):
+            queue.submit(request_data)
+    asyncio.run(main())
+    
+    storage.save_request_response("old-job", {}, {"job_id": "old-job"})
+    assert queue.get_status("old-job")["status"] == "completed"
+    assert queue.get_status("unknown") is None
@@ -0,0 +1,53 @@
+import pytest
+import json
+import logging
+import threading
+from src import logging as structured_logging
+from src.logging import StructuredLogger, JSONFormatter
+
+@pytest.fixture
+def captured(monkeypatch):
+    """Capture formatted records and the thread that formatted them"""
+    records = []
+    
+    class Capture(logging.Handler):
+        def emit(self, record):
+            records.append((json.loads(JSONFormatter().format(record)), threading.current_thread()))
+    
+    handler = Capture()
+    monkeypatch.setattr(structured_logging._listener, "handlers", (handler,))
+    return records
+
+def test_errors_are_kept_when_successes_are_sampled_out(captured):
+    """Test that sampling drops successful events but never errors or failures"""
+    logger = StructuredLogger(sample_rate=0.0)
+    
+    logger.log_request("job-1", {"question_url": "q"})
+    logger.log_response("job-1", 0.5, True)
+    logger.log_response("job-2", 0.5, False)
+    logger.log_error("job-2", "boom")
+    structured_logging.flush()
+    
+    events = [(event["event"], event["job_id"]) for event, _ in captured]
+    assert events == [("request_completed", "job-2"), ("error", "job-2")]
+
+def test_sampling_is_consistent_per_job():
+    """Test that a job's request and response are sampled together"""
+    logger = StructuredLogger(sample_rate=0.5)
+    decisions = [logger._sampled(f"job-{i}") for i in range(1000)]
+    
+    assert decisions == [logger._sampled(f"job-{i}") for i in range(1000)]
+    assert 350 < sum(decisions) < 650
+
+def test_records_are_formatted_off_the_caller_thread(captured):
+    """Test that encoding happens on the listener thread"""
+    logger = StructuredLogger(sample_rate=1.0)
+    
+    logger.log_request("job-3", {"question_url": "q"})
+    structured_logging.flush()
+    
+    event, thread = captured[0]
+    assert event["event"] == "request_received"
+    assert event["request_size"] == len(str({"question_url": "q"}))
+    assert "timestamp" in event
+    assert thread is not threading.current_thread()
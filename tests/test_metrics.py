@@ -57,4 +57,30 @@ def test_metrics_calculator():
     
     percentiles = calc.get_latency_percentiles()
     assert percentiles["p50"] > 0
-    assert percentiles["p95"] > 0
\ No newline at end of file
+    assert percentiles["p95"] > 0
+
+def test_metrics_calculator_interpolates_percentiles():
+    """Test that p95 of a few samples is interpolated rather than the max"""
+    calc = MetricsCalculator()
+    for latency in (1.0, 1.5, 2.0, 3.0):
+        calc.record_request(latency, True)
+    
+    percentiles = calc.get_latency_percentiles()
+    assert percentiles["p50"] == pytest.approx(1.75, rel=0.01)
+    assert percentiles["p95"] == pytest.approx(2.85, rel=0.01)
+    assert percentiles["p95"] < 3.0
+
+def test_metrics_calculator_merge():
+    """Test combining results recorded by separate workers"""
+    first, second = MetricsCalculator(), MetricsCalculator()
+    first.record_request(1.0, True)
+    second.record_request(3.0, False, "timeout")
+    second.record_request(2.0, False, "timeout")
+    
+    first.merge(second)
+    summary = first.get_summary()
+    assert summary["total_requests"] == 3
+    assert summary["error_count"] == 2
+    assert summary["unique_errors"] == 1
+    assert summary["latency_p50"] == pytest.approx(2.0, rel=0.01)
+    assert summary["avg_latency"] == pytest.approx(2.0)
@@ -0,0 +1,78 @@
+import pytest
+import asyncio
+import random
+import httpx
+import openai
+from src.governor import UpstreamGovernor
+from src.llm import LLMAnalyzer
+from src.mock_upstream import MockUpstream, create_app, parse_latency, call_kind
+from src.upstream import UpstreamClient
+
+def make_client(upstream: MockUpstream, governor: UpstreamGovernor = None) -> UpstreamClient:
+    client = UpstreamClient(use_sync=False, governor=governor or UpstreamGovernor())
+    http_client = httpx.AsyncClient(transport=httpx.ASGITransport(app=create_app(upstream)))
+    client.client = openai.AsyncOpenAI(api_key="test-key", base_url="http://mock/v1", max_retries=0, http_client=http_client)
+    return client
+
+def test_latency_specs():
+    """Test that latency specs sample from the configured distribution and bad specs are rejected"""
+    rng = random.Random(1)
+    assert parse_latency("fixed:0.25")(rng) == 0.25
+    assert all(0.1 <= parse_latency("uniform:0.1:0.2")(rng) <= 0.2 for _ in range(100))
+    samples = sorted(parse_latency("lognormal:1.0:0.5")(rng) for _ in range(1001))
+    assert 0.8 < samples[500] < 1.25
+    for spec in ("fixed", "uniform:1", "lognormal:0:1", "gamma:1:2", "fixed:fast"):
+        with pytest.raises(ValueError):
+            parse_latency(spec)
+
+def test_call_kinds_match_pipeline_requests():
+    """Test that OCR, diagram, fused and analysis requests are told apart"""
+    image = {"type": "image_url", "image_url": {"url": "http://mock/images/q.jpg"}}
+    def vision(text, **extra):
+        return {"messages": [{"role": "user", "content": [{"type": "text", "text": text}, image]}], **extra}
+    
+    assert call_kind(vision("Extract all mathematical text and equations from this image.")) == "ocr"
+    assert call_kind(vision("Answer only 'yes' or 'no'.")) == "diagram"
+    assert call_kind(vision("Return JSON", response_format={"type": "json_object"})) == "fused"
+    assert call_kind({"messages": [{"role": "user", "content": "Question: 2x + 3 = 11"}]}) == "analysis"
+
+def test_analysis_runs_against_mock_upstream():
+    """Test that the real analyzer code path completes on the first cascade tier against the mock"""
+    upstream = MockUpstream(seed=1)
+    analyzer = LLMAnalyzer()
+    analyzer.client = analyzer.cascade.client = make_client(upstream)
+    
+    result = asyncio.run(analyzer.analyze_error("2x + 3 = 11", "2x = 8\nx = 4", {"minY": 10, "maxY": 30}))
+    
+    assert result["solution_complete"] is True
+    assert analyzer.cascade.stats["escalations"] == 0
+    assert upstream.stats["calls"] == {"analysis": 1}
+    assert analyzer.client.usage["completion_tokens"] > 0
+
+def test_injected_rate_limits_are_retried_with_retry_after():
+    """Test that injected 429s carry Retry-After and go through the governor's retries"""
+    upstream = MockUpstream(failures={429: 1.0}, retry_after=0)
+    governor = UpstreamGovernor(max_retries=2, base_delay=0)
+    client = make_client(upstream, governor)
+    
+    with pytest.raises(openai.RateLimitError) as error:
+        asyncio.run(client.create_chat_completion(model="gpt-4", messages=[{"role": "user", "content": "hi"}]))
+    
+    assert error.value.response.headers["retry-after"] == "0"
+    assert upstream.stats["injected"] == {429: 3}
+    assert governor.stats["retries"] == 2
+
+def test_streamed_reply_yields_deltas_and_usage():
+    """Test that streaming returns the canned reply in chunks with final-chunk usage"""
+    upstream = MockUpstream(responses={"analysis": "ERROR: sign flipped in line 2"}, token_latency=0.001)
+    client = make_client(upstream)
+    
+    async def collect():
+        return [delta async for delta in client.stream_chat_completion(model="gpt-4", messages=[{"role": "user", "content": "hi"}])]
+    
+    deltas = asyncio.run(collect())
+    
+    assert len(deltas) > 1
+    assert "".join(deltas) == "ERROR: sign flipped in line 2"
+    assert client.usage["completion_tokens"] == len("ERROR: sign flipped in line 2") // 4
+    assert upstream.stats["streamed"] == 1
@@ -0,0 +1,94 @@
+import pytest
+import asyncio
+from src.ocr import OCRProcessor
+from src.cache import OCRCache
+
+@pytest.fixture
+def ocr(monkeypatch):
+    monkeypatch.setattr("src.upstream.OPENAI_API_KEY", "test-key")
+    return OCRProcessor(mode="fused", cache=OCRCache(db_path=None), preprocess=False)
+
+def test_parse_fused_response(ocr):
+    """Test parsing the structured single-call vision payload"""
+    lines, has_diagram = ocr._parse_fused('{"lines": ["x + 2 = 5", " ", "x = 3"], "has_diagram": true}')
+    assert lines == ["x + 2 = 5", "x = 3"]
+    assert has_diagram is True
+
+def test_parse_fused_response_malformed(ocr):
+    """Test that a non-JSON payload degrades to plain OCR lines"""
+    lines, has_diagram = ocr._parse_fused("x + 2 = 5\nx = 3")
+    assert lines == ["x + 2 = 5", "x = 3"]
+    assert has_diagram is False
+
+def test_unknown_mode_rejected(monkeypatch):
+    """Test that only the supported OCR modes are accepted"""
+    monkeypatch.setattr("src.upstream.OPENAI_API_KEY", "test-key")
+    with pytest.raises(ValueError):
+        OCRProcessor(mode="triple")
+
+def test_results_are_cached(monkeypatch):
+    """Test that repeated OCR of the same image reuses the cached result"""
+    monkeypatch.setattr("src.upstream.OPENAI_API_KEY", "test-key")
+    ocr = OCRProcessor(mode="separate", cache=OCRCache(db_path=None), preprocess=False)
+    calls = []
+    
+    async def fake_extract(image_url):
+        calls.append(image_url)
+        return ["x = 3"]
+    ocr._extract_text = fake_extract
+    
+    assert asyncio.run(ocr.extract_text_from_url("https://example.com/q.png")) == ["x = 3"]
+    assert asyncio.run(ocr.extract_text_from_url("https://example.com/q.png")) == ["x = 3"]
+    assert calls == ["https://example.com/q.png"]
+
+def test_cache_can_be_turned_off(monkeypatch):
+    """Test that cache=False skips the configured default cache and calls upstream every time"""
+    monkeypatch.setattr("src.upstream.OPENAI_API_KEY", "test-key")
+    ocr = OCRProcessor(mode="separate", cache=False, preprocess=False)
+    assert ocr.cache is None
+    calls = []
+    
+    async def fake_extract(image_url):
+        calls.append(image_url)
+        return ["x = 3"]
+    ocr._extract_text = fake_extract
+    
+    asyncio.run(ocr.extract_text_from_url("https://example.com/q.png"))
+    asyncio.run(ocr.extract_text_from_url("https://example.com/q.png"))
+    assert len(calls) == 2
+
+def test_failures_are_not_cached(monkeypatch):
+    """Test that an upstream failure is retried on the next request"""
+    monkeypatch.setattr("src.upstream.OPENAI_API_KEY", "test-key")
+    ocr = OCRProcessor(mode="separate", cache=OCRCache(db_path=None), preprocess=False)
+    calls = []
+    
+    async def flaky_detect(image_url):
+        calls.append(image_url)
+        if len(calls) == 1:
+            raise RuntimeError("rate limited")
+        return True
+    ocr._detect_diagram = flaky_detect
+    
+    assert asyncio.run(ocr.has_diagram("https://example.com/q.png")) is False
+    assert asyncio.run(ocr.has_diagram("https://example.com/q.png")) is True
+    assert len(calls) == 2
+
+def test_concurrent_requests_for_same_image_are_coalesced(monkeypatch):
+    """Test that simultaneous OCR of one image issues a single upstream call"""
+    monkeypatch.setattr("src.upstream.OPENAI_API_KEY", "test-key")
+    ocr = OCRProcessor(mode="separate", cache=OCRCache(db_path=None), preprocess=False)
+    calls = []
+    
+    async def slow_extract(image_url):
+        calls.append(image_url)
+        await asyncio.sleep(0.05)
+        return ["x = 3"]
+    ocr._extract_text = slow_extract
+    
+    async def main():
+        return await asyncio.gather(*(ocr.extract_text_from_url("https://example.com/q.png") for _ in range(5)))
+    
+    assert asyncio.run(main()) == [["x = 3"]] * 5
+    assert len(calls) == 1
+    assert ocr.inflight.get_stats()["coalesced"] == 4
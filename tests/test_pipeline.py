@@ -0,0 +1,96 @@
+import pytest
+import asyncio
+import time
+from src.pipeline import Stage, StagePipeline
+
+def test_independent_stages_run_concurrently():
+    """Test that stages without dependencies are fanned out together"""
+    async def slow(value):
+        await asyncio.sleep(0.1)
+        return value
+    
+    pipeline = StagePipeline([
+        Stage("a", lambda _: slow(1)),
+        Stage("b", lambda _: slow(2)),
+        Stage("c", lambda _: slow(3)),
+        Stage("sum", lambda r: slow(r["a"] + r["b"] + r["c"]), deps=("a", "b", "c")),
+    ])
+    
+    start = time.perf_counter()
+    run = asyncio.run(pipeline.run())
+    elapsed = time.perf_counter() - start
+    
+    assert run.results["sum"] == 6
+    assert elapsed < 0.35  # two sequential waves, not four
+
+def test_optional_stage_failure_is_isolated():
+    """Test that a failing optional stage yields its default to dependents"""
+    async def fail(_):
+        raise RuntimeError("upstream down")
+    
+    async def ok(_):
+        return ["line"]
+    
+    async def join(results):
+        return results["broken"] + results["fine"]
+    
+    errors = []
+    pipeline = StagePipeline([
+        Stage("broken", fail, default=[]),
+        Stage("fine", ok, default=[]),
+        Stage("joined", join, deps=("broken", "fine")),
+    ])
+    run = asyncio.run(pipeline.run(on_error=lambda stage, e: errors.append(stage)))
+    
+    assert run.results["joined"] == ["line"]
+    assert "broken" in run.errors
+    assert errors == ["broken"]
+
+def test_required_stage_failure_raises():
+    """Test that a failing required stage propagates"""
+    async def fail(_):
+        raise RuntimeError("boom")
+    
+    pipeline = StagePipeline([Stage("required", fail)])
+    with pytest.raises(RuntimeError):
+        asyncio.run(pipeline.run())
+
+def test_invalid_graphs_are_rejected():
+    """Test unknown dependencies and cycles"""
+    async def noop(_):
+        return None
+    
+    with pytest.raises(ValueError):
+        StagePipeline([Stage("a", noop, deps=("missing",))])
+    with pytest.raises(ValueError):
+        StagePipeline([Stage("a", noop, deps=("b",)), Stage("b", noop, deps=("a",))])
+
+def test_deadline_skips_and_cuts_off_stages():
+    """Test that a deadline skips low-budget optional stages and cancels slow ones"""
+    from src.deadline import Deadline, DeadlineExceeded
+    calls = []
+    
+    async def slow(name):
+        calls.append(name)
+        await asyncio.sleep(1)
+        return "late"
+    
+    async def fast(_):
+        return "ok"
+    
+    pipeline = StagePipeline([
+        Stage("skipped", lambda _: slow("skipped"), default="default", min_budget=10),
+        Stage("cut_off", lambda _: slow("cut_off"), default="default"),
+        Stage("fast", fast),
+    ])
+    run = asyncio.run(pipeline.run(deadline=Deadline(0.05)))
+    
+    assert run.skipped == ["skipped"]
+    assert calls == ["cut_off"]
+    assert run.results == {"skipped": "default", "cut_off": "default", "fast": "ok"}
+    assert isinstance(run.errors["cut_off"], DeadlineExceeded)
+    
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(StagePipeline([Stage("required", lambda _: slow("required"))]).run(deadline=Deadline(0.05)))
+    with pytest.raises(ValueError):
+        Stage("required", fast, min_budget=1)
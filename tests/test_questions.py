@@ -0,0 +1,42 @@
+import pytest
+import asyncio
+import os
+import tempfile
+import shutil
+from src.questions import QuestionIndex
+
+@pytest.fixture
+def index():
+    temp_dir = tempfile.mkdtemp()
+    yield QuestionIndex(os.path.join(temp_dir, "questions.sqlite3"))
+    shutil.rmtree(temp_dir)
+
+def test_put_and_get(index):
+    """Test storing and retrieving a prepared question"""
+    index.put("q1", "https://example.com/q1.png", ["Solve x + 2 = 5"], True)
+    entry = index.get("q1")
+    
+    assert entry["question_url"] == "https://example.com/q1.png"
+    assert entry["lines"] == ["Solve x + 2 = 5"]
+    assert entry["has_diagram"] is True
+    assert "prepared_at" in entry
+
+def test_get_missing(index):
+    """Test looking up a question that was never prepared"""
+    assert index.get("unknown") is None
+
+def test_stale_url_is_ignored(index):
+    """Test that an entry prepared for a different image is not reused"""
+    index.put("q1", "https://example.com/q1.png", ["Solve x + 2 = 5"], False)
+    assert index.get("q1", "https://example.com/q1.png") is not None
+    assert index.get("q1", "https://example.com/q1-v2.png") is None
+
+def test_async_store_and_lookup(index):
+    """Test the event-loop variants, which run SQLite on a worker thread"""
+    async def main():
+        await index.store("q1", "https://example.com/q1.png", ["Solve x + 2 = 5"], False)
+        return await index.lookup("q1", "https://example.com/q1.png"), await index.lookup("q1", "https://example.com/other.png")
+    
+    entry, stale = asyncio.run(main())
+    assert entry["lines"] == ["Solve x + 2 = 5"]
+    assert stale is None
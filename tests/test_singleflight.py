@@ -0,0 +1,100 @@
+import asyncio
+from src.singleflight import SingleFlight
+from src import deadline as deadlines
+from src.deadline import Deadline, DeadlineExceeded
+
+def test_concurrent_calls_are_coalesced():
+    """Test that concurrent callers with the same key share one execution"""
+    flight = SingleFlight()
+    executions = []
+    
+    async def upstream():
+        executions.append(1)
+        await asyncio.sleep(0.05)
+        return ["x = 3"]
+    
+    async def main():
+        return await asyncio.gather(*(flight.do("q1", upstream) for _ in range(10)))
+    
+    results = asyncio.run(main())
+    
+    assert results == [["x = 3"]] * 10
+    assert len(executions) == 1
+    stats = flight.get_stats()
+    assert stats["calls"] == 10
+    assert stats["coalesced"] == 9
+    assert stats["in_flight"] == 0
+
+def test_different_keys_are_not_coalesced():
+    """Test that distinct keys run independently"""
+    flight = SingleFlight()
+    
+    async def upstream(value):
+        await asyncio.sleep(0.01)
+        return value
+    
+    async def main():
+        return await asyncio.gather(flight.do("a", lambda: upstream(1)), flight.do("b", lambda: upstream(2)))
+    
+    assert asyncio.run(main()) == [1, 2]
+    assert flight.get_stats()["coalesced"] == 0
+
+def test_failures_are_shared_and_not_retained():
+    """Test that a failure reaches every waiter and the next call retries"""
+    flight = SingleFlight()
+    attempts = []
+    
+    async def flaky():
+        attempts.append(1)
+        await asyncio.sleep(0.01)
+        if len(attempts) == 1:
+            raise RuntimeError("rate limited")
+        return "ok"
+    
+    async def main():
+        return await asyncio.gather(flight.do("k", flaky), flight.do("k", flaky), return_exceptions=True)
+    
+    results = asyncio.run(main())
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert asyncio.run(flight.do("k", flaky)) == "ok"
+    assert len(attempts) == 2
+
+def test_cancelled_caller_does_not_cancel_shared_call():
+    """Test that cancelling the first caller leaves the shared call running for others"""
+    flight = SingleFlight()
+    
+    async def upstream():
+        await asyncio.sleep(0.05)
+        return "done"
+    
+    async def main():
+        first = asyncio.create_task(flight.do("k", upstream))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(flight.do("k", upstream))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await second
+    
+    assert asyncio.run(main()) == "done"
+
+def test_callers_keep_their_own_deadlines():
+    """Test that a short-deadline leader neither fails a patient follower nor passes it its budget"""
+    flight = SingleFlight()
+    seen = []
+    
+    async def upstream():
+        seen.append(deadlines.current())
+        await asyncio.sleep(0.1)
+        return "done"
+    
+    async def call(timeout):
+        with deadlines.scope(Deadline(timeout)):
+            return await flight.do("k", upstream)
+    
+    async def main():
+        return await asyncio.gather(call(0.02), call(5.0), return_exceptions=True)
+    
+    leader, follower = asyncio.run(main())
+    assert isinstance(leader, DeadlineExceeded)
+    assert follower == "done"
+    assert seen == [None]
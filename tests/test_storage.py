@@ -10,6 +10,7 @@ def temp_storage():
     temp_dir = tempfile.mkdtemp()
     storage = SimpleStorage(temp_dir)
     yield storage
+    storage.close()
     shutil.rmtree(temp_dir)
 
 def test_save_and_retrieve_record(temp_storage):
@@ -47,4 +48,128 @@ def test_storage_directory_creation():
     assert os.path.exists(storage_path)
     
     # Cleanup
-    shutil.rmtree(temp_dir)
\ No newline at end of file
+    shutil.rmtree(temp_dir)
+
+def test_records_persist_across_instances(temp_storage):
+    """Test that flushed records are read back by a fresh storage instance"""
+    for i in range(50):
+        temp_storage.save_request_response(f"job-{i}", {"i": i}, {"ok": True})
+    temp_storage.flush()
+    
+    reopened = SimpleStorage(temp_storage.storage_dir)
+    assert reopened.get_record("job-42")["request"] == {"i": 42}
+    assert reopened.get_record("job-0")["response"] == {"ok": True}
+    reopened.close()
+
+def test_records_are_batched_into_one_database(temp_storage):
+    """Test that records go to the audit database rather than one file per job"""
+    for i in range(10):
+        temp_storage.save_request_response(f"job-{i}", {}, {})
+    temp_storage.flush()
+    
+    assert os.listdir(temp_storage.storage_dir) != []
+    assert not any(name.endswith(".json") for name in os.listdir(temp_storage.storage_dir))
+    assert temp_storage._pending == {}
+
+def test_legacy_json_records_are_readable(temp_storage):
+    """Test that per-job JSON files from the old storage format still load"""
+    import json
+    with open(os.path.join(temp_storage.storage_dir, "legacy-job.json"), "w") as f:
+        json.dump({"job_id": "legacy-job", "request": {}, "response": {}}, f)
+    
+    assert temp_storage.get_record("legacy-job")["job_id"] == "legacy-job"
+
+def test_failed_writes_are_retried_then_dropped(temp_storage):
+    """Test that a failed batch is retried, and records that never write do not pile up in memory"""
+    import sqlite3
+    write_batch = temp_storage._write_batch
+    failures = iter([True])
+    
+    def flaky(db, batch):
+        if next(failures, False):
+            raise sqlite3.OperationalError("disk I/O error")
+        write_batch(db, batch)
+    temp_storage._write_batch = flaky
+    temp_storage.save_request_response("retried", {}, {})
+    temp_storage.flush()
+    reopened = SimpleStorage(temp_storage.storage_dir)
+    assert reopened.get_record("retried")["job_id"] == "retried"
+    reopened.close()
+    
+    def broken(db, batch):
+        raise sqlite3.OperationalError("disk is full")
+    temp_storage._write_batch = broken
+    temp_storage.save_request_response("lost", {}, {})
+    temp_storage.flush()
+    assert temp_storage.get_record("lost") == {}
+    assert temp_storage._pending == {}
+
+def save(storage, job_id, timestamp, user_id=None, question_id=None):
+    storage.save_request_response(job_id, {"user_id": user_id, "question_id": question_id}, {}, timestamp=timestamp)
+    storage.flush()
+
+def test_scans_by_key_and_time_range(temp_storage):
+    """Test indexed per-key and time-range iteration"""
+    save(temp_storage, "a", "2024-01-01T10:00:00", user_id="u1", question_id="q1")
+    save(temp_storage, "b", "2024-01-02T10:00:00", user_id="u2", question_id="q1")
+    save(temp_storage, "c", "2024-01-03T10:00:00", user_id="u1", question_id="q2")
+    
+    assert [r["job_id"] for r in temp_storage.iter_by("user_id", "u1")] == ["a", "c"]
+    assert [r["job_id"] for r in temp_storage.iter_by("question_id", "q1", start="2024-01-02")] == ["b"]
+    assert [r["job_id"] for r in temp_storage.iter_records("2024-01-01T12:00:00", "2024-01-03")] == ["b"]
+    with pytest.raises(ValueError):
+        list(temp_storage.iter_by("error", "x"))
+
+def test_delete_by_user(temp_storage):
+    """Test erasing every record for one user"""
+    save(temp_storage, "a", "2024-01-01T10:00:00", user_id="u1")
+    save(temp_storage, "b", "2024-01-02T10:00:00", user_id="u2")
+    
+    assert temp_storage.delete_by("user_id", "u1") == 1
+    assert temp_storage.get_record("a") == {}
+    assert temp_storage.get_record("b")["job_id"] == "b"
+
+def test_delete_by_user_erases_legacy_files(temp_storage):
+    """Test that erasure also covers records still in per-job JSON files"""
+    import json
+    legacy = {"job_id": "legacy", "timestamp": "2023-06-01T10:00:00", "request": {"user_id": "u1"}, "response": {}}
+    with open(os.path.join(temp_storage.storage_dir, "legacy.json"), "w") as f:
+        json.dump(legacy, f)
+    save(temp_storage, "a", "2024-01-01T10:00:00", user_id="u1")
+    
+    assert temp_storage.delete_by("user_id", "u1") == 2
+    assert temp_storage.get_record("legacy") == {}
+    assert not os.path.exists(os.path.join(temp_storage.storage_dir, "legacy.json"))
+
+def test_compact_expires_old_records_and_merges_legacy_files(temp_storage):
+    """Test retention and folding per-job JSON files into the audit log"""
+    import json
+    from datetime import datetime
+    save(temp_storage, "old", "2000-01-01T00:00:00")
+    save(temp_storage, "new", datetime.utcnow().isoformat())
+    legacy = {"job_id": "legacy", "timestamp": datetime.utcnow().isoformat(), "request": {"user_id": "u9"}, "response": {}}
+    with open(os.path.join(temp_storage.storage_dir, "legacy.json"), "w") as f:
+        json.dump(legacy, f)
+    
+    assert temp_storage.compact(retention_days=30) == {"imported": 1, "expired": 1}
+    assert temp_storage.get_record("old") == {}
+    assert temp_storage.get_record("new")["job_id"] == "new"
+    assert [r["job_id"] for r in temp_storage.iter_by("user_id", "u9")] == ["legacy"]
+    assert not os.path.exists(os.path.join(temp_storage.storage_dir, "legacy.json"))
+
+def test_existing_audit_log_gains_indexes():
+    """Test that an audit log without index columns is migrated and backfilled"""
+    import json
+    import sqlite3
+    temp_dir = tempfile.mkdtemp()
+    db = sqlite3.connect(os.path.join(temp_dir, "audit.sqlite3"))
+    db.execute("CREATE TABLE audit (job_id TEXT PRIMARY KEY, timestamp TEXT NOT NULL, record TEXT NOT NULL)")
+    record = {"job_id": "a", "timestamp": "2024-01-01T00:00:00", "request": {"user_id": "u1"}, "response": {}}
+    db.execute("INSERT INTO audit VALUES (?, ?, ?)", ("a", record["timestamp"], json.dumps(record)))
+    db.commit()
+    db.close()
+    
+    storage = SimpleStorage(temp_dir)
+    assert [r["job_id"] for r in storage.iter_by("user_id", "u1")] == ["a"]
+    storage.close()
+    shutil.rmtree(temp_dir)
@@ -0,0 +1,54 @@
+import asyncio
+from src.telemetry import Telemetry, TrackedSemaphore, server_timing, span, start_request
+
+def test_histogram_renders_cumulative_buckets():
+    """Test Prometheus bucket, sum and count lines for a labelled histogram"""
+    telemetry = Telemetry()
+    for value in (0.003, 0.2, 0.2, 45.0, 120.0):
+        telemetry.observe("latency_seconds", value, stage="ocr")
+    
+    text = telemetry.render()
+    
+    assert "# TYPE latency_seconds histogram" in text
+    assert 'latency_seconds_bucket{stage="ocr",le="0.005"} 1' in text
+    assert 'latency_seconds_bucket{stage="ocr",le="0.25"} 3' in text
+    assert 'latency_seconds_bucket{stage="ocr",le="60.0"} 4' in text
+    assert 'latency_seconds_bucket{stage="ocr",le="+Inf"} 5' in text
+    assert 'latency_seconds_count{stage="ocr"} 5' in text
+
+def test_spans_collect_request_timings():
+    """Test that spans in child tasks land in the request's timings"""
+    async def main():
+        timings = start_request()
+        
+        async def stage(name):
+            with span(name):
+                await asyncio.sleep(0.01)
+        
+        await asyncio.gather(asyncio.create_task(stage("question_ocr")), asyncio.create_task(stage("solution_ocr")))
+        return timings
+    
+    timings = asyncio.run(main())
+    
+    assert set(timings) == {"question_ocr", "solution_ocr"}
+    assert all(seconds >= 0.01 for seconds in timings.values())
+    assert server_timing({"ocr": 0.0123}) == "ocr;dur=12.3"
+
+def test_tracked_semaphore_reports_waiters():
+    """Test that queued acquirers show up as waiting"""
+    async def main():
+        semaphore = TrackedSemaphore("test", 1)
+        release = asyncio.Event()
+        
+        async def hold():
+            async with semaphore:
+                await release.wait()
+        
+        tasks = [asyncio.create_task(hold()) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        observed = (semaphore.in_use, semaphore.waiting)
+        release.set()
+        await asyncio.gather(*tasks)
+        return observed, (semaphore.in_use, semaphore.waiting)
+    
+    assert asyncio.run(main()) == ((1, 2), (0, 0))
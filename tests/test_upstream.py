@@ -0,0 +1,112 @@
+import pytest
+import asyncio
+import threading
+from types import SimpleNamespace
+from src.upstream import UpstreamClient
+
+class FakeCompletions:
+    def __init__(self, is_async: bool):
+        self.is_async = is_async
+        self.calls = []
+    
+    def _record(self, kwargs):
+        self.calls.append((kwargs, threading.current_thread()))
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="ok"))])
+    
+    def create(self, **kwargs):
+        if self.is_async:
+            async def _create():
+                return self._record(kwargs)
+            return _create()
+        return self._record(kwargs)
+
+def make_client(monkeypatch, use_sync: bool):
+    monkeypatch.setattr("src.upstream.OPENAI_API_KEY", "test-key")
+    client = UpstreamClient(use_sync=use_sync)
+    completions = FakeCompletions(is_async=not use_sync)
+    client.client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    return client, completions
+
+def test_async_client_is_default(monkeypatch):
+    """Test that the non-blocking client is used unless the fallback is requested"""
+    monkeypatch.setattr("src.upstream.OPENAI_API_KEY", "test-key")
+    import openai
+    assert isinstance(UpstreamClient(use_sync=False).client, openai.AsyncOpenAI)
+    assert isinstance(UpstreamClient(use_sync=True).client, openai.OpenAI)
+
+def test_async_path_runs_on_event_loop(monkeypatch):
+    """Test that async completions are awaited directly"""
+    client, completions = make_client(monkeypatch, use_sync=False)
+    response = asyncio.run(client.create_chat_completion(model="gpt-4", messages=[]))
+    
+    assert response.choices[0].message.content == "ok"
+    assert completions.calls[0][0]["model"] == "gpt-4"
+    assert completions.calls[0][1] is threading.main_thread()
+
+def test_sync_fallback_runs_off_event_loop(monkeypatch):
+    """Test that the blocking fallback is moved to a worker thread"""
+    client, completions = make_client(monkeypatch, use_sync=True)
+    response = asyncio.run(client.create_chat_completion(model="gpt-4", messages=[]))
+    
+    assert response.choices[0].message.content == "ok"
+    assert completions.calls[0][1] is not threading.main_thread()
+
+def test_stream_yields_deltas_and_records_usage(monkeypatch):
+    """Test that streamed completions yield content deltas and final-chunk usage"""
+    monkeypatch.setattr("src.upstream.OPENAI_API_KEY", "test-key")
+    client = UpstreamClient(use_sync=False)
+    
+    def chunk(content=None, usage=None):
+        choices = [SimpleNamespace(delta=SimpleNamespace(content=content))] if content is not None else []
+        return SimpleNamespace(choices=choices, usage=usage)
+    
+    async def stream():
+        for item in (chunk("ERROR: "), chunk("sign"), chunk(usage=SimpleNamespace(prompt_tokens=12, completion_tokens=3))):
+            yield item
+    
+    async def create(**kwargs):
+        assert kwargs["stream"] is True
+        return stream()
+    client.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    
+    async def collect():
+        return [delta async for delta in client.stream_chat_completion(model="gpt-4", messages=[])]
+    
+    assert asyncio.run(collect()) == ["ERROR: ", "sign"]
+    assert client.usage == {"calls": 1, "prompt_tokens": 12, "completion_tokens": 3}
+
+def test_usage_is_recorded_per_model(monkeypatch):
+    """Test that reported usage reaches the accounting ledgers under the requested model"""
+    from src.accounting import UsageLedger, track, stage
+    client, completions = make_client(monkeypatch, use_sync=False)
+    completions._record = lambda kwargs: SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content="ok"))],
+        usage=SimpleNamespace(prompt_tokens=120, completion_tokens=30)
+    )
+    ledger = UsageLedger()
+    
+    async def main():
+        with track(ledger), stage("analysis"):
+            await client.create_chat_completion(model="gpt-4", messages=[])
+    asyncio.run(main())
+    
+    assert ledger.to_dict()["by_stage"]["analysis"]["prompt_tokens"] == 120
+    assert ledger.to_dict()["by_model"]["gpt-4"]["completion_tokens"] == 30
+    assert client.usage == {"calls": 1, "prompt_tokens": 120, "completion_tokens": 30}
+
+def test_remaining_budget_bounds_upstream_calls(monkeypatch):
+    """Test that calls get the remaining deadline as their timeout and are not sent once it has passed"""
+    from src import deadline as deadlines
+    from src.deadline import Deadline, DeadlineExceeded
+    client, completions = make_client(monkeypatch, use_sync=False)
+    
+    async def main(budget):
+        with deadlines.scope(Deadline(budget)):
+            await client.create_chat_completion(model="gpt-4", messages=[])
+    
+    asyncio.run(main(5))
+    assert 0 < completions.calls[0][0]["timeout"] <= 5
+    
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(main(0))
+    assert len(completions.calls) == 1